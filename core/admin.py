@@ -3,8 +3,9 @@ from django.contrib import messages
 from django.urls import reverse
 from django.utils.html import format_html
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import Plugin, Service, Message, UserService, AuditLog, ServiceMessageTemplate, SystemMessageTemplate, User
+from .models import Plugin, Service, ServiceSyncState, Message, UserService, AuditLog, ServiceMessageTemplate, SystemMessageTemplate, User
 from .generate_models import generate_models_file
+from .pagination import EstimatedCountPaginator
 import logging
 
 # Define a new User admin
@@ -41,6 +42,19 @@ class ServiceAdmin(admin.ModelAdmin):
         except Exception as e:
             messages.error(request, f'Error generating models: {str(e)}')
 
+@admin.register(ServiceSyncState)
+class ServiceSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('service', 'folder', 'uidvalidity', 'last_uid', 'highest_modseq', 'last_full_sync_at', 'updated_at')
+    list_filter = ('service',)
+    actions = ['reset_checkpoints']
+
+    def reset_checkpoints(self, request, queryset):
+        for state in queryset:
+            state.reset()
+            state.save()
+        self.message_user(request, f"Reset {queryset.count()} sync checkpoints; the next poll will resync these folders")
+    reset_checkpoints.short_description = "Reset selected checkpoints (full resync)"
+
 @admin.register(Plugin)
 class PluginAdmin(admin.ModelAdmin):
     list_display = ('name', 'friendly_name', 'version', 'is_enabled', 'created_at', 'updated_at')
@@ -70,8 +84,25 @@ class PluginAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return False  # Plugins can only be removed through discovery
 
+@admin.register(Message)
+class MessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'service', 'direction', 'status', 'processing_step', 'subject', 'sender', 'created_at')
+    list_filter = ('direction', 'status', 'processing_step')
+    search_fields = ('raingull_id', 'service_message_id')
+    list_select_related = ('service__plugin',)
+    ordering = ('-created_at', '-id')
+    raw_id_fields = ('user', 'service', 'source_service')
+    # Payloads can be large; don't load them for the changelist, and don't count the whole table
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.defer('payload', 'attachments', 'step_processing_time')
+        return queryset
+
 # Register other models
-admin.site.register(Message)
 admin.site.register(UserService)
 admin.site.register(ServiceMessageTemplate)
 admin.site.register(SystemMessageTemplate)
@@ -81,4 +112,7 @@ class AuditLogAdmin(admin.ModelAdmin):
     list_display = ('event_type', 'status', 'created_at')
     list_filter = ('event_type', 'status', 'created_at')
     search_fields = ('details',)
-    readonly_fields = ('created_at',)
\ No newline at end of file
+    readonly_fields = ('created_at',)
+    ordering = ('-created_at', '-id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
\ No newline at end of file
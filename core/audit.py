@@ -0,0 +1,192 @@
+"""
+Buffered AuditLog writer.
+
+Writing one AuditLog row per event made audit inserts outnumber message
+writes under load. AuditSink collects events in memory instead and writes
+them with bulk_create from a background thread, once flush_events events are
+waiting or every flush_interval_ms, whichever comes first. The buffer is
+flushed at interpreter exit and on Celery worker shutdown.
+
+Events below the minimum level configured for their event_type are not
+recorded at all. If the buffer is full (e.g. the database is down), new
+events are dropped and counted rather than growing memory without bound.
+
+Like the connection pools, the sink is per process: a forked child starts with
+an empty buffer and its own flush thread.
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Level assumed for event types that don't say how severe they are
+EVENT_TYPE_LEVELS = {
+    'error': logging.ERROR,
+    'warning': logging.WARNING,
+}
+
+def audit_settings() -> Dict:
+    """Get the AUDIT_LOG settings with defaults filled in."""
+    return {
+        'buffered': True,
+        'flush_events': 100,
+        'flush_interval_ms': 1000,
+        'max_buffer': 10000,
+        'min_levels': {},
+        **getattr(settings, 'AUDIT_LOG', {})
+    }
+
+def parse_level(level) -> int:
+    """Turn a level name (e.g. "WARNING") or number into a logging level number."""
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    return value if isinstance(value, int) else logging.INFO
+
+class AuditSink:
+    """Collects audit events and writes them to AuditLog in batches."""
+    
+    def __init__(self, options: Optional[Dict] = None):
+        """Initialize the sink.
+        
+        Args:
+            options: Overrides for the AUDIT_LOG settings
+        """
+        options = {**audit_settings(), **(options or {})}
+        self.buffered = options['buffered']
+        self.flush_events = options['flush_events']
+        self.flush_interval = options['flush_interval_ms'] / 1000
+        self.max_buffer = options['max_buffer']
+        min_levels = {event_type: parse_level(level) for event_type, level in options['min_levels'].items()}
+        self.default_level = min_levels.pop('default', logging.INFO)
+        self.min_levels = min_levels
+        # Switched off while something shouldn't leave a trail, e.g. a benchmark run
+        self.enabled = True
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+    
+    def _reset(self) -> None:
+        """Start with an empty buffer and no flush thread, e.g. in a freshly forked child process."""
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._buffer: List = []
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {'recorded': 0, 'written': 0, 'filtered': 0, 'dropped': 0}
+    
+    def record(self, event_type: str, details: str, status: str = 'success', level=None) -> bool:
+        """Record an audit event.
+        
+        Args:
+            event_type: AuditLog event type (e.g. "outgoing_send" or "error")
+            details: Event description
+            status: AuditLog status
+            level: Severity as a logging level or level name, defaults to the
+                level implied by event_type (INFO for most)
+        
+        Returns:
+            bool: True if the event was kept, False if it was filtered or dropped
+        """
+        level = parse_level(level) if level is not None else EVENT_TYPE_LEVELS.get(event_type, logging.INFO)
+        if not self.enabled or level < self.min_levels.get(event_type, self.default_level):
+            with self._lock:
+                self.counters['filtered'] += 1
+            return False
+        
+        from core.models import AuditLog
+        entry = AuditLog(event_type=event_type, status=status, details=details, created_at=timezone.now())
+        if not self.buffered:
+            entry.save()
+            with self._lock:
+                self.counters['recorded'] += 1
+                self.counters['written'] += 1
+            return True
+        
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.counters['dropped'] += 1
+                if self.counters['dropped'] % 1000 == 1:
+                    logger.warning(f"Audit buffer full, dropped {self.counters['dropped']} events so far")
+                return False
+            self._buffer.append(entry)
+            self.counters['recorded'] += 1
+            pending = len(self._buffer)
+            if self._thread is None:
+                self._start_thread()
+        
+        if pending >= self.flush_events:
+            self._wake.set()
+        return True
+    
+    def flush(self) -> int:
+        """Write every buffered event now.
+        
+        Returns:
+            int: Number of events written
+        """
+        from core.models import AuditLog
+        with self._flush_lock:
+            with self._lock:
+                entries, self._buffer = self._buffer, []
+            if not entries:
+                return 0
+            try:
+                # All batches or none, so a retry doesn't write the first ones twice
+                with transaction.atomic():
+                    AuditLog.objects.bulk_create(entries, batch_size=500)
+            except Exception as e:
+                # Put the events back unless that would overflow the buffer
+                logger.error(f"Error writing {len(entries)} audit log entries: {str(e)}")
+                for entry in entries:
+                    # Batches that went through before the rollback set the ids (PostgreSQL)
+                    entry.pk = None
+                with self._lock:
+                    room = max(0, self.max_buffer - len(self._buffer))
+                    self._buffer[:0] = entries[:room]
+                    self.counters['dropped'] += max(0, len(entries) - room)
+                return 0
+            with self._lock:
+                self.counters['written'] += len(entries)
+            return len(entries)
+    
+    def stats(self) -> Dict[str, int]:
+        """Get the event counters and the number of events waiting to be written."""
+        with self._lock:
+            return {**self.counters, 'pending': len(self._buffer)}
+    
+    def _start_thread(self) -> None:
+        """Start the background flush thread. Caller holds the lock."""
+        self._thread = threading.Thread(target=self._run, name='audit-flush', daemon=True)
+        self._thread.start()
+    
+    def _run(self) -> None:
+        """Flush whenever enough events are waiting or flush_interval has passed."""
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing audit log: {str(e)}")
+                time.sleep(self.flush_interval)
+
+audit_sink = AuditSink()
+atexit.register(audit_sink.flush)
+
+def record_audit(event_type: str, details: str, status: str = 'success', level=None) -> bool:
+    """Record an audit event with the process-wide sink."""
+    return audit_sink.record(event_type, details, status, level)
+
+def flush_audit() -> int:
+    """Write the process-wide sink's buffered events now."""
+    return audit_sink.flush()
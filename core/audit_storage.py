@@ -0,0 +1,220 @@
+"""
+Day-partitioned storage, retention and hourly rollups for the audit log.
+
+core_audit_log is split by day so that old events are dropped a whole day at
+a time instead of with a DELETE across the table:
+
+- On PostgreSQL it is a native partitioned table (PARTITION BY RANGE on
+  created_at, set up by migration 0008) with one partition per UTC day,
+  named core_audit_log_pYYYYMMDD, and a default partition that catches
+  anything outside them. ensure_partitions() creates the partitions for the
+  days ahead.
+- SQLite has no partitioning, so core_audit_log keeps every retained event
+  there and purge() deletes whole days once they are past retention.
+- Other databases keep a single table and purge() deletes old rows.
+
+rollup() counts events per hour, event_type and status into AuditLogRollup,
+so dashboards read a handful of rollup rows instead of scanning raw events.
+Rollups are kept for rollup_retention_days, longer than the events.
+"""
+
+import logging
+import re
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from core.models import AuditLog, AuditLogRollup
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'core_audit_log'
+DAY_TABLE_RE = re.compile(rf'^{PARENT_TABLE}_p(\d{{8}})$')
+
+def partition_settings() -> Dict[str, int]:
+    """Get the AUDIT_LOG_PARTITIONS settings with defaults filled in."""
+    return {
+        'retention_days': 30,
+        'rollup_retention_days': 365,
+        'precreate_days': 3,
+        **getattr(settings, 'AUDIT_LOG_PARTITIONS', {})
+    }
+
+def day_start(day: date) -> datetime:
+    """Get midnight UTC at the start of a day."""
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+def partition_name(day: date) -> str:
+    """Get the name of the partition holding a day's events."""
+    return f"{PARENT_TABLE}_p{day:%Y%m%d}"
+
+def day_tables() -> Dict[date, str]:
+    """Get the day partitions that exist, by day."""
+    with connection.cursor() as cursor:
+        table_names = connection.introspection.table_names(cursor)
+    tables = {}
+    for table_name in table_names:
+        match = DAY_TABLE_RE.match(table_name)
+        if match:
+            tables[datetime.strptime(match.group(1), '%Y%m%d').date()] = table_name
+    return tables
+
+def is_partitioned() -> bool:
+    """Whether core_audit_log is a partitioned table (PostgreSQL only)."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s",
+            [PARENT_TABLE]
+        )
+        return cursor.fetchone() is not None
+
+def ensure_partitions(days_ahead: Optional[int] = None, today: Optional[date] = None) -> List[str]:
+    """Create the day partitions from today to days_ahead days from now (PostgreSQL).
+    
+    Args:
+        days_ahead: Days to create in advance, defaults to precreate_days
+        today: Day to start from, defaults to today (UTC)
+    
+    Returns:
+        list: Names of the partitions created
+    """
+    if not is_partitioned():
+        return []
+    days_ahead = partition_settings()['precreate_days'] if days_ahead is None else days_ahead
+    today = today or timezone.now().astimezone(dt_timezone.utc).date()
+    existing = day_tables()
+    created = []
+    for offset in range(days_ahead + 1):
+        day = today + timedelta(days=offset)
+        if day in existing:
+            continue
+        name = partition_name(day)
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'CREATE TABLE "{name}" PARTITION OF "{PARENT_TABLE}" '
+                    f"FOR VALUES FROM ('{day_start(day).isoformat()}') TO ('{day_start(day + timedelta(days=1)).isoformat()}')"
+                )
+            created.append(name)
+        except Exception as e:
+            # Fails if the default partition already holds events for that day
+            logger.error(f"Error creating audit log partition {name}: {str(e)}")
+    if created:
+        logger.info(f"Created audit log partitions {', '.join(created)}")
+    return created
+
+def purge(retention_days: Optional[int] = None, rollup_retention_days: Optional[int] = None,
+          today: Optional[date] = None) -> Dict[str, int]:
+    """Drop audit events (and rollups) that are past their retention.
+    
+    Whole days are dropped as tables; anything outside a day table (the
+    default partition, SQLite, other databases) is deleted.
+    
+    Args:
+        retention_days: Days of events to keep
+        rollup_retention_days: Days of rollups to keep
+        today: Current day, defaults to today (UTC)
+    
+    Returns:
+        dict: Numbers of day tables dropped and rows and rollups deleted
+    """
+    options = partition_settings()
+    retention_days = options['retention_days'] if retention_days is None else retention_days
+    rollup_retention_days = options['rollup_retention_days'] if rollup_retention_days is None else rollup_retention_days
+    today = today or timezone.now().astimezone(dt_timezone.utc).date()
+    cutoff_day = today - timedelta(days=retention_days)
+    
+    dropped = []
+    for day, name in sorted(day_tables().items()):
+        if day < cutoff_day:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS "{name}"')
+            dropped.append(name)
+    if dropped:
+        logger.info(f"Dropped expired audit log tables {', '.join(dropped)}")
+    
+    deleted, _ = AuditLog.objects.filter(created_at__lt=day_start(cutoff_day)).delete()
+    rollups_deleted, _ = AuditLogRollup.objects.filter(
+        hour__lt=day_start(today - timedelta(days=rollup_retention_days))
+    ).delete()
+    return {'tables_dropped': len(dropped), 'deleted': deleted, 'rollups_deleted': rollups_deleted}
+
+def rollup() -> int:
+    """Recount the hourly rollups from the latest rolled-up hour to now.
+    
+    The latest hour is usually still in progress when it is first counted, so
+    it is counted again on the next run.
+    
+    Returns:
+        int: Number of rollup rows written
+    """
+    start = AuditLogRollup.objects.aggregate(latest=Max('hour'))['latest']
+    if start is None:
+        first = AuditLog.objects.aggregate(first=Min('created_at'))['first']
+        if first is None:
+            return 0
+        start = first.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    
+    counts = (
+        AuditLog.objects.filter(created_at__gte=start)
+        .annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc))
+        .values('hour', 'event_type', 'status')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    rollups = [AuditLogRollup(**row) for row in counts]
+    AuditLogRollup.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=['hour', 'event_type', 'status'],
+        update_fields=['count']
+    )
+    return len(rollups)
+
+def event_counts(since: datetime, **filters) -> List[Dict]:
+    """Count audit events by event_type since a point in time.
+    
+    Hours that have been rolled up are read from AuditLogRollup; only events
+    since the start of the latest rolled-up hour are counted from AuditLog.
+    
+    Args:
+        since: Count events from this time (rounded down to the hour for rolled-up hours)
+        **filters: Extra filters on event_type/status, e.g. status='error'
+    
+    Returns:
+        list: {'event_type', 'count'} dicts, most frequent first
+    """
+    latest = AuditLogRollup.objects.aggregate(latest=Max('hour'))['latest']
+    totals: Dict[str, int] = {}
+    if latest is not None and latest > since:
+        for row in AuditLogRollup.objects.filter(
+            hour__gte=since.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0),
+            hour__lt=latest,
+            **filters
+        ).values('event_type').annotate(count=Sum('count')):
+            totals[row['event_type']] = row['count']
+        since = latest
+    for row in AuditLog.objects.filter(created_at__gte=since, **filters).values('event_type').annotate(count=Count('id')).order_by():
+        totals[row['event_type']] = totals.get(row['event_type'], 0) + row['count']
+    return [
+        {'event_type': event_type, 'count': count}
+        for event_type, count in sorted(totals.items(), key=lambda item: -item[1])
+    ]
+
+def maintain() -> Dict[str, int]:
+    """Run all audit log upkeep: rollups first, then partitions and retention.
+    
+    Returns:
+        dict: What was done
+    """
+    result = {'rollups': rollup()}
+    result['partitions_created'] = len(ensure_partitions())
+    result.update(purge())
+    return result
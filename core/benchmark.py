@@ -0,0 +1,500 @@
+"""
+Synthetic load benchmark for the message pipeline (manage.py bench_pipeline).
+
+PipelineBenchmark seeds throwaway incoming and outgoing services, users and
+user services backed by BenchmarkPlugin, puts synthetic messages in the
+plugin's mailboxes and drives Steps 1-5 in this process until every message
+has been delivered. The report says, per step, how long it took, how many
+messages per second it handled and how many database queries and Redis
+commands it made per message it handled (see core.instrumentation), and
+gives p50/p95/p99 latencies per stage from the messages'
+step_processing_time (see core.metrics). It is plain JSON so runs on
+different commits can be compared. Steps making more queries per message
+than their PIPELINE_QUERY_BUDGETS entry are listed under over_budget.
+
+With transport "mail" the real IMAP and SMTP plugins are used instead,
+against the stand-in servers in core.standins: each incoming service reads
+its own folder of the stand-in IMAP server and every delivery goes to the
+stand-in SMTP sink, which can be told to fail a share of the recipients to
+benchmark the retry path.
+
+Everything happens in one transaction that is rolled back at the end unless
+keep is set, so a run leaves nothing behind; audit events are not recorded
+meanwhile. Steps 2 and 3 work on every enabled service, so the existing
+services are switched off inside the same transaction. On SQLite that
+transaction locks the database for the length of the run: don't benchmark
+against a database that workers are using. The steps still take their poll
+locks and rate limits in Redis (core.tasks.redis_client), so it has to be
+running; bench_pipeline checks before it starts.
+"""
+
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core import instrumentation
+from core.audit import audit_sink
+from core.connection_pool import close_all_pools
+from core.delivery import RecipientResult
+from core.models import Message, Plugin, PluginInterface, Service, UserService
+from core.plugin_registry import plugin_registry, register_plugin
+from core.standins import StandInIMAPServer, StandInSMTPServer, make_message
+from core.tasks import (
+    distribute_outgoing_messages, poll_service, process_incoming_messages,
+    process_outgoing_messages, send_queued_messages
+)
+
+PLUGIN_NAME = 'bench'
+
+TRANSPORTS = ('fake', 'mail')
+
+MANIFEST = {'name': PLUGIN_NAME, 'friendly_name': 'Benchmark', 'version': '1.0.0'}
+
+STAGES = ('ingest', 'standardize', 'format', 'queue', 'send')
+
+# step_processing_time key -> stage it times (ingest is timed by the poll itself)
+STAGE_KEYS = {
+    'ingested': 'standardize',
+    'standardized': 'format',
+    'formatted': 'queue',
+    'queued': 'send',
+}
+
+class BenchmarkPlugin(PluginInterface):
+    """Plugin serving synthetic messages and accepting every send.
+    
+    Mailboxes are kept in memory per service, so polls and sends cost no I/O
+    beyond the optional latency (the service's latency_ms config) added to
+    each fetch and send.
+    """
+    
+    _mailboxes: Dict[int, Dict[str, Dict]] = {}
+    _sent: Dict[int, int] = {}
+    _lock = threading.Lock()
+    
+    def __init__(self, service=None):
+        super().__init__(service)
+        self.latency = float(self.config.get('latency_ms', 0)) / 1000
+        self.poll_size = int(self.config.get('poll_size', settings.MESSAGE_BATCH_SIZE))
+    
+    @classmethod
+    def deliver(cls, service, messages: List[Dict]) -> None:
+        """Put messages in a service's mailbox."""
+        with cls._lock:
+            mailbox = cls._mailboxes.setdefault(service.id, {})
+            for message in messages:
+                mailbox[message['service_message_id']] = message
+    
+    @classmethod
+    def sent_count(cls, service) -> int:
+        """Get how many recipients a service has sent to."""
+        with cls._lock:
+            return cls._sent.get(service.id, 0)
+    
+    @classmethod
+    def reset(cls, services) -> None:
+        """Forget the mailboxes and send counts of services."""
+        with cls._lock:
+            for service in services:
+                cls._mailboxes.pop(service.id, None)
+                cls._sent.pop(service.id, None)
+    
+    def _get_manifest(self) -> Dict:
+        return MANIFEST
+    
+    def _fetch_messages(self) -> List[Dict]:
+        self._wait()
+        with self._lock:
+            mailbox = self._mailboxes.get(self.service.id, {})
+            return [dict(message) for message in list(mailbox.values())[:self.poll_size]]
+    
+    def mark_messages_processed(self, service_message_ids: List[str]) -> None:
+        with self._lock:
+            mailbox = self._mailboxes.get(self.service.id, {})
+            for service_message_id in service_message_ids:
+                mailbox.pop(service_message_id, None)
+    
+    def translate_from_raingull(self, message: Message) -> Dict:
+        return {
+            'subject': message.subject,
+            'content': message.payload.get('content', ''),
+            'metadata': message.payload.get('metadata', {})
+        }
+    
+    def send_bulk(self, message: Message, recipients: List[str]) -> Dict[str, RecipientResult]:
+        self._wait()
+        with self._lock:
+            self._sent[self.service.id] = self._sent.get(self.service.id, 0) + len(recipients)
+        return {recipient: RecipientResult(recipient, True, 250) for recipient in recipients}
+    
+    def _send_message(self, message_payload: Dict) -> bool:
+        self._wait()
+        return True
+    
+    def _test_connection(self) -> bool:
+        return True
+    
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+def percentiles(samples: List[float]) -> Dict:
+    """Summarize samples as count, p50, p95, p99 and max (nearest rank)."""
+    if not samples:
+        return {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    ordered = sorted(samples)
+    
+    def rank(percent):
+        return round(ordered[max(0, -(-len(ordered) * percent // 100) - 1)], 6)
+    
+    return {
+        'count': len(ordered),
+        'p50': rank(50),
+        'p95': rank(95),
+        'p99': rank(99),
+        'max': round(ordered[-1], 6)
+    }
+
+def _rate(count: int, seconds: float) -> Optional[float]:
+    return round(count / seconds, 1) if seconds else None
+
+def git_commit() -> Optional[str]:
+    """Get the commit the code is running from, if it is a git checkout."""
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5
+        )
+    except Exception:
+        return None
+    return result.stdout.strip() or None
+
+class PipelineBenchmark:
+    """Seeds a synthetic load and runs it through Steps 1-5."""
+    
+    def __init__(self, messages: int = 1000, incoming_services: int = 1, outgoing_services: int = 1,
+                 users: int = 10, domains: int = 3, body_size: int = 2000, poll_size: int = 100,
+                 latency_ms: float = 0, concurrency: int = 1, transport: str = 'fake',
+                 temp_fail_rate: float = 0.0, reject_rate: float = 0.0, keep: bool = False):
+        """Initialize the benchmark.
+        
+        Args:
+            messages: Messages to inject, spread over the incoming services
+            incoming_services: Incoming services to create
+            outgoing_services: Outgoing services to create; each sends every message
+            users: Users subscribed to every outgoing service
+            domains: Recipient domains the users' addresses are spread over
+            body_size: Characters in each message body
+            poll_size: Messages returned by each poll (fake transport only; IMAP
+                polls fetch everything new)
+            latency_ms: Simulated latency of each fetch and send, or of every
+                server reply with the mail transport
+            concurrency: Delivery sessions per outgoing service in Step 5
+            transport: "fake" for the in-memory BenchmarkPlugin, "mail" for the
+                IMAP and SMTP plugins against stand-in servers
+            temp_fail_rate: Share of recipients the stand-in SMTP server answers
+                with 451 (mail transport only)
+            reject_rate: Share of recipients it answers with 550 (mail transport only)
+            keep: Commit the seeded rows instead of rolling them back
+        """
+        self.messages = messages
+        self.incoming_count = incoming_services
+        self.outgoing_count = outgoing_services
+        self.user_count = users
+        self.domains = max(1, domains)
+        self.body_size = body_size
+        self.poll_size = poll_size
+        self.latency_ms = latency_ms
+        self.concurrency = concurrency
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport {transport}, expected one of {', '.join(TRANSPORTS)}")
+        self.transport = transport
+        self.temp_fail_rate = temp_fail_rate
+        self.reject_rate = reject_rate
+        self.keep = keep
+        self.imap = None
+        self.smtp = None
+        self.tag = uuid.uuid4().hex[:8]
+        self.incoming: List[Service] = []
+        self.outgoing: List[Service] = []
+        self.steps = {
+            stage: {'seconds': 0.0, 'runs': 0, 'messages': 0, 'queries': 0, 'redis_commands': 0}
+            for stage in STAGES
+        }
+        self.ingest_samples: List[float] = []
+    
+    def run(self) -> Dict:
+        """Run the benchmark.
+        
+        Returns:
+            dict: The report
+        """
+        register_plugin(PLUGIN_NAME, BenchmarkPlugin, MANIFEST)
+        audit_enabled = audit_sink.enabled
+        audit_sink.enabled = self.keep
+        try:
+            with ExitStack() as stack:
+                if self.transport == 'mail':
+                    latency = self.latency_ms / 1000
+                    self.imap = stack.enter_context(StandInIMAPServer(latency=latency))
+                    self.smtp = stack.enter_context(StandInSMTPServer(
+                        latency=latency,
+                        temp_fail_rate=self.temp_fail_rate,
+                        reject_rate=self.reject_rate,
+                        keep_messages=False
+                    ))
+                    # Pooled sessions would outlive the servers
+                    stack.callback(close_all_pools)
+                stack.enter_context(override_settings(ENABLE_MESSAGE_DELIVERY=True, PIPELINE_EVENT_DRIVEN=False))
+                with transaction.atomic():
+                    self.seed()
+                    started = time.perf_counter()
+                    self.run_steps()
+                    elapsed = time.perf_counter() - started
+                    report = self.report(elapsed)
+                    if not self.keep:
+                        transaction.set_rollback(True)
+        finally:
+            audit_sink.enabled = audit_enabled
+            BenchmarkPlugin.reset(self.incoming + self.outgoing)
+        return report
+    
+    def seed(self) -> None:
+        """Create the services, users and subscriptions and fill the mailboxes."""
+        Service.objects.update(incoming_enabled=False, outgoing_enabled=False)
+        delivery = {'delivery_concurrency': self.concurrency, 'domain_rate_limit': 0}
+        self.incoming = []
+        for index in range(self.incoming_count):
+            name = f"bench-{self.tag}-in-{index}"
+            if self.transport == 'mail':
+                plugin, config = self._plugin('imap'), {
+                    'host': self.imap.host,
+                    'port': self.imap.port,
+                    'use_ssl': 'None',
+                    'username': 'bench',
+                    'password': 'bench',
+                    'folder': name,
+                    'processed_action': 'move',
+                    'processed_folder': f"{name}.Processed"
+                }
+            else:
+                plugin, config = self._plugin(PLUGIN_NAME), {'latency_ms': self.latency_ms, 'poll_size': self.poll_size}
+            self.incoming.append(Service.objects.create(
+                name=name, plugin=plugin, incoming_enabled=True, outgoing_enabled=False, config=config, app_config=''
+            ))
+        self.outgoing = []
+        for index in range(self.outgoing_count):
+            if self.transport == 'mail':
+                plugin, config = self._plugin('smtp'), {
+                    'host': self.smtp.host,
+                    'port': self.smtp.port,
+                    'use_tls': 'None',
+                    'from_address': "bench@bench.invalid",
+                    **delivery
+                }
+            else:
+                plugin, config = self._plugin(PLUGIN_NAME), {'latency_ms': self.latency_ms, **delivery}
+            self.outgoing.append(Service.objects.create(
+                name=f"bench-{self.tag}-out-{index}", plugin=plugin, incoming_enabled=False,
+                outgoing_enabled=True, config=config, app_config=''
+            ))
+        
+        User = get_user_model()
+        User.objects.bulk_create([
+            User(username=f"bench-{self.tag}-{index}", email=f"user{index}@bench{index % self.domains}.invalid", password='!')
+            for index in range(self.user_count)
+        ])
+        users = list(User.objects.filter(username__startswith=f"bench-{self.tag}-"))
+        UserService.objects.bulk_create([
+            UserService(user=user, service=service, is_active=True, config={'email_address': user.email})
+            for service in self.outgoing
+            for user in users
+        ])
+        
+        body = ('The quick brown fox jumps over the lazy dog. ' * (self.body_size // 45 + 1))[:self.body_size]
+        now = timezone.now()
+        mailboxes = {service.id: [] for service in self.incoming}
+        for index in range(self.messages):
+            service = self.incoming[index % len(self.incoming)]
+            if self.transport == 'mail':
+                mailboxes[service.id].append(make_message(
+                    index, self.body_size, tag=f"bench-{self.tag}-", recipient=f"{service.name}@bench.invalid"
+                ))
+                continue
+            mailboxes[service.id].append({
+                'service_message_id': f"bench-{self.tag}-{index}",
+                'subject': f"Benchmark message {index}",
+                'sender': f"sender{index}@bench.invalid",
+                'recipient': f"{service.name}@bench.invalid",
+                'timestamp': now,
+                'payload': {'content': body, 'metadata': {}}
+            })
+        for service in self.incoming:
+            if self.transport == 'mail':
+                self.imap.add_messages(service.name, mailboxes[service.id])
+            else:
+                BenchmarkPlugin.deliver(service, mailboxes[service.id])
+    
+    def _plugin(self, name: str) -> Plugin:
+        """Get the Plugin row for a plugin, creating it if the plugin hasn't been discovered yet."""
+        manifest = MANIFEST if name == PLUGIN_NAME else plugin_registry.get_manifest(name)
+        plugin, _ = Plugin.objects.get_or_create(
+            name=name,
+            defaults={'friendly_name': manifest['friendly_name'], 'version': manifest['version'], 'manifest': manifest}
+        )
+        return plugin
+    
+    def run_steps(self) -> None:
+        """Run each step until it has nothing left to do, in pipeline order.
+        
+        Stage latencies therefore include the time a message waits for the
+        previous step to finish with the rest of the load.
+        """
+        # Step 1: Poll every incoming service until its mailbox is empty
+        for service in self.incoming:
+            while True:
+                result, elapsed = self._step('ingest', poll_service, service)
+                if not result or not result['stored']:
+                    break
+                self.ingest_samples.extend([elapsed] * result['stored'])
+        
+        # Step 2: Standardize
+        for service in self.incoming:
+            while True:
+                result, _ = self._step('standardize', process_incoming_messages, service.id)
+                if not result or not result['processed']:
+                    break
+        
+        # Step 3: Format for each outgoing service, handing over the ids as Step 2 would
+        # in event-driven mode so a backlog already in the database isn't picked up
+        pending = list(Message.objects.filter(
+            service__in=self.incoming,
+            status='standardized',
+            processing_step='standardized'
+        ).order_by('id').values_list('id', flat=True))
+        batch_size = settings.MESSAGE_BATCH_SIZE
+        for start in range(0, len(pending), batch_size):
+            self._step('format', distribute_outgoing_messages, message_ids=pending[start:start + batch_size])
+        
+        # Steps 4 and 5: Queue for the users and send, one service at a time
+        for service in self.outgoing:
+            while True:
+                result, _ = self._step('queue', process_outgoing_messages, service.id)
+                if not result or not result['processed']:
+                    break
+            while True:
+                result, _ = self._step('send', send_queued_messages, service.id)
+                if not result or not (result['sent'] or result['failed']):
+                    break
+    
+    def _step(self, stage: str, func, *args, **kwargs):
+        """Run one step, adding its time, queries and Redis commands to the stage's totals.
+        
+        Runs that find nothing to do count too, so the totals include the
+        queries spent finding out.
+        
+        Returns:
+            tuple: The step's result and the seconds it took
+        """
+        started = time.perf_counter()
+        with instrumentation.measure() as usage:
+            result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        step = self.steps[stage]
+        step['seconds'] += elapsed
+        step['runs'] += 1
+        step['queries'] += usage.queries
+        step['redis_commands'] += usage.redis_commands
+        if isinstance(result, dict) and result.get('usage'):
+            step['messages'] += result['usage']['messages']
+        return result, elapsed
+    
+    def _per_message(self, value: int, messages: Optional[int] = None) -> Optional[float]:
+        messages = self.messages if messages is None else messages
+        return round(value / messages, 3) if messages else None
+    
+    def report(self, elapsed: float) -> Dict:
+        """Build the report from the step totals and the messages' stage timings.
+        
+        Args:
+            elapsed: Seconds the steps took altogether
+        
+        Returns:
+            dict: The report
+        """
+        samples = {stage: [] for stage in STAGES}
+        samples['ingest'] = self.ingest_samples
+        rows = Message.objects.filter(
+            service__in=self.incoming + self.outgoing
+        ).values_list('step_processing_time', flat=True)
+        for processing_time in rows:
+            for key, stage in STAGE_KEYS.items():
+                seconds = (processing_time or {}).get(key, {}).get('seconds')
+                if seconds is not None:
+                    samples[stage].append(seconds)
+        
+        if self.transport == 'mail':
+            delivered = self.smtp.delivered()
+        else:
+            delivered = sum(BenchmarkPlugin.sent_count(service) for service in self.outgoing)
+        queries = sum(step['queries'] for step in self.steps.values())
+        redis_commands = sum(step['redis_commands'] for step in self.steps.values())
+        budgets = {stage: instrumentation.query_budget(stage) for stage in STAGES}
+        steps = {}
+        for stage, step in self.steps.items():
+            # Per message the step handled: stored, standardized, distributed, queued or sent
+            steps[stage] = {
+                'runs': step['runs'],
+                'seconds': round(step['seconds'], 3),
+                'messages_per_second': _rate(self.messages, step['seconds']),
+                'messages': step['messages'],
+                'queries': step['queries'],
+                'queries_per_message': self._per_message(step['queries'], step['messages']),
+                'redis_commands': step['redis_commands'],
+                'redis_commands_per_message': self._per_message(step['redis_commands'], step['messages']),
+                'query_budget': budgets[stage]
+            }
+        return {
+            'commit': git_commit(),
+            'database': connection.vendor,
+            'config': {
+                'messages': self.messages,
+                'incoming_services': self.incoming_count,
+                'outgoing_services': self.outgoing_count,
+                'users': self.user_count,
+                'domains': self.domains,
+                'body_size': self.body_size,
+                'poll_size': self.poll_size,
+                'latency_ms': self.latency_ms,
+                'concurrency': self.concurrency,
+                'transport': self.transport,
+                'temp_fail_rate': self.temp_fail_rate,
+                'reject_rate': self.reject_rate,
+                'batch_size': settings.MESSAGE_BATCH_SIZE
+            },
+            'seconds': round(elapsed, 3),
+            'messages_per_second': _rate(self.messages, elapsed),
+            'deliveries': delivered,
+            'expected_deliveries': self.messages * self.outgoing_count * self.user_count,
+            'deliveries_per_second': _rate(delivered, elapsed),
+            'queries': queries,
+            'queries_per_message': self._per_message(queries),
+            'redis_commands': redis_commands,
+            'redis_commands_per_message': self._per_message(redis_commands),
+            'steps': steps,
+            'over_budget': [
+                stage for stage, step in steps.items()
+                if instrumentation.over_budget(stage, step['queries'], step['messages'], step['runs'])
+            ],
+            'latency': {stage: percentiles(samples[stage]) for stage in STAGES},
+            'smtp': dict(self.smtp.stats) if self.smtp else None
+        }
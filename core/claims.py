@@ -0,0 +1,106 @@
+"""
+Row claiming for the message pipeline.
+
+A worker claims the rows it is about to process by stamping them with a lease
+(claimed_by/claimed_until). Other workers skip claimed rows until the lease
+expires, so several workers can drain the same step at once, and rows held by
+a worker that died are picked up again once its lease runs out.
+
+On PostgreSQL candidate rows are selected with SELECT ... FOR UPDATE SKIP
+LOCKED, so concurrent workers never wait on each other. Other databases (e.g.
+SQLite) use a conditional UPDATE that only stamps rows that are still free;
+the row count tells each worker exactly which rows it won.
+"""
+
+import logging
+import os
+import socket
+import uuid
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from django.db import connection, transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from core import tracing
+
+logger = logging.getLogger(__name__)
+
+def new_claim_token() -> str:
+    """Generate a token identifying one claim by this worker.
+    
+    Returns:
+        str: "host:pid:random", unique per claim
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[:64]
+
+def unclaimed(now=None) -> Q:
+    """Filter for rows that are not claimed or whose lease has expired.
+    
+    Args:
+        now: Time to compare leases against, defaults to now
+    
+    Returns:
+        Q: Filter on claimed_until
+    """
+    now = now or timezone.now()
+    return Q(claimed_until__isnull=True) | Q(claimed_until__lt=now)
+
+@tracing.traced('db.claim')
+def claim_rows(queryset: QuerySet, batch_size: int, lease_seconds: int, token: Optional[str] = None) -> Tuple[str, List]:
+    """Claim up to batch_size rows of a queryset for this worker.
+    
+    Args:
+        queryset: Rows eligible for processing (without slicing); its ordering
+            decides which rows are claimed first and its select_related applies
+            to the returned rows
+        batch_size: Maximum number of rows to claim
+        lease_seconds: How long the claim holds before other workers may take the rows
+        token: Claim token to use, defaults to a new one
+    
+    Returns:
+        tuple: The claim token and the list of claimed rows
+    """
+    token = token or new_claim_token()
+    now = timezone.now()
+    claimed_until = now + timedelta(seconds=lease_seconds)
+    model = queryset.model
+    candidates = queryset.filter(unclaimed(now))
+    
+    if connection.features.has_select_for_update_skip_locked:
+        # Lock candidate rows, skipping any another worker is claiming right now
+        with transaction.atomic():
+            ids = list(
+                candidates.select_for_update(skip_locked=True, of=('self',))
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if ids:
+                model.objects.filter(pk__in=ids).update(claimed_by=token, claimed_until=claimed_until)
+    else:
+        # Only stamp rows that are still free; rows another worker won in between are skipped
+        ids = list(candidates.values_list('pk', flat=True)[:batch_size])
+        if ids:
+            model.objects.filter(unclaimed(now), pk__in=ids).update(claimed_by=token, claimed_until=claimed_until)
+    
+    if not ids:
+        tracing.annotate(model=model._meta.model_name, claimed=0)
+        return token, []
+    
+    rows = list(queryset.filter(claimed_by=token))
+    tracing.annotate(model=model._meta.model_name, claimed=len(rows))
+    logger.debug(f"Claimed {len(rows)} {model._meta.model_name} rows as {token}")
+    return token, rows
+
+@tracing.traced('db.release')
+def release_claims(model, token: str) -> int:
+    """Release every row still held under a claim token.
+    
+    Args:
+        model: Model class the rows were claimed from
+        token: Token returned by claim_rows
+    
+    Returns:
+        int: Number of rows released
+    """
+    return model.objects.filter(claimed_by=token).update(claimed_by=None, claimed_until=None)
@@ -0,0 +1,263 @@
+"""
+Connection pooling for Raingull plugins.
+
+Opening an IMAP or SMTP session costs a TCP connect, a TLS handshake and a
+LOGIN/AUTH round trip. The pools in this module keep authenticated connections
+open between tasks in the same worker process, keyed by Service id, so each
+task can reuse the session left behind by the previous one.
+
+Pools are per process: Celery's prefork workers get fresh, empty pools after
+fork so that no socket is ever shared between processes.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+class PooledConnection:
+    """Bookkeeping for a single pooled connection."""
+    
+    __slots__ = ('key', 'host', 'connection', 'created_at', 'last_used_at')
+    
+    def __init__(self, key: Hashable, host: Tuple[str, int], connection: Any):
+        self.key = key
+        self.host = host
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+class ConnectionPool:
+    """A thread-safe pool of authenticated connections.
+    
+    Connections are checked out with acquire() and handed back with release().
+    Idle connections are health-checked before reuse and closed once they have
+    been idle for longer than max_idle_time. The total number of connections
+    (idle and in use) to any one host never exceeds max_connections_per_host.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        health_check: Callable[[Any], None],
+        close: Callable[[Any], None],
+        max_idle_time: Optional[float] = None,
+        max_connections_per_host: Optional[int] = None,
+        acquire_timeout: Optional[float] = None
+    ):
+        """Initialize the pool.
+        
+        Args:
+            name: Name used in log messages (e.g. "imap")
+            health_check: Called with an idle connection before reuse; must raise if it is dead
+            close: Called to close a connection that leaves the pool
+            max_idle_time: Seconds a connection may sit idle before it is closed
+            max_connections_per_host: Upper bound on open connections per (host, port)
+            acquire_timeout: Seconds to wait for a free slot before giving up
+        """
+        pool_settings = getattr(settings, 'CONNECTION_POOL', {})
+        self.name = name
+        self.health_check = health_check
+        self.close_connection = close
+        self.max_idle_time = max_idle_time if max_idle_time is not None else pool_settings.get('max_idle_time', 300)
+        self.max_connections_per_host = max_connections_per_host or pool_settings.get('max_connections_per_host', 4)
+        self.acquire_timeout = acquire_timeout if acquire_timeout is not None else pool_settings.get('acquire_timeout', 30)
+        self._condition = threading.Condition()
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+    
+    def _reset(self) -> None:
+        """Forget all connections, e.g. in a freshly forked child process."""
+        self._idle: Dict[Hashable, List[PooledConnection]] = {}
+        self._in_use: Dict[int, PooledConnection] = {}
+        self._host_counts: Dict[Tuple[str, int], int] = {}
+    
+    def acquire(self, key: Hashable, host: Tuple[str, int], factory: Callable[[], Any]) -> Any:
+        """Check out a connection for a key, opening one if needed.
+        
+        Args:
+            key: Pool key, normally the Service id
+            host: (host, port) the connection points at
+            factory: Opens and authenticates a new connection
+        
+        Returns:
+            A live connection, which must be handed back with release()
+        
+        Raises:
+            TimeoutError: If the host is at its connection limit for too long
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            record = None
+            with self._condition:
+                while True:
+                    self._prune_idle()
+                    
+                    # Prefer the most recently used idle connection for this key
+                    idle = self._idle.get(key)
+                    if idle:
+                        record = idle.pop()
+                        self._in_use[id(record.connection)] = record
+                        break
+                    
+                    # Open a new connection if the host has a free slot
+                    if self._host_counts.get(host, 0) < self.max_connections_per_host:
+                        self._host_counts[host] = self._host_counts.get(host, 0) + 1
+                        break
+                    
+                    # Otherwise make room by closing an idle connection of another key
+                    victim = self._pop_idle_for_host(host)
+                    if victim:
+                        self._discard(victim)
+                        self._host_counts[host] = self._host_counts.get(host, 0) + 1
+                        break
+                    
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"Timed out waiting for a {self.name} connection to {host[0]}:{host[1]} "
+                            f"({self.max_connections_per_host} already open)"
+                        )
+                    self._condition.wait(remaining)
+            
+            if record is None:
+                return self._open(key, host, factory)
+            
+            # Health-check the reused connection outside the lock
+            try:
+                self.health_check(record.connection)
+                record.last_used_at = time.monotonic()
+                return record.connection
+            except Exception as e:
+                logger.info(f"Pooled {self.name} connection to {host[0]} failed health check, reconnecting: {e}")
+                with self._condition:
+                    self._in_use.pop(id(record.connection), None)
+                    self._discard(record)
+                    self._condition.notify()
+    
+    def release(self, connection: Any, discard: bool = False) -> bool:
+        """Hand a connection back to the pool.
+        
+        Args:
+            connection: A connection returned by acquire()
+            discard: Close the connection instead of keeping it for reuse
+        
+        Returns:
+            bool: True if the connection belonged to this pool
+        """
+        with self._condition:
+            record = self._in_use.pop(id(connection), None)
+            if record is None:
+                return False
+            if discard:
+                self._discard(record)
+            else:
+                record.last_used_at = time.monotonic()
+                self._idle.setdefault(record.key, []).append(record)
+            self._condition.notify()
+            return True
+    
+    def close_all(self) -> None:
+        """Close every idle connection, e.g. on worker shutdown."""
+        with self._condition:
+            for records in list(self._idle.values()):
+                for record in records:
+                    self._discard(record)
+            self._idle = {}
+            self._condition.notify_all()
+    
+    def stats(self) -> Dict[str, int]:
+        """Get the number of idle and in-use connections."""
+        with self._condition:
+            return {
+                'idle': sum(len(records) for records in self._idle.values()),
+                'in_use': len(self._in_use),
+            }
+    
+    def _open(self, key: Hashable, host: Tuple[str, int], factory: Callable[[], Any]) -> Any:
+        """Open a connection in a slot that has already been reserved."""
+        try:
+            connection = factory()
+        except Exception:
+            with self._condition:
+                self._release_slot(host)
+                self._condition.notify()
+            raise
+        record = PooledConnection(key, host, connection)
+        with self._condition:
+            self._in_use[id(connection)] = record
+        logger.debug(f"Opened pooled {self.name} connection to {host[0]}:{host[1]} for {key}")
+        return connection
+    
+    def _prune_idle(self) -> None:
+        """Close idle connections that have exceeded max_idle_time. Caller holds the lock."""
+        cutoff = time.monotonic() - self.max_idle_time
+        for key, records in list(self._idle.items()):
+            expired = [record for record in records if record.last_used_at < cutoff]
+            if not expired:
+                continue
+            for record in expired:
+                self._discard(record)
+            self._idle[key] = [record for record in records if record.last_used_at >= cutoff]
+    
+    def _pop_idle_for_host(self, host: Tuple[str, int]) -> Optional[PooledConnection]:
+        """Take the least recently used idle connection to a host. Caller holds the lock."""
+        candidates = [
+            record
+            for records in self._idle.values()
+            for record in records
+            if record.host == host
+        ]
+        if not candidates:
+            return None
+        victim = min(candidates, key=lambda record: record.last_used_at)
+        self._idle[victim.key].remove(victim)
+        return victim
+    
+    def _discard(self, record: PooledConnection) -> None:
+        """Close a connection that is no longer tracked as idle or in use. Caller holds the lock."""
+        self._release_slot(record.host)
+        try:
+            self.close_connection(record.connection)
+        except Exception as e:
+            logger.debug(f"Error closing {self.name} connection to {record.host[0]}: {e}")
+    
+    def _release_slot(self, host: Tuple[str, int]) -> None:
+        """Give back a per-host connection slot. Caller holds the lock."""
+        count = self._host_counts.get(host, 0) - 1
+        if count > 0:
+            self._host_counts[host] = count
+        else:
+            self._host_counts.pop(host, None)
+
+def _imap_health_check(connection) -> None:
+    status, data = connection.noop()
+    if status != 'OK':
+        raise ConnectionError(f"NOOP returned {status}: {data}")
+
+def _imap_close(connection) -> None:
+    connection.logout()
+
+def _smtp_health_check(connection) -> None:
+    code, message = connection.noop()
+    if code != 250:
+        raise ConnectionError(f"NOOP returned {code}: {message}")
+
+def _smtp_close(connection) -> None:
+    try:
+        connection.quit()
+    except Exception:
+        connection.close()
+
+imap_pool = ConnectionPool('imap', health_check=_imap_health_check, close=_imap_close)
+smtp_pool = ConnectionPool('smtp', health_check=_smtp_health_check, close=_smtp_close)
+
+def close_all_pools() -> None:
+    """Close all idle pooled connections in this process."""
+    imap_pool.close_all()
+    smtp_pool.close_all()
@@ -0,0 +1,318 @@
+"""
+Delivery engine for Step 5.
+
+Queue entries are grouped by message so that each message is rendered once
+and handed to the plugin together with all of its recipients. Plugins that
+implement send_bulk (e.g. SMTP) can then deliver one body to many recipients
+over a single session; the default implementation in PluginInterface falls
+back to one send per recipient.
+
+The engine resolves every recipient address with a single UserService query
+and writes all queue entry updates with bulk_update.
+
+Sends can run on a thread pool with delivery_concurrency sessions per
+service. Recipients are split by destination domain, and each domain gets its
+own concurrency limit and messages-per-second token bucket so that large
+batches don't trip provider throttling. Only plugin I/O runs on the worker
+threads; all ORM work stays on the calling thread.
+
+When a RateLimiter is passed in, rates are enforced by its shared Redis
+buckets instead of per-engine ones. Sends that would have to wait longer than
+the limiter allows are deferred: the entries are left as they were, without
+using up a retry, and the task schedules a follow-up for the service (one
+at a time) for when the buckets have refilled.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core import instrumentation, metrics, tracing
+from core.models import Message, MessageQueue, UserService
+from core.ratelimit import RateLimiter, TokenBucket
+from core.retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+class RecipientResult:
+    """The outcome of delivering a message to one recipient."""
+    
+    __slots__ = ('recipient', 'success', 'code', 'error')
+    
+    def __init__(self, recipient: str, success: bool, code: Optional[int] = None, error: Optional[str] = None):
+        """Initialize the result.
+        
+        Args:
+            recipient: Address the message was sent to
+            success: Whether the server accepted the message for this recipient
+            code: Server reply code, if the protocol has one (e.g. SMTP)
+            error: Error message for failed deliveries
+        """
+        self.recipient = recipient
+        self.success = success
+        self.code = code
+        self.error = error
+    
+    @property
+    def permanent(self) -> bool:
+        """Whether the failure is permanent (a 5xx SMTP reply) and retrying is pointless."""
+        return not self.success and self.code is not None and 500 <= self.code < 600
+    
+    def __repr__(self):
+        return f"RecipientResult({self.recipient!r}, success={self.success}, code={self.code})"
+
+class DomainLimiter:
+    """Concurrency and rate limits for one destination domain."""
+    
+    def __init__(self, concurrency: int, rate: float):
+        """Initialize the limiter.
+        
+        Args:
+            concurrency: Maximum simultaneous sends to the domain
+            rate: Maximum messages per second to the domain, 0 for no limit
+                (or when the rate is enforced by a shared RateLimiter)
+        """
+        self.semaphore = threading.BoundedSemaphore(max(1, concurrency))
+        self.bucket = TokenBucket(rate) if rate else None
+
+class DeliveryEngine:
+    """Sends a batch of queue entries for one outgoing service."""
+    
+    def __init__(self, service, plugin, concurrency: Optional[int] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
+        """Initialize the engine.
+        
+        Args:
+            service: The outgoing Service the entries belong to
+            plugin: A plugin instance for the service, used when sending serially
+            concurrency: Number of parallel sessions, defaults to the service's
+                delivery_concurrency config or DELIVERY_CONCURRENCY
+            rate_limiter: Shared rate limiter for the service; without one,
+                domain rates are only enforced within this engine
+        """
+        self.service = service
+        self.plugin = plugin
+        self.rate_limiter = rate_limiter
+        self.retry_policy = RetryPolicy.for_service(service)
+        config = service.config or {}
+        self.concurrency = max(1, int(concurrency or config.get('delivery_concurrency', settings.DELIVERY_CONCURRENCY)))
+        self.domain_concurrency = int(config.get('domain_concurrency', settings.DELIVERY_DOMAIN_CONCURRENCY))
+        self.domain_rate = float(config.get('domain_rate_limit', settings.DELIVERY_DOMAIN_RATE_LIMIT))
+        self.domain_limits = config.get('domain_limits', {})
+        self.stats = {'sent': 0, 'failed': 0, 'retries': 0, 'deferred': 0, 'completed': 0}
+        # Seconds each completed message spent queued (see core.metrics)
+        self.send_durations: List[float] = []
+        self._limiters: Dict[str, DomainLimiter] = {}
+        self._limiters_lock = threading.Lock()
+        self._local = threading.local()
+        self._thread_plugins: List[Any] = []
+        self._parent_span = None
+        self._usages = []
+    
+    def deliver(self, entries: Iterable[MessageQueue]) -> Dict[str, int]:
+        """Deliver queue entries, grouped by message.
+        
+        Args:
+            entries: Claimed MessageQueue rows for this engine's service
+        
+        Returns:
+            dict: Sent, failed, retried and deferred entry counts, and the
+                number of messages whose copies have now all been sent
+        """
+        entries = list(entries)
+        if not entries:
+            return self.stats
+        
+        # Resolve every recipient address in one query
+        addresses = {
+            user_service.user_id: user_service.config.get('email_address')
+            for user_service in UserService.objects.filter(
+                service=self.service,
+                is_active=True,
+                user_id__in={entry.user_id for entry in entries}
+            )
+        }
+        
+        # Group entries by message so each message is rendered and sent once
+        by_message: Dict[int, List[MessageQueue]] = OrderedDict()
+        for entry in entries:
+            if entry.user_id not in addresses:
+                self._fail(entry, f"Step 5: User {entry.user.username} is not activated for service {self.service.name}")
+            elif not addresses[entry.user_id]:
+                self._fail(entry, f"Step 5: No email address configured for user {entry.user.username} in service {self.service.name}")
+            else:
+                by_message.setdefault(entry.message_id, []).append(entry)
+        
+        # Split each message's recipients by destination domain
+        units: List[Tuple[Message, str, Dict[str, List[MessageQueue]]]] = []
+        for message_entries in by_message.values():
+            by_domain: Dict[str, Dict[str, List[MessageQueue]]] = OrderedDict()
+            for entry in message_entries:
+                recipient = addresses[entry.user_id]
+                domain = recipient.rpartition('@')[2].lower()
+                by_domain.setdefault(domain, OrderedDict()).setdefault(recipient, []).append(entry)
+            for domain, entries_by_recipient in by_domain.items():
+                units.append((message_entries[0].message, domain, entries_by_recipient))
+                
+        if self.concurrency == 1 or len(units) == 1:
+            for message, domain, entries_by_recipient in units:
+                results = self._send(self.plugin, message, domain, list(entries_by_recipient))
+                self._apply_results(message, entries_by_recipient, results)
+        else:
+            # Only plugin I/O happens on the pool; results are applied here, on the ORM thread
+            self._parent_span = tracing.current_span()
+            self._usages = instrumentation.current()
+            try:
+                with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"deliver-{self.service.id}") as executor:
+                    futures = {
+                        executor.submit(self._send_threaded, message, domain, list(entries_by_recipient)): (message, entries_by_recipient)
+                        for message, domain, entries_by_recipient in units
+                    }
+                    for future in as_completed(futures):
+                        message, entries_by_recipient = futures[future]
+                        self._apply_results(message, entries_by_recipient, future.result())
+            finally:
+                self.close()
+                
+        self._save(entries)
+        return self.stats
+        
+    def close(self) -> None:
+        """Release the sessions opened by worker threads."""
+        for plugin in self._thread_plugins:
+            if hasattr(plugin, 'disconnect'):
+                try:
+                    plugin.disconnect()
+                except Exception as e:
+                    logger.error(f"Step 5: Error disconnecting delivery session: {str(e)}")
+        self._thread_plugins = []
+        
+    def _limiter(self, domain: str) -> DomainLimiter:
+        """Get the limiter for a destination domain, creating it on first use."""
+        with self._limiters_lock:
+            limiter = self._limiters.get(domain)
+            if limiter is None:
+                limits = self.domain_limits.get(domain, {})
+                limiter = DomainLimiter(
+                    int(limits.get('concurrency', self.domain_concurrency)),
+                    0 if self.rate_limiter else float(limits.get('rate', self.domain_rate))
+                )
+                self._limiters[domain] = limiter
+            return limiter
+            
+    def _send_threaded(self, message: Message, domain: str, recipients: List[str]) -> Optional[Dict[str, RecipientResult]]:
+        """Send from a worker thread, using that thread's own plugin session."""
+        plugin = getattr(self._local, 'plugin', None)
+        if plugin is None:
+            plugin = self.service.get_plugin_instance()
+            self._local.plugin = plugin
+            self._thread_plugins.append(plugin)
+        # Worker threads don't inherit the step's span; parent the send spans to it explicitly
+        with tracing.use_span(self._parent_span), instrumentation.attach(self._usages):
+            return self._send(plugin, message, domain, recipients)
+        
+    def _send(self, plugin, message: Message, domain: str, recipients: List[str]) -> Optional[Dict[str, RecipientResult]]:
+        """Send one message to recipients at one domain, within the domain's limits.
+        
+        Returns None if the rate limiter deferred the send.
+        """
+        limiter = self._limiter(domain)
+        try:
+            with tracing.span('lock.domain', domain=domain):
+                limiter.semaphore.acquire()
+            try:
+                with tracing.span('lock.rate_limit', domain=domain):
+                    if self.rate_limiter:
+                        if not self.rate_limiter.acquire(domain, len(recipients)):
+                            return None
+                    elif limiter.bucket:
+                        limiter.bucket.acquire(len(recipients))
+                with tracing.span('plugin.send_bulk', domain=domain, recipients=len(recipients), raingull_id=str(message.raingull_id)):
+                    return plugin.send_bulk(message, recipients)
+            finally:
+                limiter.semaphore.release()
+        except Exception as e:
+            error_msg = f"Step 5: Error sending message {message.id}: {str(e)}"
+            logger.error(error_msg)
+            return {recipient: RecipientResult(recipient, False, error=error_msg) for recipient in recipients}
+            
+    def _apply_results(self, message: Message, entries_by_recipient: Dict[str, List[MessageQueue]],
+                       results: Optional[Dict[str, RecipientResult]]) -> None:
+        """Record the per-recipient results on the queue entries."""
+        if results is None:
+            # Rate limited: leave the entries queued as they were for the next run
+            self.stats['deferred'] += sum(len(recipient_entries) for recipient_entries in entries_by_recipient.values())
+            return
+        
+        for recipient, recipient_entries in entries_by_recipient.items():
+            result = results.get(recipient) or RecipientResult(recipient, False, error="No result from plugin")
+            for entry in recipient_entries:
+                if result.success:
+                    entry.status = 'sent'
+                    entry.error_message = None
+                    self.stats['sent'] += 1
+                    logger.info(f"Step 5: Successfully sent message {message.id} to {recipient}")
+                else:
+                    error_msg = f"Step 5: Failed to send message {message.id} to {recipient}: {result.error or 'unknown error'}"
+                    self._fail(entry, error_msg, permanent=result.permanent)
+    
+    def _fail(self, entry: MessageQueue, error_msg: str, permanent: bool = False) -> None:
+        """Record a failed delivery attempt on a queue entry."""
+        logger.error(error_msg)
+        entry.status = 'failed'
+        entry.error_message = error_msg
+        entry.retry_count += 1
+        if permanent:
+            # The server rejected the recipient outright; retrying won't help
+            entry.retry_count = max(entry.retry_count, self.retry_policy.max_retries)
+        entry.last_retry_at = timezone.now()
+        entry.next_attempt_at = self.retry_policy.next_attempt_at(entry.retry_count, entry.last_retry_at)
+        self.stats['failed'] += 1
+        if entry.next_attempt_at:
+            self.stats['retries'] += 1
+    
+    def _save(self, entries: List[MessageQueue]) -> None:
+        """Write the entry updates and finish messages whose copies have all been sent."""
+        now = timezone.now()
+        for entry in entries:
+            entry.updated_at = now
+            entry.claimed_by = None
+            entry.claimed_until = None
+        
+        message_ids = {entry.message_id for entry in entries if entry.status == 'sent'}
+        with tracing.span('db.write', entries=len(entries)), transaction.atomic():
+            MessageQueue.objects.bulk_update(
+                entries,
+                ['status', 'error_message', 'retry_count', 'last_retry_at', 'next_attempt_at', 'updated_at', 'claimed_by', 'claimed_until'],
+                batch_size=settings.MESSAGE_BATCH_SIZE
+            )
+            if not message_ids:
+                return
+            
+            # Mark original messages as fully processed once no copies are left to send
+            unsent = set(MessageQueue.objects.filter(
+                message_id__in=message_ids,
+                status__in=['queued', 'failed']
+            ).values_list('message_id', flat=True))
+            completed = message_ids - unsent
+            if completed:
+                messages = {entry.message_id: entry.message for entry in entries if entry.message_id in completed}
+                for message in messages.values():
+                    self.send_durations.append(metrics.finish_stage(message, 'queued', now))
+                    message.status = 'sent'
+                    message.processing_step = 'sent'
+                    message.sent_at = now
+                    message.updated_at = now
+                Message.objects.bulk_update(
+                    list(messages.values()),
+                    ['status', 'processing_step', 'sent_at', 'updated_at', 'step_processing_time'],
+                    batch_size=settings.MESSAGE_BATCH_SIZE
+                )
+                self.stats['completed'] = len(completed)
+                logger.info(f"Step 5: All copies of {len(completed)} messages have been sent")
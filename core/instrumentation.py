@@ -0,0 +1,191 @@
+"""
+Query and Redis command counts for the pipeline steps.
+
+Each step runs inside measure(), which counts the ORM queries (through a
+database execute wrapper) and the Redis commands (through CountingRedis,
+the client class of core.tasks.redis_client) made while it runs. The
+instrumented() decorator adds the counts to the step's result, next to the
+number of messages it handled:
+
+    {"processed": 100, ..., "usage": {"messages": 100, "queries": 115,
+     "redis_commands": 3, "queries_per_message": 1.15, ...}}
+
+and logs a warning when a step makes more queries than its budget in
+PIPELINE_QUERY_BUDGETS: a number of queries per message plus a fixed
+overhead per run. The bench_pipeline command fails when a
+step goes over budget, so N+1 query patterns show up before they ship.
+
+Counts are per thread. Code that hands work to other threads (e.g. the
+delivery worker threads) passes the step's counters along with attach().
+"""
+
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from django.conf import settings
+from django.db import connection
+from redis import Redis
+from redis.client import Pipeline
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+STEP_NUMBERS = {'ingest': 1, 'standardize': 2, 'format': 3, 'queue': 4, 'send': 5}
+
+class Usage:
+    """ORM queries and Redis commands counted during a measure() block."""
+
+    def __init__(self):
+        self.queries = 0
+        self.redis_commands = 0
+        self._lock = threading.Lock()
+
+    def add_redis(self, count: int) -> None:
+        with self._lock:
+            self.redis_commands += count
+
+    def count_query(self, execute, sql, params, many, context):
+        """Database execute wrapper counting each query."""
+        with self._lock:
+            self.queries += 1
+        return execute(sql, params, many, context)
+
+    def as_dict(self, messages: Optional[int] = None) -> Dict:
+        """Get the counts, and the counts per message when the number of messages is known."""
+        usage = {'queries': self.queries, 'redis_commands': self.redis_commands}
+        if messages is not None:
+            usage['messages'] = messages
+            usage['queries_per_message'] = round(self.queries / messages, 3) if messages else None
+            usage['redis_commands_per_message'] = round(self.redis_commands / messages, 3) if messages else None
+        return usage
+
+def _active() -> List[Usage]:
+    if not hasattr(_local, 'usages'):
+        _local.usages = []
+    return _local.usages
+
+@contextmanager
+def measure() -> Iterator[Usage]:
+    """Count the queries and Redis commands made by this thread in a block.
+
+    Blocks can be nested; each counts everything made within it.
+
+    Yields:
+        Usage: The counters, complete once the block exits
+    """
+    usage = Usage()
+    _active().append(usage)
+    try:
+        with connection.execute_wrapper(usage.count_query):
+            yield usage
+    finally:
+        _active().remove(usage)
+
+def current() -> List[Usage]:
+    """Get the counters active in this thread, to attach() in another."""
+    return list(_active())
+
+@contextmanager
+def attach(usages: List[Usage]) -> Iterator:
+    """Count this thread's queries and Redis commands towards another thread's counters.
+
+    Args:
+        usages: Counters from current() in the other thread
+    """
+    if not usages:
+        yield
+        return
+    _active().extend(usages)
+    wrappers = [connection.execute_wrapper(usage.count_query) for usage in usages]
+    try:
+        for wrapper in wrappers:
+            wrapper.__enter__()
+        yield
+    finally:
+        for wrapper in reversed(wrappers):
+            wrapper.__exit__(None, None, None)
+        for usage in usages:
+            _active().remove(usage)
+
+def count_redis(count: int = 1) -> None:
+    """Count Redis commands towards the counters active in this thread."""
+    for usage in _active():
+        usage.add_redis(count)
+
+class CountingPipeline(Pipeline):
+    """Pipeline counting the commands it sends."""
+
+    def execute(self, raise_on_error=True):
+        count_redis(len(self.command_stack))
+        return super().execute(raise_on_error)
+
+    def immediate_execute_command(self, *args, **options):
+        count_redis()
+        return super().immediate_execute_command(*args, **options)
+
+class CountingRedis(Redis):
+    """Redis client counting the commands it sends."""
+
+    def execute_command(self, *args, **options):
+        count_redis()
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return CountingPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+def query_budget(stage: str) -> Optional[float]:
+    """Get a stage's budget of queries per message, None if it has none."""
+    return getattr(settings, 'PIPELINE_QUERY_BUDGETS', {}).get(stage)
+
+def over_budget(stage: str, queries: int, messages: int, runs: int = 1) -> bool:
+    """Check whether a stage made more queries than its budget allows.
+
+    Each run may make the budget's "overhead" queries (loading services,
+    claiming a batch, ...) on top of the stage's budget per message, so a
+    batch of one message isn't held to the per-message figure.
+
+    Args:
+        stage: Pipeline stage
+        queries: Queries the stage made
+        messages: Messages it handled
+        runs: Step runs the queries were made in
+
+    Returns:
+        bool: True if over budget; stages without a budget never are
+    """
+    budget = query_budget(stage)
+    if budget is None or not messages:
+        return False
+    overhead = getattr(settings, 'PIPELINE_QUERY_BUDGETS', {}).get('overhead', 0)
+    return queries > overhead * runs + budget * messages
+
+def instrumented(stage: str, count: str):
+    """Decorator adding query and Redis command counts to a step's result.
+
+    Args:
+        stage: Pipeline stage of the step (see core.metrics), whose budget applies
+        count: Key of the result holding the number of messages the step handled
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure() as usage:
+                result = func(*args, **kwargs)
+            if not isinstance(result, dict):
+                return result
+            messages = result.get(count) or 0
+            result['usage'] = usage.as_dict(messages)
+            if over_budget(stage, usage.queries, messages):
+                logger.warning(
+                    f"Step {STEP_NUMBERS.get(stage, '?')}: {stage} made {usage.queries} queries for {messages} message{'s' if messages > 1 else ''}, "
+                    f"over its budget of {query_budget(stage)} per message"
+                )
+            else:
+                logger.debug(f"Step {STEP_NUMBERS.get(stage, '?')}: {stage} made {usage.queries} queries and {usage.redis_commands} Redis commands for {messages} messages")
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand, CommandError
+import json
+import logging
+from core.benchmark import TRANSPORTS, PipelineBenchmark
+from core.tasks import redis_client
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Runs a synthetic load through Steps 1-5 in-process and reports throughput, latency and query counts as JSON'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000, help='Synthetic messages to inject')
+        parser.add_argument('--incoming-services', type=int, default=1, help='Incoming services to spread the messages over')
+        parser.add_argument('--outgoing-services', type=int, default=1, help='Outgoing services every message is sent through')
+        parser.add_argument('--users', type=int, default=10, help='Users subscribed to each outgoing service')
+        parser.add_argument('--domains', type=int, default=3, help='Recipient domains the users are spread over')
+        parser.add_argument('--body-size', type=int, default=2000, help='Characters in each message body')
+        parser.add_argument('--poll-size', type=int, default=100, help='Messages returned by each poll')
+        parser.add_argument('--latency-ms', type=float, default=0, help='Simulated latency of each fetch and send')
+        parser.add_argument('--concurrency', type=int, default=1, help='Delivery sessions per outgoing service')
+        parser.add_argument(
+            '--transport',
+            choices=TRANSPORTS,
+            default='fake',
+            help='fake: in-memory plugin; mail: the IMAP and SMTP plugins against local stand-in servers'
+        )
+        parser.add_argument('--temp-fail-rate', type=float, default=0.0, help='Share of recipients the stand-in SMTP server answers with 451')
+        parser.add_argument('--reject-rate', type=float, default=0.0, help='Share of recipients the stand-in SMTP server answers with 550')
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the seeded services, users and messages (and audit events) instead of rolling them back'
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument(
+            '--ignore-budgets',
+            action='store_true',
+            help='Don\'t fail when a step goes over its PIPELINE_QUERY_BUDGETS entry'
+        )
+    
+    def handle(self, *args, **options):
+        # Per-message INFO logging from the steps would drown the report
+        logging.getLogger('core').setLevel(logging.WARNING)
+        
+        # The steps take their locks and rate limits in Redis, so check it before seeding anything
+        try:
+            redis_client.ping()
+        except Exception as e:
+            raise CommandError(f"Redis is not reachable ({e}); the pipeline steps need it for their locks and rate limits")
+        
+        benchmark = PipelineBenchmark(
+            messages=options['messages'],
+            incoming_services=options['incoming_services'],
+            outgoing_services=options['outgoing_services'],
+            users=options['users'],
+            domains=options['domains'],
+            body_size=options['body_size'],
+            poll_size=options['poll_size'],
+            latency_ms=options['latency_ms'],
+            concurrency=options['concurrency'],
+            transport=options['transport'],
+            temp_fail_rate=options['temp_fail_rate'],
+            reject_rate=options['reject_rate'],
+            keep=options['keep']
+        )
+        report = benchmark.run()
+        output = json.dumps(report, indent=2)
+        
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(
+                f"{report['messages_per_second']} msgs/sec, {report['queries_per_message']} queries/message; "
+                f"report written to {options['output']}"
+            ))
+        else:
+            self.stdout.write(output)
+        
+        if report['deliveries'] != report['expected_deliveries']:
+            self.stderr.write(self.style.WARNING(
+                f"Only {report['deliveries']} of {report['expected_deliveries']} deliveries were made"
+            ))
+        
+        if report['over_budget'] and not options['ignore_budgets']:
+            raise CommandError('Over the query budget: ' + ', '.join(
+                f"{stage} made {report['steps'][stage]['queries_per_message']} queries per message "
+                f"(budget {report['steps'][stage]['query_budget']})"
+                for stage in report['over_budget']
+            ))
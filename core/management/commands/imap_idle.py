@@ -0,0 +1,124 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import close_old_connections, connection
+import logging
+import os
+import signal
+import socket
+import threading
+from core.models import Service
+from core.tasks import redis_client, log_audit, poll_service, idle_listener_key, release_idle_listener
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Listens for new mail with IMAP IDLE and ingests it as soon as it arrives'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--service',
+            type=int,
+            action='append',
+            help='Only listen on this service ID (can be given more than once)'
+        )
+
+    def handle(self, *args, **options):
+        # Get all IMAP services with incoming enabled
+        services = Service.objects.filter(
+            incoming_enabled=True,
+            plugin__name='imap'
+        ).select_related('plugin')
+        if options['service']:
+            services = services.filter(id__in=options['service'])
+
+        stop_event = threading.Event()
+        # Process supervisors stop us with SIGTERM; let the listeners disconnect and release their claims
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+        threads = []
+        for service in services:
+            thread = threading.Thread(
+                target=self.listen,
+                args=(service, stop_event),
+                name=f"imap-idle-{service.id}",
+                daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+
+        if not threads:
+            self.stdout.write(self.style.WARNING('No incoming IMAP services to listen on'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'Listening on {len(threads)} IMAP service{"s" if len(threads) > 1 else ""}'))
+
+        try:
+            while not stop_event.is_set() and any(thread.is_alive() for thread in threads):
+                stop_event.wait(1)
+        except KeyboardInterrupt:
+            pass
+
+        if any(thread.is_alive() for thread in threads):
+            self.stdout.write('Stopping IMAP IDLE listeners...')
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+
+    def listen(self, service, stop_event):
+        """Keep one IDLE connection open for a service until stopped.
+
+        Falls back to the polling task (by simply not claiming the service) if
+        the server does not support IDLE, and reconnects with backoff on errors.
+        """
+        heartbeat_key = idle_listener_key(service)
+        listener_id = f"{socket.gethostname()}:{os.getpid()}"
+        timeout = settings.IMAP_IDLE_TIMEOUT
+        backoff = 5
+
+        try:
+            while not stop_event.is_set():
+                plugin = None
+                try:
+                    plugin = service.get_plugin_instance()
+                    if not plugin:
+                        logger.error(f"IDLE: Could not get plugin instance for {service.name}")
+                        return
+
+                    plugin.connect(pooled=False)
+                    if not plugin.supports_idle():
+                        msg = f"IDLE: {service.name} does not support IDLE, leaving it to the polling task"
+                        logger.warning(msg)
+                        log_audit('warning', msg, service)
+                        return
+
+                    # Claim the service, then catch up on anything that arrived while we weren't listening
+                    redis_client.set(heartbeat_key, listener_id, ex=timeout + 60)
+                    log_audit('incoming_poll', f"IDLE: Listening for new mail on {service.name}", service)
+                    close_old_connections()
+                    poll_service(service, plugin=plugin)
+                    backoff = 5
+
+                    while not stop_event.is_set():
+                        plugin.connection.select(service.config.get('folder', 'INBOX'))
+                        redis_client.set(heartbeat_key, listener_id, ex=timeout + 60)
+                        if plugin.idle(timeout, stop_event):
+                            logger.info(f"IDLE: New mail on {service.name}, ingesting")
+                            close_old_connections()
+                            poll_service(service, plugin=plugin)
+
+                except Exception as e:
+                    error_msg = f"IDLE: Error listening on {service.name}: {str(e)}"
+                    logger.error(error_msg)
+                    log_audit('error', error_msg, service)
+                    stop_event.wait(backoff)
+                    backoff = min(backoff * 2, 300)
+                finally:
+                    # Let the polling task take over while we are not connected, unless
+                    # another listener has claimed the service since
+                    try:
+                        release_idle_listener(service, listener_id)
+                    except Exception as e:
+                        logger.error(f"IDLE: Error releasing {heartbeat_key}: {e}")
+                    if plugin:
+                        plugin.disconnect()
+        finally:
+            connection.close()
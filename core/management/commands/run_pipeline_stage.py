@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+import logging
+import threading
+from core.streams import STAGES, StageConsumer
+from core.tasks import redis_client
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Consumes one pipeline stage from its Redis stream (PIPELINE_TRANSPORT = "streams")'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'stage',
+            choices=list(STAGES),
+            help='Pipeline stage to consume'
+        )
+        parser.add_argument(
+            '--consumer',
+            help='Consumer name within the stage\'s group (defaults to host:pid)'
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=1,
+            help='Number of consumers to run in this process'
+        )
+
+    def handle(self, *args, **options):
+        stage = options['stage']
+        stop_event = threading.Event()
+        threads = []
+        for index in range(max(1, options['threads'])):
+            consumer = StageConsumer(redis_client, stage, consumer=options['consumer'])
+            if options['threads'] > 1:
+                consumer.consumer = f"{consumer.consumer}:{index}"
+            thread = threading.Thread(
+                target=consumer.run_forever,
+                args=(stop_event,),
+                name=f"pipeline-{stage}-{index}",
+                daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+
+        self.stdout.write(self.style.SUCCESS(f'Consuming pipeline stage {stage} with {len(threads)} consumer{"s" if len(threads) > 1 else ""}'))
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write(f'Stopping pipeline stage {stage}...')
+            stop_event.set()
+            for thread in threads:
+                thread.join(timeout=10)
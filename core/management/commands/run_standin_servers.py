@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+import logging
+import time
+from core.standins import StandInIMAPServer, StandInSMTPServer, make_message
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Runs the stand-in IMAP and SMTP servers (see core.standins) until interrupted, for local testing'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+        parser.add_argument('--imap-port', type=int, default=1143, help='IMAP port')
+        parser.add_argument('--smtp-port', type=int, default=1025, help='SMTP port')
+        parser.add_argument('--messages', type=int, default=0, help='Generated messages to start the INBOX with')
+        parser.add_argument('--body-size', type=int, default=2000, help='Characters in each generated body')
+        parser.add_argument('--latency-ms', type=float, default=0, help='Delay before every reply')
+        parser.add_argument('--no-idle', action='store_true', help='Don\'t advertise IMAP IDLE')
+        parser.add_argument('--temp-fail-rate', type=float, default=0.0, help='Share of recipients answered with 451')
+        parser.add_argument('--reject-rate', type=float, default=0.0, help='Share of recipients answered with 550')
+        parser.add_argument(
+            '--add-every',
+            type=float,
+            default=0,
+            help='Add a generated message to the INBOX every this many seconds (to exercise IDLE)'
+        )
+    
+    def handle(self, *args, **options):
+        latency = options['latency_ms'] / 1000
+        imap = StandInIMAPServer(
+            options['host'],
+            options['imap_port'],
+            messages=options['messages'],
+            body_size=options['body_size'],
+            latency=latency,
+            idle=not options['no_idle']
+        )
+        smtp = StandInSMTPServer(
+            options['host'],
+            options['smtp_port'],
+            latency=latency,
+            temp_fail_rate=options['temp_fail_rate'],
+            reject_rate=options['reject_rate'],
+            keep_messages=False
+        )
+        with imap, smtp:
+            self.stdout.write(self.style.SUCCESS(
+                f'Stand-in IMAP on {imap.host}:{imap.port} ({options["messages"]} messages), '
+                f'SMTP on {smtp.host}:{smtp.port}; any login is accepted'
+            ))
+            added = 0
+            try:
+                while True:
+                    time.sleep(options['add_every'] or 1)
+                    if options['add_every']:
+                        imap.add_messages('INBOX', [make_message(options['messages'] + added, options['body_size'])])
+                        added += 1
+            except KeyboardInterrupt:
+                self.stdout.write(f'Stopping; SMTP stats: {smtp.stats}')
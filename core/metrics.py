@@ -0,0 +1,183 @@
+"""
+Pipeline stage timings and Prometheus metrics.
+
+Each step stamps the message rows it writes in step_processing_time:
+    {"ingested": {"start": "<iso>", "end": "<iso>", "seconds": 1.5}, ...}
+A stage starts when a step writes its output and ends when the next step
+picks the message up, so the durations say how long messages wait between
+and inside the steps:
+    ingest: Fetching and storing a batch in Step 1
+    standardize: Ingested until standardized (Step 2)
+    format: Standardized until formatted for each outgoing service (Step 3)
+    queue: Formatted until queued for the service's users (Step 4)
+    send: Queued until every copy has been sent (Step 5)
+
+The same durations, with per-service throughput, error and retry counts,
+are aggregated in Redis hashes so that every Celery worker adds to the same
+series, and rendered in the Prometheus text format by the /metrics view.
+Recording never gets in the way of the pipeline: if Redis is unavailable the
+observations are dropped.
+"""
+
+import json
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+KEY_PREFIX = 'metrics'
+
+# Metric name -> (type, help)
+METRICS = {
+    'raingull_stage_duration_seconds': ('histogram', 'Time messages spend in each pipeline stage'),
+    'raingull_messages_total': ('counter', 'Messages that completed each pipeline stage'),
+    'raingull_errors_total': ('counter', 'Errors while processing messages in each pipeline stage'),
+    'raingull_retries_total': ('counter', 'Failed deliveries scheduled for another attempt'),
+    'raingull_deferred_total': ('counter', 'Deliveries put off by a rate limit'),
+}
+
+def stage_buckets() -> Tuple[float, ...]:
+    """Get the histogram bucket bounds in seconds (METRICS_STAGE_BUCKETS)."""
+    return tuple(sorted(getattr(settings, 'METRICS_STAGE_BUCKETS', DEFAULT_BUCKETS)))
+
+def start_stage(now: Optional[datetime] = None) -> Dict:
+    """Get the step_processing_time entry for a stage starting now."""
+    return {'start': (now or timezone.now()).isoformat(), 'end': None}
+
+def finish_stage(message, key: str, now: Optional[datetime] = None) -> Optional[float]:
+    """Stamp the end of a stage on a message and get its duration.
+    
+    The caller saves the message (step_processing_time must be among the
+    fields it saves).
+    
+    Args:
+        message: Message whose stage ended
+        key: step_processing_time key of the stage, e.g. "ingested"
+        now: When the stage ended, defaults to now
+    
+    Returns:
+        float: Seconds the stage took, or None if it wasn't started or has already ended
+    """
+    processing_time = message.step_processing_time or {}
+    timing = processing_time.get(key)
+    if not timing or timing.get('end') or not timing.get('start'):
+        return None
+    start = parse_datetime(timing['start'])
+    if start is None:
+        return None
+    now = now or timezone.now()
+    seconds = max(0.0, (now - start).total_seconds())
+    timing['end'] = now.isoformat()
+    timing['seconds'] = round(seconds, 6)
+    message.step_processing_time = processing_time
+    return seconds
+
+def _field(labels: Dict[str, str], suffix: str = '') -> str:
+    """Encode labels (and a histogram suffix) as a hash field."""
+    return json.dumps([sorted(labels.items()), suffix])
+
+def record(client, stage: str, service=None, durations: Iterable[float] = (), count: Optional[int] = None,
+           errors: int = 0, retries: int = 0, deferred: int = 0) -> None:
+    """Add one step run's observations to the shared metrics.
+    
+    Args:
+        client: Redis client holding the metrics
+        stage: Stage label: ingest, standardize, format, queue or send
+        service: Service the messages were processed for
+        durations: Stage durations in seconds, one per message
+        count: Messages that completed the stage, defaults to the number of durations
+        errors: Errors during the run
+        retries: Failures scheduled for another attempt
+        deferred: Sends put off by a rate limit
+    """
+    durations = [duration for duration in durations if duration is not None]
+    count = len(durations) if count is None else count
+    if not (durations or count or errors or retries or deferred):
+        return
+    labels = {'stage': stage, 'service': service.name if service else ''}
+    try:
+        pipe = client.pipeline(transaction=False)
+        if durations:
+            key = f"{KEY_PREFIX}:raingull_stage_duration_seconds"
+            buckets = stage_buckets()
+            # One command per bucket rather than per message
+            counts = Counter(next((str(bound) for bound in buckets if duration <= bound), '+Inf') for duration in durations)
+            for bucket, bucket_count in counts.items():
+                pipe.hincrby(key, _field(labels, bucket), bucket_count)
+            pipe.hincrbyfloat(key, _field(labels, 'sum'), sum(durations))
+            pipe.hincrby(key, _field(labels, 'count'), len(durations))
+        for name, value in (
+            ('raingull_messages_total', count),
+            ('raingull_errors_total', errors),
+            ('raingull_retries_total', retries),
+            ('raingull_deferred_total', deferred),
+        ):
+            if value:
+                pipe.hincrby(f"{KEY_PREFIX}:{name}", _field(labels), value)
+        pipe.execute()
+    except Exception as e:
+        logger.debug(f"Could not record {stage} metrics: {e}")
+
+def _label_text(labels: List, extra: str = '') -> str:
+    """Format labels as {name="value",...}."""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+def _number(value: float) -> str:
+    """Format a sample value without losing precision on large counts."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def render(client) -> str:
+    """Render every metric in the Prometheus text exposition format.
+    
+    Args:
+        client: Redis client holding the metrics
+    
+    Returns:
+        str: The exposition text
+    """
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        values = {}
+        for field, value in client.hgetall(f"{KEY_PREFIX}:{name}").items():
+            labels, suffix = json.loads(_decode(field))
+            values.setdefault(tuple(map(tuple, labels)), {})[suffix] = float(_decode(value))
+        for labels, series in sorted(values.items()):
+            labels = list(labels)
+            if metric_type == 'counter':
+                lines.append(f"{name}{_label_text(labels)} {_number(series.get('', 0))}")
+                continue
+            # Histogram buckets are stored per bucket and exported cumulatively
+            cumulative = 0
+            for bound in stage_buckets():
+                cumulative += series.get(str(bound), 0)
+                le = f'le="{bound:g}"'
+                lines.append(f"{name}_bucket{_label_text(labels, le)} {_number(cumulative)}")
+            cumulative += series.get('+Inf', 0)
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{_label_text(labels, le)} {_number(cumulative)}")
+            lines.append(f"{name}_sum{_label_text(labels)} {_number(series.get('sum', 0))}")
+            lines.append(f"{name}_count{_label_text(labels)} {_number(series.get('count', 0))}")
+    return '\n'.join(lines) + '\n'
+
+def reset(client) -> None:
+    """Delete every recorded metric (e.g. before a benchmark run)."""
+    client.delete(*[f"{KEY_PREFIX}:{name}" for name in METRICS])
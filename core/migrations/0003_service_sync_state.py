@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_messagequeue_service_messagequeue_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('folder', models.CharField(max_length=255)),
+                ('uidvalidity', models.BigIntegerField(blank=True, null=True)),
+                ('last_uid', models.BigIntegerField(default=0, help_text='Highest UID that has been fully handled')),
+                ('highest_modseq', models.BigIntegerField(blank=True, help_text='HIGHESTMODSEQ seen at the last sync (CONDSTORE servers only)', null=True)),
+                ('last_full_sync_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'core_service_sync_state',
+            },
+        ),
+        migrations.AddField(
+            model_name='servicesyncstate',
+            name='service',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_states', to='core.service'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='servicesyncstate',
+            unique_together={('service', 'folder')},
+        ),
+    ]
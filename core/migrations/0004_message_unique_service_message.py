@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:03
+
+from django.db import migrations, models
+
+
+def remove_duplicate_messages(apps, schema_editor):
+    """Keep only the first ingested copy of each message before adding the constraint."""
+    Message = apps.get_model('core', 'Message')
+    duplicates = (
+        Message.objects.filter(source_service__isnull=True, service_message_id__isnull=False)
+        .values('service_id', 'service_message_id', 'direction')
+        .annotate(first_id=models.Min('id'), count=models.Count('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        Message.objects.filter(
+            source_service__isnull=True,
+            service_id=duplicate['service_id'],
+            service_message_id=duplicate['service_message_id'],
+            direction=duplicate['direction'],
+        ).exclude(id=duplicate['first_id']).delete()
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_service_sync_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_messages, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_service__isnull', True)), fields=('service', 'service_message_id', 'direction'), name='unique_service_message'),
+        ),
+    ]
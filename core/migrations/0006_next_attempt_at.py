@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:16
+
+from datetime import timedelta
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def schedule_failed_retries(apps, schema_editor):
+    """Give failed rows the next attempt the old in-task backoff would have computed."""
+    for model_name in ('Message', 'MessageQueue'):
+        model = apps.get_model('core', model_name)
+        model.objects.filter(status='failed', retry_count__gte=settings.MAX_MESSAGE_RETRIES).update(next_attempt_at=None)
+        rows = []
+        for row in model.objects.filter(
+            status='failed',
+            retry_count__lt=settings.MAX_MESSAGE_RETRIES,
+            last_retry_at__isnull=False,
+        ).only('id', 'retry_count', 'last_retry_at').iterator():
+            delay = min(settings.MAX_RETRY_DELAY, settings.MIN_RETRY_DELAY * (2 ** row.retry_count))
+            row.next_attempt_at = row.last_retry_at + timedelta(minutes=delay)
+            rows.append(row)
+        model.objects.bulk_update(rows, ['next_attempt_at'], batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_row_claims'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, help_text='When the message may next be attempted; empty once retries are used up (see core.retry)', null=True),
+        ),
+        migrations.AddField(
+            model_name='messagequeue',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, help_text='When delivery may next be attempted; empty once retries are used up (see core.retry)', null=True),
+        ),
+        migrations.RunPython(schedule_failed_retries, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='core_messag_status_b9f6fe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messagequeue',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='core_messag_status_16ea81_idx'),
+        ),
+    ]
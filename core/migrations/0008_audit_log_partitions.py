@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:21
+
+from datetime import datetime, time, timedelta, timezone
+
+from django.db import migrations, models
+
+
+def partition_audit_log(apps, schema_editor):
+    """Turn core_audit_log into a table partitioned by day on PostgreSQL.
+
+    Existing events go to the default partition, apart from today's, which go
+    to today's partition; the maintenance task creates partitions from then on.
+    Other databases keep the plain table (see core.audit_storage).
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    today = datetime.now(timezone.utc).date()
+    statements = [
+        'ALTER TABLE "core_audit_log" RENAME TO "core_audit_log_unpartitioned"',
+        'ALTER INDEX "core_audit_log_pkey" RENAME TO "core_audit_log_unpartitioned_pkey"',
+        'CREATE SEQUENCE "core_audit_log_partitioned_id_seq"',
+        # The primary key of a partitioned table has to include the partition key
+        '''CREATE TABLE "core_audit_log" (
+            "id" bigint NOT NULL DEFAULT nextval('core_audit_log_partitioned_id_seq'),
+            "event_type" varchar(50) NOT NULL,
+            "status" varchar(20) NOT NULL,
+            "details" text NOT NULL,
+            "created_at" timestamp with time zone NOT NULL,
+            PRIMARY KEY ("id", "created_at")
+        ) PARTITION BY RANGE ("created_at")''',
+        'ALTER SEQUENCE "core_audit_log_partitioned_id_seq" OWNED BY "core_audit_log"."id"',
+        'CREATE TABLE "core_audit_log_default" PARTITION OF "core_audit_log" DEFAULT',
+    ]
+    for offset in range(4):
+        day = today + timedelta(days=offset)
+        start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+        statements.append(
+            f'CREATE TABLE "core_audit_log_p{day:%Y%m%d}" PARTITION OF "core_audit_log" '
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{(start + timedelta(days=1)).isoformat()}')"
+        )
+    statements += [
+        'INSERT INTO "core_audit_log" ("id", "event_type", "status", "details", "created_at") '
+        'SELECT "id", "event_type", "status", "details", "created_at" FROM "core_audit_log_unpartitioned"',
+        'SELECT setval(\'core_audit_log_partitioned_id_seq\', COALESCE((SELECT MAX("id") FROM "core_audit_log"), 0) + 1, false)',
+        'DROP TABLE "core_audit_log_unpartitioned"',
+    ]
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_audit_log_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(help_text='Start of the hour (UTC)')),
+                ('event_type', models.CharField(max_length=50)),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'core_audit_log_rollup',
+            },
+        ),
+        migrations.RunPython(partition_audit_log, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['created_at'], name='core_audit__created_ab8951_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['event_type', 'created_at'], name='core_audit__event_t_65ccf4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlogrollup',
+            index=models.Index(fields=['hour'], name='core_audit__hour_d07414_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='auditlogrollup',
+            unique_together={('hour', 'event_type', 'status')},
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:10
+
+from django.db import migrations, models
+
+
+def remove_duplicate_entries(apps, schema_editor):
+    """Keep only the first queue entry for each message and user before adding the constraint."""
+    MessageQueue = apps.get_model('core', 'MessageQueue')
+    duplicates = (
+        MessageQueue.objects.values('message_id', 'user_id')
+        .annotate(first_id=models.Min('id'), count=models.Count('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        MessageQueue.objects.filter(
+            message_id=duplicate['message_id'],
+            user_id=duplicate['user_id'],
+        ).exclude(id=duplicate['first_id']).delete()
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_entries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='messagequeue',
+            constraint=models.UniqueConstraint(fields=('message', 'user'), name='unique_message_queue_entry'),
+        ),
+    ]
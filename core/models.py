@@ -3,8 +3,6 @@ from django.contrib.auth.models import AbstractUser
 import uuid
 from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-import json
-import os
 from django.utils import timezone
 from django.apps import apps
 from django.conf import settings
@@ -73,6 +71,41 @@ class PluginInterface(BasePlugin):
         # Send the message
         return self._send_message(formatted_payload)
         
+    def send_bulk(self, message: 'Message', recipients: List[str]) -> Dict[str, Any]:
+        """Send one message to several recipients.
+        
+        Plugins that can deliver one body to many recipients at once (e.g.
+        SMTP) override this. The default sends a separate copy to each
+        recipient through _send_message.
+        
+        Args:
+            message (Message): The message to send
+            recipients (list): Recipient addresses
+            
+        Returns:
+            dict: A core.delivery.RecipientResult for each recipient
+        """
+        from core.delivery import RecipientResult
+        
+        results = {}
+        for recipient in recipients:
+            message_payload = {
+                'content': message.payload.get('content', ''),
+                'attachments': message.attachments or message.payload.get('attachments', []),
+                'sender': message.sender,
+                'recipient': recipient,
+                'subject': message.subject,
+                'metadata': message.payload.get('metadata', {})
+            }
+            if hasattr(self, 'format_for_outgoing'):
+                message_payload = self.format_for_outgoing(message_payload)
+            try:
+                success = self._send_message(message_payload)
+                results[recipient] = RecipientResult(recipient, success, error=None if success else "Send failed")
+            except Exception as e:
+                results[recipient] = RecipientResult(recipient, False, error=str(e))
+        return results
+        
     def test_connection(self) -> bool:
         """Test the connection to the service.
         
@@ -183,71 +216,22 @@ class Plugin(models.Model):
         return f"{self.friendly_name} ({self.name}) v{self.version}"
 
     def get_manifest(self):
-        try:
-            manifest_path = os.path.join(settings.BASE_DIR, 'plugins', self.name, 'manifest.json')
-            logger.debug(f"Loading manifest from {manifest_path}")
-            with open(manifest_path, 'r') as f:
-                manifest = json.load(f)
-                logger.debug(f"Successfully loaded manifest for plugin {self.name}: {manifest}")
-                return manifest
-        except Exception as e:
-            logger.error(f"Error loading manifest for plugin {self.name}: {e}", exc_info=True)
-            return None
+        """Get the plugin manifest from the process-wide plugin registry.
+        
+        Returns:
+            dict: The plugin manifest, or None if it could not be loaded
+        """
+        from core.plugin_registry import plugin_registry
+        return plugin_registry.get_manifest(self.name)
 
     def get_plugin_class(self):
-        """Get the plugin class for this plugin.
+        """Get the plugin class from the process-wide plugin registry.
         
         Returns:
             The plugin class if found, None otherwise
         """
-        try:
-            module_path = f'plugins.{self.name}.plugin'
-            logger.debug(f"Loading plugin class from {module_path}")
-            
-            # Check if the module exists
-            import importlib.util
-            spec = importlib.util.find_spec(module_path)
-            if spec is None:
-                logger.error(f"Module {module_path} not found in Python path")
-                return None
-                
-            logger.debug(f"Found module spec: {spec}")
-            
-            # Import the module
-            module = importlib.import_module(module_path)
-            logger.debug(f"Imported module: {module}")
-            
-            # Look for a class that is a subclass of PluginInterface
-            plugin_class = None
-            for name, obj in module.__dict__.items():
-                if (isinstance(obj, type) and 
-                    issubclass(obj, PluginInterface) and 
-                    obj != PluginInterface and 
-                    obj.__module__ == module_path):
-                    plugin_class = obj
-                    logger.debug(f"Found plugin class {name} in {module_path}")
-                    break
-                    
-            if not plugin_class:
-                logger.error(f"No plugin class found in {module_path}")
-                return None
-                
-            # Verify the plugin class implements all required methods
-            required_methods = ['get_manifest', 'fetch_messages', 'send_message', 'test_connection']
-            missing_methods = [method for method in required_methods if not hasattr(plugin_class, method)]
-            if missing_methods:
-                logger.error(f"Plugin class {plugin_class.__name__} is missing required methods: {', '.join(missing_methods)}")
-                return None
-                
-            logger.debug(f"Successfully loaded plugin class {plugin_class.__name__}")
-            return plugin_class
-            
-        except ImportError as e:
-            logger.error(f"Error importing plugin module {module_path}: {str(e)}")
-            return None
-        except Exception as e:
-            logger.error(f"Error loading plugin class: {str(e)}", exc_info=True)
-            return None
+        from core.plugin_registry import plugin_registry
+        return plugin_registry.get_plugin_class(self.name)
 
     def get_plugin_instance(self, service_instance=None):
         try:
@@ -322,6 +306,34 @@ class Service(models.Model):
         """Get an instance of the plugin for this service."""
         return self.plugin.get_plugin_instance(service_instance=self)
 
+class ServiceSyncState(models.Model):
+    """Incremental sync checkpoint for a service folder.
+
+    Used by polling plugins (e.g. IMAP) to remember how far a folder has been
+    read, so each poll only fetches what arrived since the last one.
+    """
+    service = models.ForeignKey('Service', on_delete=models.CASCADE, related_name='sync_states')
+    folder = models.CharField(max_length=255)
+    uidvalidity = models.BigIntegerField(null=True, blank=True)
+    last_uid = models.BigIntegerField(default=0, help_text="Highest UID that has been fully handled")
+    highest_modseq = models.BigIntegerField(null=True, blank=True, help_text="HIGHESTMODSEQ seen at the last sync (CONDSTORE servers only)")
+    last_full_sync_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('service', 'folder')
+        db_table = 'core_service_sync_state'
+
+    def __str__(self):
+        return f"{self.service.name}:{self.folder} (UIDVALIDITY {self.uidvalidity}, last UID {self.last_uid})"
+
+    def reset(self, uidvalidity=None):
+        """Forget the checkpoint so the next sync re-reads the whole folder."""
+        self.uidvalidity = uidvalidity
+        self.last_uid = 0
+        self.highest_modseq = None
+        self.last_full_sync_at = timezone.now()
+
 class Message(models.Model):
     """Unified message model for all messages in the system."""
     raingull_id = models.UUIDField(default=uuid.uuid4, editable=False, db_index=True)
@@ -354,6 +366,7 @@ class Message(models.Model):
     attachments = models.JSONField(default=list, blank=True)
     retry_count = models.IntegerField(default=0)
     last_retry_at = models.DateTimeField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True, default=timezone.now, help_text="When the message may next be attempted; empty once retries are used up (see core.retry)")
     error_message = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -382,6 +395,10 @@ class Message(models.Model):
         default=dict,
         help_text="Time spent in each processing step (in seconds)"
     )
+    
+    # Worker lease while a pipeline step processes this message (see core.claims)
+    claimed_by = models.CharField(max_length=64, null=True, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True, db_index=True)
 
     class Meta:
         db_table = 'core_messages'
@@ -389,15 +406,33 @@ class Message(models.Model):
             models.Index(fields=['service', 'direction', 'status']),
             models.Index(fields=['timestamp']),
             models.Index(fields=['service_message_id']),
+            models.Index(fields=['status', 'next_attempt_at']),
+            # Keyset pagination in the message browser (see core.pagination)
+            models.Index(fields=['created_at', 'id']),
+        ]
+        constraints = [
+            # One ingested row per message per service; copies made by later steps set source_service
+            models.UniqueConstraint(
+                fields=['service', 'service_message_id', 'direction'],
+                condition=models.Q(source_service__isnull=True),
+                name='unique_service_message'
+            ),
         ]
 
     def __str__(self):
         return f"{self.direction.title()} message via {self.service.name} [{self.status}]"
 
-    def increment_retry(self):
-        """Increment retry count and update last retry timestamp."""
+    def increment_retry(self, policy=None):
+        """Increment retry count and schedule the next attempt.
+        
+        Args:
+            policy: RetryPolicy to schedule with, defaults to the service's
+        """
+        from core.retry import RetryPolicy
+        policy = policy or RetryPolicy.for_service(self.service)
         self.retry_count += 1
         self.last_retry_at = timezone.now()
+        self.next_attempt_at = policy.next_attempt_at(self.retry_count, self.last_retry_at)
         self.save()
 
 class MessageQueue(models.Model):
@@ -418,23 +453,40 @@ class MessageQueue(models.Model):
     )
     retry_count = models.IntegerField(default=0)
     last_retry_at = models.DateTimeField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True, default=timezone.now, help_text="When delivery may next be attempted; empty once retries are used up (see core.retry)")
     error_message = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    
+    # Worker lease while Step 5 delivers this entry (see core.claims)
+    claimed_by = models.CharField(max_length=64, null=True, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True, db_index=True)
 
     class Meta:
         db_table = 'core_message_queue'
         indexes = [
             models.Index(fields=['status', 'priority', 'created_at']),
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+        constraints = [
+            # One entry per message per recipient, so Step 4 can bulk insert with ignore_conflicts
+            models.UniqueConstraint(fields=['message', 'user'], name='unique_message_queue_entry'),
         ]
 
     def __str__(self):
         return f"Queue entry for {self.message}"
 
-    def increment_retry(self):
-        """Increment the retry count and update last_retry_at"""
+    def increment_retry(self, policy=None):
+        """Increment the retry count and schedule the next attempt
+        
+        Args:
+            policy: RetryPolicy to schedule with, defaults to the service's
+        """
+        from core.retry import RetryPolicy
+        policy = policy or RetryPolicy.for_service(self.service)
         self.retry_count += 1
         self.last_retry_at = timezone.now()
+        self.next_attempt_at = policy.next_attempt_at(self.retry_count, self.last_retry_at)
         self.save()
 
 class UserService(models.Model):
@@ -458,14 +510,41 @@ class AuditLog(models.Model):
     event_type = models.CharField(max_length=50)
     status = models.CharField(max_length=20)
     details = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens, not when the buffered write reaches the database (see core.audit)
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
+        # Partitioned by day on PostgreSQL (see core.audit_storage)
         db_table = 'core_audit_log'
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['event_type', 'created_at']),
+        ]
 
     def __str__(self):
         return f"{self.event_type} - {self.status}"
 
+class AuditLogRollup(models.Model):
+    """Hourly count of audit events per event type and status.
+
+    Written by the audit log maintenance task so that dashboards don't have to
+    scan raw AuditLog rows (see core.audit_storage).
+    """
+    hour = models.DateTimeField(help_text="Start of the hour (UTC)")
+    event_type = models.CharField(max_length=50)
+    status = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'core_audit_log_rollup'
+        unique_together = ('hour', 'event_type', 'status')
+        indexes = [
+            models.Index(fields=['hour']),
+        ]
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} {self.event_type} - {self.status}: {self.count}"
+
 class ServiceMessageTemplate(models.Model):
     class MessageType(models.TextChoices):
         INVITATION = 'invitation', 'Invitation'
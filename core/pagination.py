@@ -0,0 +1,153 @@
+"""
+Keyset (cursor) pagination for large, append-mostly tables.
+
+OFFSET paging makes the database read and throw away every row before the
+page, so deep pages of AuditLog or Message get slower as the table grows.
+KeysetPaginator instead orders by (created_at, id) and asks for the rows
+before (or after) the last row shown, which is a range scan on the
+(created_at, id) index and costs the same on page 1 and page 100,000. There
+are no page numbers or total counts, only "older" and "newer" links carrying
+an opaque cursor.
+
+EstimatedCountPaginator is for the admin changelists, which page with OFFSET
+and can't use keysets; it at least avoids a COUNT(*) over the whole table.
+"""
+
+import base64
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    """Encode a row's position as an opaque, URL-safe cursor."""
+    raw = json.dumps([created_at.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    """Decode a cursor made by encode_cursor.
+    
+    Args:
+        cursor: Cursor from a request
+    
+    Returns:
+        tuple: (created_at, id), or None if the cursor is missing or invalid
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, pk = json.loads(raw)
+        created_at = parse_datetime(created_at)
+        if created_at is None:
+            return None
+        return created_at, int(pk)
+    except (ValueError, TypeError):
+        return None
+
+@dataclass
+class KeysetPage:
+    """One page of rows, newest first, with cursors for the neighbouring pages."""
+    object_list: List = field(default_factory=list)
+    next_cursor: Optional[str] = None  # Older rows
+    previous_cursor: Optional[str] = None  # Newer rows
+    
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+    
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+    
+    def __iter__(self):
+        return iter(self.object_list)
+    
+    def __len__(self):
+        return len(self.object_list)
+
+class KeysetPaginator:
+    """Pages through a queryset newest first by (created_at, id)."""
+    
+    def __init__(self, queryset: QuerySet, per_page: int = 50):
+        """Initialize the paginator.
+        
+        Args:
+            queryset: Rows to page through; any ordering on it is replaced
+            per_page: Rows per page
+        """
+        self.queryset = queryset
+        self.per_page = per_page
+    
+    def page(self, after: Optional[str] = None, before: Optional[str] = None) -> KeysetPage:
+        """Get a page of rows.
+        
+        Args:
+            after: Cursor of the last row on the previous page; returns the rows older than it
+            before: Cursor of the first row on the next page; returns the rows newer than it
+        
+        Returns:
+            KeysetPage: The rows, newest first; the first page if neither cursor is valid
+        """
+        position = decode_cursor(before)
+        if position is not None:
+            created_at, pk = position
+            rows = list(
+                self.queryset
+                .filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+                .order_by('created_at', 'pk')[:self.per_page + 1]
+            )
+            has_newer = len(rows) > self.per_page
+            if not has_newer and len(rows) < self.per_page:
+                # Back at the newest rows; show a full first page instead
+                return self.page()
+            rows = rows[:self.per_page][::-1]
+            has_older = True
+        else:
+            position = decode_cursor(after)
+            queryset = self.queryset
+            if position is not None:
+                created_at, pk = position
+                queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+            rows = list(queryset.order_by('-created_at', '-pk')[:self.per_page + 1])
+            has_older = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_newer = position is not None
+        
+        page = KeysetPage(object_list=rows)
+        if rows and has_older:
+            page.next_cursor = encode_cursor(rows[-1].created_at, rows[-1].pk)
+        if rows and has_newer:
+            page.previous_cursor = encode_cursor(rows[0].created_at, rows[0].pk)
+        return page
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that uses PostgreSQL's row estimate for unfiltered querysets.
+    
+    An exact count of a table with tens of millions of rows takes seconds on
+    PostgreSQL; the planner's estimate is free and close enough for the
+    number of pages. Filtered querysets and other databases are counted.
+    """
+    
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            connection = connections[queryset.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                        [queryset.model._meta.db_table]
+                    )
+                    row = cursor.fetchone()
+                # reltuples is -1 (or 0) until the table has been analyzed
+                if row and row[0] > 1000:
+                    return row[0]
+        return super().count
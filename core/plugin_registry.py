@@ -0,0 +1,250 @@
+"""
+Process-wide registry of plugin classes and manifests.
+
+Looking a plugin up by name used to import the module, scan it for the plugin
+class and re-read manifest.json on every call. The registry does that work
+once per process and serves later lookups from memory.
+
+Entries are invalidated when plugin.py or manifest.json changes on disk. To
+keep the filesystem off the hot path, the modification times are compared at
+most once every PLUGIN_REGISTRY_CHECK_INTERVAL seconds per plugin. A changed
+plugin.py is only re-imported with DEBUG on: reloading swaps out class
+objects that other threads may be using, so workers pick up new plugin code
+when they restart.
+
+Plugins can also be registered directly with register(), e.g. by tests or
+benchmarks that inject a fake plugin. Registered plugins are never reloaded.
+"""
+
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, Type
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+class PluginEntry:
+    """A loaded plugin: its class, parsed manifest and the file state it was loaded from."""
+    
+    __slots__ = ('name', 'plugin_class', 'manifest', 'mtimes', 'checked_at', 'injected')
+    
+    def __init__(self, name: str, plugin_class: Optional[Type], manifest: Optional[Dict[str, Any]],
+                 mtimes: Optional[Dict[str, Optional[float]]] = None, injected: bool = False):
+        self.name = name
+        self.plugin_class = plugin_class
+        self.manifest = manifest
+        self.mtimes = mtimes or {}
+        self.checked_at = time.monotonic()
+        self.injected = injected
+
+class PluginRegistry:
+    """Caches plugin classes and manifests by plugin name."""
+    
+    def __init__(self, plugins_dir: Optional[str] = None, check_interval: Optional[float] = None):
+        """Initialize the registry.
+        
+        Args:
+            plugins_dir: Directory containing the plugin packages, defaults to BASE_DIR/plugins
+            check_interval: Seconds between mtime checks for a plugin, defaults to
+                PLUGIN_REGISTRY_CHECK_INTERVAL
+        """
+        self._plugins_dir = plugins_dir
+        self._check_interval = check_interval
+        self._entries: Dict[str, PluginEntry] = {}
+        self._lock = threading.RLock()
+    
+    @property
+    def plugins_dir(self) -> str:
+        return self._plugins_dir or os.path.join(settings.BASE_DIR, 'plugins')
+    
+    @property
+    def check_interval(self) -> float:
+        if self._check_interval is not None:
+            return self._check_interval
+        return getattr(settings, 'PLUGIN_REGISTRY_CHECK_INTERVAL', 5)
+    
+    def get(self, name: str) -> Optional[PluginEntry]:
+        """Get the registry entry for a plugin, loading or reloading it if needed.
+        
+        Args:
+            name: Plugin name (the package name under plugins/)
+        
+        Returns:
+            PluginEntry, or None if the plugin has neither a class nor a manifest
+        """
+        entry = self._entries.get(name)
+        if entry is not None and (entry.injected or time.monotonic() - entry.checked_at < self.check_interval):
+            return entry
+        
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and not entry.injected:
+                mtimes = self._file_mtimes(name)
+                if mtimes == entry.mtimes:
+                    entry.checked_at = time.monotonic()
+                else:
+                    code_changed = mtimes['plugin.py'] != entry.mtimes.get('plugin.py')
+                    if code_changed and not settings.DEBUG:
+                        logger.warning(f"Plugin {name} code changed on disk, restart the workers to load it")
+                    logger.info(f"Plugin {name} changed on disk, reloading")
+                    entry = self._load(name, mtimes, reload_module=code_changed and settings.DEBUG)
+            elif entry is None:
+                entry = self._load(name, self._file_mtimes(name))
+        
+        if entry.plugin_class is None and entry.manifest is None:
+            return None
+        return entry
+    
+    def get_plugin_class(self, name: str) -> Optional[Type]:
+        """Get the plugin class for a plugin name.
+        
+        Args:
+            name: Plugin name
+        
+        Returns:
+            The plugin class if found, None otherwise
+        """
+        entry = self.get(name)
+        return entry.plugin_class if entry else None
+    
+    def get_manifest(self, name: str) -> Optional[Dict[str, Any]]:
+        """Get the parsed manifest for a plugin name.
+        
+        The manifest is shared by every caller in the process and must not be modified.
+        
+        Args:
+            name: Plugin name
+        
+        Returns:
+            dict: The plugin manifest, or None if it could not be loaded
+        """
+        entry = self.get(name)
+        return entry.manifest if entry else None
+    
+    def register(self, name: str, plugin_class: Type, manifest: Optional[Dict[str, Any]] = None) -> None:
+        """Register a plugin that does not live under plugins/, or override one that does.
+        
+        Args:
+            name: Plugin name to register under
+            plugin_class: The plugin class
+            manifest: The plugin manifest
+        """
+        with self._lock:
+            self._entries[name] = PluginEntry(name, plugin_class, manifest or {}, injected=True)
+        logger.debug(f"Registered plugin {name} ({plugin_class.__name__})")
+    
+    def unregister(self, name: str) -> None:
+        """Forget a plugin, so the next lookup loads it from disk again.
+        
+        Args:
+            name: Plugin name
+        """
+        with self._lock:
+            self._entries.pop(name, None)
+    
+    def clear(self) -> None:
+        """Forget all plugins."""
+        with self._lock:
+            self._entries.clear()
+    
+    def _file_mtimes(self, name: str) -> Dict[str, Optional[float]]:
+        """Get the modification times of a plugin's manifest.json and plugin.py."""
+        mtimes = {}
+        for filename in ('manifest.json', 'plugin.py'):
+            try:
+                mtimes[filename] = os.stat(os.path.join(self.plugins_dir, name, filename)).st_mtime
+            except OSError:
+                mtimes[filename] = None
+        return mtimes
+    
+    def _load(self, name: str, mtimes: Dict[str, Optional[float]], reload_module: bool = False) -> PluginEntry:
+        """Load a plugin's manifest and class and store the entry. Caller holds the lock."""
+        entry = PluginEntry(name, self._load_class(name, reload_module), self._load_manifest(name), mtimes)
+        self._entries[name] = entry
+        return entry
+    
+    def _load_manifest(self, name: str) -> Optional[Dict[str, Any]]:
+        """Read and parse a plugin's manifest.json."""
+        manifest_path = os.path.join(self.plugins_dir, name, 'manifest.json')
+        try:
+            logger.debug(f"Loading manifest from {manifest_path}")
+            with open(manifest_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            logger.error(f"Manifest not found for plugin {name}: {manifest_path}")
+        except Exception as e:
+            logger.error(f"Error loading manifest for plugin {name}: {e}", exc_info=True)
+        return None
+    
+    def _load_class(self, name: str, reload_module: bool = False) -> Optional[Type]:
+        """Import a plugin module and find its PluginInterface subclass."""
+        from core.models import PluginInterface
+        
+        module_path = f'plugins.{name}.plugin'
+        try:
+            logger.debug(f"Loading plugin class from {module_path}")
+            
+            # Check if the module exists
+            spec = importlib.util.find_spec(module_path)
+            if spec is None:
+                logger.error(f"Module {module_path} not found in Python path")
+                return None
+            
+            # Import the module, picking up changes to plugin.py
+            if reload_module and module_path in sys.modules:
+                module = importlib.reload(sys.modules[module_path])
+            else:
+                module = importlib.import_module(module_path)
+            
+            # Look for a class that is a subclass of PluginInterface
+            plugin_class = None
+            for obj_name, obj in module.__dict__.items():
+                if (isinstance(obj, type) and
+                    issubclass(obj, PluginInterface) and
+                    obj != PluginInterface and
+                    obj.__module__ == module_path):
+                    plugin_class = obj
+                    logger.debug(f"Found plugin class {obj_name} in {module_path}")
+                    break
+            
+            if not plugin_class:
+                logger.error(f"No plugin class found in {module_path}")
+                return None
+            
+            # Verify the plugin class implements all required methods
+            required_methods = ['get_manifest', 'fetch_messages', 'send_message', 'test_connection']
+            missing_methods = [method for method in required_methods if not hasattr(plugin_class, method)]
+            if missing_methods:
+                logger.error(f"Plugin class {plugin_class.__name__} is missing required methods: {', '.join(missing_methods)}")
+                return None
+            
+            logger.debug(f"Successfully loaded plugin class {plugin_class.__name__}")
+            return plugin_class
+        
+        except ImportError as e:
+            logger.error(f"Error importing plugin module {module_path}: {str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"Error loading plugin class: {str(e)}", exc_info=True)
+            return None
+
+plugin_registry = PluginRegistry()
+
+def get_plugin_class(name: str) -> Optional[Type]:
+    """Get a plugin class by name from the process-wide registry."""
+    return plugin_registry.get_plugin_class(name)
+
+def get_manifest(name: str) -> Optional[Dict[str, Any]]:
+    """Get a plugin manifest by name from the process-wide registry."""
+    return plugin_registry.get_manifest(name)
+
+def register_plugin(name: str, plugin_class: Type, manifest: Optional[Dict[str, Any]] = None) -> None:
+    """Register a plugin class with the process-wide registry."""
+    plugin_registry.register(name, plugin_class, manifest)
@@ -0,0 +1,197 @@
+"""
+Rate limiting for outgoing services.
+
+Relays enforce send quotas across all of our connections, not per worker, so
+the buckets that matter are shared: RateLimiter keeps one token bucket per
+outgoing Service and one per recipient domain in Redis, and takes tokens from
+all the buckets that apply in a single Lua script. Every Celery worker draws
+from the same buckets, so adding workers never raises the send rate.
+
+The Redis clock is used for refills so that workers on different hosts agree
+on how many tokens a bucket holds. If Redis is unavailable the limiter lets
+sends through rather than stalling delivery.
+
+TokenBucket is the in-process equivalent, used when the delivery engine runs
+without Redis (e.g. in a benchmark).
+"""
+
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# KEYS: one hash per bucket ({tokens, ts})
+# ARGV: tokens requested, then rate and capacity for each key in turn
+# Returns "0" if the tokens were taken from every bucket, otherwise the
+# seconds to wait until all buckets can cover the request (nothing is taken)
+TAKE_TOKENS_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local tokens = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local capacity = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    level = math.min(capacity, level + math.max(0, now - ts) * rate)
+    levels[i] = level
+    local needed = math.min(tokens, capacity)
+    if level < needed then
+        wait = math.max(wait, (needed - level) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2])
+    local capacity = tonumber(ARGV[i * 2 + 1])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil((capacity + tokens) / rate) + 60)
+end
+return '0'
+"""
+
+class TokenBucket:
+    """A thread-safe, in-process token bucket allowing rate events per second on average."""
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """Initialize the bucket.
+        
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum burst size, defaults to one second's worth of tokens
+        """
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, tokens: float = 1, max_wait: Optional[float] = None) -> bool:
+        """Take tokens from the bucket, sleeping until they are available.
+        
+        Requests larger than the capacity are let through once the bucket is
+        full and leave it in debt, so they are paid back before the next send.
+        
+        Args:
+            tokens: Number of tokens to take
+            max_wait: Give up instead of sleeping longer than this many seconds
+        
+        Returns:
+            bool: True if the tokens were taken, False if it would take longer than max_wait
+        """
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                needed = min(tokens, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= tokens
+                    return True
+                wait = (needed - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+class RateLimiter:
+    """Shared service and recipient-domain token buckets for one outgoing service.
+    
+    Limits come from the service config:
+        rate_limit: Messages per second for the whole service (0 or unset for no limit)
+        rate_limit_burst: Bucket capacity for the service, defaults to one second's worth
+        domain_rate_limit: Messages per second for each recipient domain
+        domain_limits: Per-domain overrides, e.g. {"gmail.com": {"rate": 2, "burst": 10}}
+    
+    retry_after holds the longest wait that made a send give up, for use as
+    the countdown of the task that retries it.
+    """
+    
+    def __init__(self, client, service, max_wait: Optional[float] = None):
+        """Initialize the limiter.
+        
+        Args:
+            client: Redis client holding the buckets
+            service: The outgoing Service
+            max_wait: Seconds a send may block on the buckets before it is
+                rescheduled, defaults to RATE_LIMIT_MAX_WAIT
+        """
+        config = service.config or {}
+        self.client = client
+        self.service = service
+        self.max_wait = max_wait if max_wait is not None else settings.RATE_LIMIT_MAX_WAIT
+        self.service_rate = float(config.get('rate_limit') or 0)
+        self.service_burst = float(config.get('rate_limit_burst') or 0)
+        self.domain_rate = float(config.get('domain_rate_limit', settings.DELIVERY_DOMAIN_RATE_LIMIT) or 0)
+        self.domain_limits = config.get('domain_limits', {})
+        self.retry_after = 0.0
+        self._script = client.register_script(TAKE_TOKENS_SCRIPT)
+    
+    def bucket_key(self, domain: Optional[str] = None) -> str:
+        """Get the Redis key of the service bucket, or of a domain bucket."""
+        if domain is None:
+            return f"ratelimit:service:{self.service.id}"
+        return f"ratelimit:service:{self.service.id}:domain:{domain}"
+    
+    def buckets(self, domain: str) -> List[Tuple[str, float, float]]:
+        """Get the (key, rate, capacity) of every bucket a send to a domain draws from."""
+        buckets = []
+        if self.service_rate > 0:
+            buckets.append((self.bucket_key(), self.service_rate, self.service_burst or max(self.service_rate, 1)))
+        limits = self.domain_limits.get(domain, {})
+        rate = float(limits.get('rate', self.domain_rate) or 0)
+        if rate > 0:
+            buckets.append((self.bucket_key(domain), rate, float(limits.get('burst') or max(rate, 1))))
+        return buckets
+    
+    def try_acquire(self, domain: str, tokens: int = 1) -> float:
+        """Take tokens for a send to a domain without blocking.
+        
+        Args:
+            domain: Recipient domain
+            tokens: Number of messages about to be sent
+        
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds until they will be available
+        """
+        buckets = self.buckets(domain)
+        if not buckets:
+            return 0.0
+        args = [tokens]
+        for _, rate, capacity in buckets:
+            args.extend([rate, capacity])
+        try:
+            return float(self._script(keys=[key for key, _, _ in buckets], args=args))
+        except Exception as e:
+            logger.error(f"Step 5: Error checking rate limit for {self.service.name}, sending anyway: {e}")
+            return 0.0
+    
+    def acquire(self, domain: str, tokens: int = 1) -> bool:
+        """Take tokens for a send to a domain, blocking for up to max_wait seconds.
+        
+        Args:
+            domain: Recipient domain
+            tokens: Number of messages about to be sent
+        
+        Returns:
+            bool: True if the send may go ahead, False if it should be rescheduled
+        """
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = self.try_acquire(domain, tokens)
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                logger.info(f"Step 5: Rate limit for {self.service.name} ({domain}) needs {wait:.1f}s, rescheduling")
+                self.retry_after = max(self.retry_after, wait)
+                return False
+            time.sleep(wait)
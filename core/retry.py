@@ -0,0 +1,109 @@
+"""
+Retry scheduling for failed pipeline rows.
+
+A failed row stores when it may next be attempted in next_attempt_at, so the
+workers can select only the rows that are due (an indexed range scan on
+status, next_attempt_at) instead of loading every failed row and working out
+its backoff in Python on each run. Rows that have used up their retries have
+no next attempt.
+
+The backoff follows the service's retry_policy config, falling back to the
+global settings:
+    min_delay: Minutes before the first retry (MIN_RETRY_DELAY)
+    max_delay: Upper bound on the delay in minutes (MAX_RETRY_DELAY)
+    multiplier: Growth factor per attempt (RETRY_BACKOFF_MULTIPLIER)
+    jitter: Random spread as a fraction of the delay (RETRY_JITTER)
+    max_retries: Attempts before giving up (MAX_MESSAGE_RETRIES)
+"""
+
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+class RetryPolicy:
+    """Exponential backoff with jitter for one service."""
+    
+    def __init__(
+        self,
+        min_delay: Optional[float] = None,
+        max_delay: Optional[float] = None,
+        multiplier: Optional[float] = None,
+        jitter: Optional[float] = None,
+        max_retries: Optional[int] = None
+    ):
+        """Initialize the policy; unset values come from settings.
+        
+        Args:
+            min_delay: Minutes before the first retry
+            max_delay: Upper bound on the delay in minutes
+            multiplier: Growth factor per attempt
+            jitter: Random spread as a fraction of the delay (0.1 = +/-10%)
+            max_retries: Attempts before giving up
+        """
+        self.min_delay = float(min_delay if min_delay is not None else settings.MIN_RETRY_DELAY)
+        self.max_delay = float(max_delay if max_delay is not None else settings.MAX_RETRY_DELAY)
+        self.multiplier = float(multiplier if multiplier is not None else settings.RETRY_BACKOFF_MULTIPLIER)
+        self.jitter = float(jitter if jitter is not None else settings.RETRY_JITTER)
+        self.max_retries = int(max_retries if max_retries is not None else settings.MAX_MESSAGE_RETRIES)
+    
+    @classmethod
+    def for_service(cls, service) -> 'RetryPolicy':
+        """Build the policy from a service's retry_policy config.
+        
+        Args:
+            service: The Service whose rows are being retried
+        
+        Returns:
+            RetryPolicy: The service's policy
+        """
+        config = (service.config or {}).get('retry_policy') or {}
+        return cls(
+            min_delay=config.get('min_delay'),
+            max_delay=config.get('max_delay'),
+            multiplier=config.get('multiplier'),
+            jitter=config.get('jitter'),
+            max_retries=config.get('max_retries')
+        )
+    
+    def delay(self, retry_count: int) -> timedelta:
+        """Get the backoff after a row's retry_count-th failure, with jitter applied.
+        
+        Args:
+            retry_count: Number of failed attempts so far
+        
+        Returns:
+            timedelta: Time to wait before the next attempt
+        """
+        minutes = self.min_delay * (self.multiplier ** retry_count)
+        if self.jitter:
+            minutes *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return timedelta(minutes=max(0, min(self.max_delay, minutes)))
+    
+    def next_attempt_at(self, retry_count: int, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Get when a row that has failed retry_count times may be attempted again.
+        
+        Args:
+            retry_count: Number of failed attempts so far
+            now: Time of the latest failure, defaults to now
+        
+        Returns:
+            datetime, or None if the row has used up its retries
+        """
+        if retry_count >= self.max_retries:
+            return None
+        return (now or timezone.now()) + self.delay(retry_count)
+
+def due(now: Optional[datetime] = None) -> Q:
+    """Filter for rows whose next attempt is due.
+    
+    Args:
+        now: Time to compare against, defaults to now
+    
+    Returns:
+        Q: Filter on next_attempt_at
+    """
+    return Q(next_attempt_at__lte=now or timezone.now())
@@ -0,0 +1,837 @@
+"""
+Local stand-in IMAP and SMTP servers for benchmarks and failure-path testing.
+
+StandInIMAPServer is a small asyncio IMAP4rev1 server holding its folders
+in memory. It implements the commands IMAPPlugin and imaplib use (LOGIN,
+SELECT, UID SEARCH/FETCH/COPY/STORE, EXPUNGE, IDLE, ...), can start with a
+generated mailbox of any size and can add a fixed latency to every reply.
+Messages added while a client is in IDLE are announced with EXISTS, so the
+imap_idle command can be pointed at it too.
+
+StandInSMTPServer is an SMTP sink: it accepts every transaction (with
+PIPELINING, SIZE and AUTH, like a typical submission server), records the
+deliveries and can answer recipients with 4xx or 5xx replies, either for
+given addresses or domains or at random for a share of them, and reply
+slowly.
+
+Both run their event loop in a background thread, so synchronous code
+(a benchmark, a management command, the plugins themselves) can start one,
+point a service at 127.0.0.1 and its port and stop it again:
+    
+    with StandInIMAPServer(messages=1000) as imap, StandInSMTPServer(reject_rate=0.01) as smtp:
+        ...
+
+They are for local testing only: there is no TLS and any login is accepted
+unless a username and password are set.
+"""
+
+import asyncio
+import fnmatch
+import logging
+import random
+import threading
+import time
+import uuid
+from email.message import EmailMessage
+from email.parser import BytesHeaderParser
+from email.policy import SMTP
+from email.utils import format_datetime, formatdate
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DOMAIN = 'standin.invalid'
+
+def make_message(index: int, body_size: int = 2000, tag: str = '', sender: Optional[str] = None,
+                 recipient: Optional[str] = None) -> bytes:
+    """Generate a plain text email to put in a stand-in mailbox.
+    
+    Args:
+        index: Number of the message, used in its subject, sender and Message-ID
+        body_size: Characters in the body
+        tag: Prefix for the Message-ID, to keep separate runs apart
+        sender: From address, defaults to sender<index>@standin.invalid
+        recipient: To address, defaults to list@standin.invalid
+    
+    Returns:
+        bytes: The message in wire format
+    """
+    message = EmailMessage()
+    message['Subject'] = f"Stand-in message {index}"
+    message['From'] = sender or f"sender{index}@{DOMAIN}"
+    message['To'] = recipient or f"list@{DOMAIN}"
+    message['Date'] = format_datetime(timezone.now())
+    message['Message-ID'] = f"<{tag}{index}@{DOMAIN}>"
+    message.set_content(('The quick brown fox jumps over the lazy dog. ' * (body_size // 45 + 1))[:body_size])
+    return message.as_bytes(policy=SMTP)
+
+class StandInServer:
+    """An asyncio server running in its own thread."""
+    
+    protocol = 'mail'
+    
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        """Initialize the server.
+        
+        Args:
+            host: Address to listen on
+            port: Port to listen on, 0 for any free port (see port after start())
+            latency: Seconds to wait before each reply
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._error = None
+        self._ready = threading.Event()
+        self._connections: Set[asyncio.Task] = set()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+    
+    def start(self):
+        """Start listening in a background thread.
+        
+        Returns:
+            The server, for chaining
+        """
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, name=f"standin-{self.protocol}", daemon=True)
+        self._thread.start()
+        self._ready.wait(10)
+        if self._error:
+            raise self._error
+        logger.info(f"Stand-in {self.protocol} server listening on {self.host}:{self.port}")
+        return self
+    
+    def stop(self) -> None:
+        """Close every connection and stop the server."""
+        if self._loop and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(10)
+            self._thread = None
+    
+    def call(self, func, *args):
+        """Run a function in the server's thread and get its result (the state is not locked)."""
+        async def run():
+            return func(*args)
+        return asyncio.run_coroutine_threadsafe(run(), self._loop).result(10)
+    
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        try:
+            self._server = loop.run_until_complete(asyncio.start_server(self._accept, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            loop.close()
+            return
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            self._server.close()
+            for task in self._connections:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*self._connections, return_exceptions=True))
+            loop.run_until_complete(self._server.wait_closed())
+            loop.close()
+    
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            await self.handle(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"Stand-in {self.protocol} server error: {str(e)}")
+        finally:
+            self._connections.discard(task)
+            writer.close()
+    
+    async def _delay(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+    
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        raise NotImplementedError
+
+class _StoredMessage:
+    """A message in a stand-in IMAP folder."""
+    
+    __slots__ = ('uid', 'flags', 'raw', 'internal_date', '_headers')
+    
+    def __init__(self, uid: int, raw: bytes, flags: Iterable[str] = ()):
+        self.uid = uid
+        self.raw = raw
+        self.flags = set(flags)
+        self.internal_date = time.time()
+        self._headers = None
+    
+    @property
+    def headers(self):
+        if self._headers is None:
+            self._headers = BytesHeaderParser().parsebytes(self.raw)
+        return self._headers
+    
+    def section(self, name: str) -> bytes:
+        """Get a BODY[] section: the whole message, HEADER, TEXT or HEADER.FIELDS (...)."""
+        header_end = self.raw.find(b'\r\n\r\n')
+        header_end = len(self.raw) if header_end < 0 else header_end + 4
+        name = name.upper()
+        if not name:
+            return self.raw
+        if name == 'HEADER':
+            return self.raw[:header_end]
+        if name == 'TEXT':
+            return self.raw[header_end:]
+        if name.startswith('HEADER.FIELDS'):
+            negate = name.startswith('HEADER.FIELDS.NOT')
+            fields = set(name[name.index('(') + 1:name.rindex(')')].split())
+            lines = []
+            for field, value in self.headers.items():
+                if (field.upper() in fields) != negate:
+                    lines.append(f"{field}: {value}\r\n".encode('utf-8', errors='replace'))
+            return b''.join(lines) + b'\r\n'
+        raise ValueError(f"Unsupported section {name}")
+
+class _Folder:
+    """A stand-in IMAP folder."""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.uidvalidity = int(time.time())
+        self.uidnext = 1
+        self.messages: List[_StoredMessage] = []
+    
+    def add(self, raw: bytes, flags: Iterable[str] = ()) -> int:
+        message = _StoredMessage(self.uidnext, raw, flags)
+        self.uidnext += 1
+        self.messages.append(message)
+        return message.uid
+
+def _tokens(text: str) -> List[str]:
+    """Split IMAP arguments on spaces outside quotes, parentheses and brackets."""
+    tokens = []
+    current = ''
+    depth = 0
+    quoted = False
+    escaped = False
+    for char in text:
+        if quoted:
+            current += char
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                quoted = False
+        elif char == '"':
+            quoted = True
+            current += char
+        elif char in '([':
+            depth += 1
+            current += char
+        elif char in ')]':
+            depth -= 1
+            current += char
+        elif char == ' ' and depth == 0:
+            if current:
+                tokens.append(current)
+            current = ''
+        else:
+            current += char
+    if current:
+        tokens.append(current)
+    return tokens
+
+def _unquote(token: str) -> str:
+    if len(token) >= 2 and token[0] == token[-1] == '"':
+        return token[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return token
+
+def _parse_set(text: str, largest: int) -> Set[int]:
+    """Expand a sequence set such as "1:5,7,9:*"; * is the largest number in use."""
+    numbers = set()
+    if not largest:
+        return numbers
+    for part in text.split(','):
+        first, _, last = part.partition(':')
+        first = largest if first == '*' else int(first)
+        last = first if not last else largest if last == '*' else int(last)
+        if first > last:
+            first, last = last, first
+        numbers.update(range(first, min(last, largest) + 1))
+    return numbers
+
+class IMAPCommandError(Exception):
+    """A command the stand-in server answers with BAD or NO."""
+    
+    def __init__(self, message: str, status: str = 'BAD'):
+        super().__init__(message)
+        self.status = status
+
+class _IMAPSession:
+    """One client connection to the stand-in IMAP server."""
+    
+    def __init__(self, server: 'StandInIMAPServer', reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.authenticated = server.username is None
+        self.folder: Optional[_Folder] = None
+        self.read_only = False
+        self.known_exists = 0
+        self.idling = False
+    
+    def send(self, line) -> None:
+        self.writer.write((line.encode() if isinstance(line, str) else line) + b'\r\n')
+    
+    def notify_exists(self) -> None:
+        """Tell the client how many messages the selected folder holds, if that changed."""
+        if self.folder and len(self.folder.messages) != self.known_exists:
+            self.known_exists = len(self.folder.messages)
+            self.send(f"* {self.known_exists} EXISTS")
+    
+    async def read_command(self) -> Optional[List]:
+        """Read a command line, with any literals it carries.
+        
+        Returns:
+            list: The tag, the command name and its arguments (literals as bytes), or None at EOF
+        """
+        line = await self.reader.readline()
+        if not line:
+            return None
+        line = line.rstrip(b'\r\n')
+        literals = []
+        # A line ending in {n} or {n+} is followed by n bytes of literal data
+        while line.endswith(b'}') and b'{' in line:
+            start = line.rindex(b'{')
+            size = line[start + 1:-1]
+            synchronizing = not size.endswith(b'+')
+            if not size.rstrip(b'+').isdigit():
+                break
+            if synchronizing:
+                self.send('+ Ready for literal data')
+                await self.writer.drain()
+            literals.append(await self.reader.readexactly(int(size.rstrip(b'+'))))
+            line = line[:start] + f"\x00{len(literals) - 1}".encode() + (await self.reader.readline()).rstrip(b'\r\n')
+        tokens = _tokens(line.decode('utf-8', errors='replace'))
+        return [
+            literals[int(token[1:])] if token.startswith('\x00') and token[1:].isdigit() else token
+            for token in tokens
+        ]
+    
+    async def run(self) -> None:
+        self.send(f"* OK [CAPABILITY {self.server.capabilities}] Stand-in IMAP server ready")
+        await self.writer.drain()
+        while True:
+            command = await self.read_command()
+            if command is None:
+                return
+            if len(command) < 2:
+                self.send(f"{command[0] if command else '*'} BAD Missing command")
+                await self.writer.drain()
+                continue
+            tag, name, args = command[0], command[1].upper(), command[2:]
+            if name == 'UID' and args:
+                name, args = f"UID {args[0].upper()}", args[1:]
+            handler = getattr(self, f"do_{name.replace(' ', '_')}", None)
+            try:
+                if handler is None:
+                    raise IMAPCommandError(f"Unknown command {name}")
+                if not self.authenticated and name not in ('CAPABILITY', 'NOOP', 'LOGOUT', 'LOGIN', 'AUTHENTICATE'):
+                    raise IMAPCommandError("Log in first")
+                result = await handler(tag, args) if name == 'IDLE' else handler(args)
+                await self.server._delay()
+                if name != 'IDLE':
+                    self.notify_exists()
+                self.send(f"{tag} OK {result or name + ' completed'}")
+            except IMAPCommandError as e:
+                await self.server._delay()
+                self.send(f"{tag} {e.status} {e}")
+            except (ValueError, IndexError, KeyError) as e:
+                await self.server._delay()
+                self.send(f"{tag} BAD Invalid arguments: {e}")
+            await self.writer.drain()
+            if name == 'LOGOUT':
+                return
+    
+    def _selected(self) -> _Folder:
+        if self.folder is None:
+            raise IMAPCommandError("No mailbox selected")
+        return self.folder
+    
+    def _get_folder(self, token: str) -> _Folder:
+        name = _unquote(token)
+        folder = self.server.folders.get(name)
+        if folder is None:
+            raise IMAPCommandError(f"[TRYCREATE] No such mailbox {name}", 'NO')
+        return folder
+    
+    def _matching(self, sequence_set: str, by_uid: bool) -> List:
+        """Get (sequence number, message) pairs in a sequence or UID set."""
+        messages = self._selected().messages
+        if by_uid:
+            wanted = _parse_set(sequence_set, messages[-1].uid if messages else 0)
+            return [(index + 1, message) for index, message in enumerate(messages) if message.uid in wanted]
+        wanted = _parse_set(sequence_set, len(messages))
+        return [(index + 1, message) for index, message in enumerate(messages) if index + 1 in wanted]
+    
+    def do_CAPABILITY(self, args):
+        self.send(f"* CAPABILITY {self.server.capabilities}")
+    
+    def do_NOOP(self, args):
+        pass
+    
+    def do_CHECK(self, args):
+        pass
+    
+    def do_LOGOUT(self, args):
+        self.send("* BYE Stand-in IMAP server logging out")
+    
+    def do_LOGIN(self, args):
+        username, password = (_unquote(arg) if isinstance(arg, str) else arg.decode() for arg in args[:2])
+        if self.server.username is not None and (username, password) != (self.server.username, self.server.password):
+            raise IMAPCommandError("[AUTHENTICATIONFAILED] Invalid credentials", 'NO')
+        self.authenticated = True
+        return f"[CAPABILITY {self.server.capabilities}] Logged in"
+    
+    def do_ENABLE(self, args):
+        self.send("* ENABLED")
+    
+    def do_SELECT(self, args, read_only=False):
+        folder = self._get_folder(args[0])
+        self.folder = folder
+        self.read_only = read_only
+        self.known_exists = len(folder.messages)
+        self.send(f"* {self.known_exists} EXISTS")
+        self.send("* 0 RECENT")
+        self.send("* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)")
+        self.send(f"* OK [UIDVALIDITY {folder.uidvalidity}] UIDs valid")
+        self.send(f"* OK [UIDNEXT {folder.uidnext}] Predicted next UID")
+        return f"[{'READ-ONLY' if read_only else 'READ-WRITE'}] {'EXAMINE' if read_only else 'SELECT'} completed"
+    
+    def do_EXAMINE(self, args):
+        return self.do_SELECT(args, read_only=True)
+    
+    def do_CLOSE(self, args):
+        if not self.read_only:
+            self._expunge(quiet=True)
+        self.folder = None
+    
+    def do_CREATE(self, args):
+        name = _unquote(args[0])
+        if name in self.server.folders:
+            raise IMAPCommandError("[ALREADYEXISTS] Mailbox already exists", 'NO')
+        self.server.folders[name] = _Folder(name)
+    
+    def do_DELETE(self, args):
+        name = _unquote(args[0])
+        if self.server.folders.pop(name, None) is None:
+            raise IMAPCommandError("[NONEXISTENT] No such mailbox", 'NO')
+    
+    def do_LIST(self, args):
+        pattern = _unquote(args[1]).replace('%', '*') if len(args) > 1 else '*'
+        for name in sorted(self.server.folders):
+            if fnmatch.fnmatchcase(name, pattern):
+                self.send(f'* LIST () "." "{name}"')
+    
+    def do_LSUB(self, args):
+        return self.do_LIST(args)
+    
+    def do_STATUS(self, args):
+        folder = self._get_folder(args[0])
+        values = {
+            'MESSAGES': len(folder.messages),
+            'RECENT': 0,
+            'UIDNEXT': folder.uidnext,
+            'UIDVALIDITY': folder.uidvalidity,
+            'UNSEEN': sum(1 for message in folder.messages if '\\Seen' not in message.flags),
+        }
+        items = args[1].strip('()').upper().split()
+        self.send(f'* STATUS "{folder.name}" ({" ".join(f"{item} {values[item]}" for item in items)})')
+    
+    def do_APPEND(self, args):
+        folder = self._get_folder(args[0])
+        flags = args[1].strip('()').split() if len(args) > 2 and isinstance(args[1], str) and args[1].startswith('(') else ()
+        if not isinstance(args[-1], bytes):
+            raise IMAPCommandError("APPEND needs a literal")
+        uid = self.server.add_message(folder.name, args[-1], flags)
+        return f"[APPENDUID {folder.uidvalidity} {uid}] APPEND completed"
+    
+    def do_SEARCH(self, args, by_uid=False):
+        messages = self._selected().messages
+        matches = [(index + 1, message) for index, message in enumerate(messages)]
+        criteria = []
+        for arg in args:
+            criteria.extend(_tokens(arg[1:-1]) if arg.startswith('(') else [arg])
+        position = 0
+        while position < len(criteria):
+            key = criteria[position].upper()
+            position += 1
+            if key == 'ALL':
+                continue
+            elif key == 'CHARSET':
+                position += 1
+            elif key == 'UID':
+                wanted = _parse_set(criteria[position], messages[-1].uid if messages else 0)
+                position += 1
+                matches = [(number, message) for number, message in matches if message.uid in wanted]
+            elif key == 'HEADER':
+                field, value = criteria[position], _unquote(criteria[position + 1]).lower()
+                position += 2
+                matches = [
+                    (number, message) for number, message in matches
+                    if value in str(message.headers.get(field, '')).lower()
+                ]
+            elif key in ('SEEN', 'UNSEEN', 'DELETED', 'UNDELETED'):
+                flag = '\\' + key.removeprefix('UN').capitalize()
+                present = not key.startswith('UN')
+                matches = [(number, message) for number, message in matches if (flag in message.flags) == present]
+            elif key[0].isdigit() or key[0] == '*':
+                wanted = _parse_set(key, len(messages))
+                matches = [(number, message) for number, message in matches if number in wanted]
+            else:
+                raise IMAPCommandError(f"Unsupported search key {key}")
+        self.send(' '.join(['* SEARCH'] + [str(message.uid if by_uid else number) for number, message in matches]))
+    
+    def do_UID_SEARCH(self, args):
+        return self.do_SEARCH(args, by_uid=True)
+    
+    def do_FETCH(self, args, by_uid=False):
+        items = _tokens(args[1][1:-1]) if args[1].startswith('(') else [args[1]]
+        items = [item.upper() for item in items]
+        if by_uid and 'UID' not in items:
+            items.insert(0, 'UID')
+        for number, message in self._matching(args[0], by_uid):
+            parts = []
+            for item in items:
+                parts.append(self._fetch_item(message, item))
+            self.writer.write(f"* {number} FETCH (".encode() + b' '.join(parts) + b')\r\n')
+    
+    def do_UID_FETCH(self, args):
+        return self.do_FETCH(args, by_uid=True)
+    
+    def _fetch_item(self, message: _StoredMessage, item: str) -> bytes:
+        if item == 'UID':
+            return f"UID {message.uid}".encode()
+        if item == 'FLAGS':
+            return f"FLAGS ({' '.join(sorted(message.flags))})".encode()
+        if item == 'RFC822.SIZE':
+            return f"RFC822.SIZE {len(message.raw)}".encode()
+        if item == 'INTERNALDATE':
+            return f'INTERNALDATE "{time.strftime("%d-%b-%Y %H:%M:%S +0000", time.gmtime(message.internal_date))}"'.encode()
+        aliases = {'RFC822': 'BODY[]', 'RFC822.HEADER': 'BODY.PEEK[HEADER]', 'RFC822.TEXT': 'BODY[TEXT]'}
+        name = aliases.get(item, item)
+        if not name.startswith(('BODY[', 'BODY.PEEK[')):
+            raise IMAPCommandError(f"Unsupported fetch item {item}")
+        section = name[name.index('[') + 1:name.index(']')]
+        data = message.section(section)
+        partial = name[name.index(']') + 1:]
+        label = item if item in aliases else f"BODY[{section}]"
+        if partial:
+            offset, _, length = partial.strip('<>').partition('.')
+            data = data[int(offset):int(offset) + int(length)] if length else data[int(offset):]
+            label += f"<{offset}>"
+        if not name.startswith('BODY.PEEK') and item != 'RFC822.HEADER' and not self.read_only:
+            message.flags.add('\\Seen')
+        return f"{label} {{{len(data)}}}\r\n".encode() + data
+    
+    def do_STORE(self, args, by_uid=False):
+        mode = args[1].upper()
+        silent = mode.endswith('.SILENT')
+        mode = mode.removesuffix('.SILENT')
+        flags = set(' '.join(args[2:]).strip('()').split())
+        for number, message in self._matching(args[0], by_uid):
+            if mode == '+FLAGS':
+                message.flags |= flags
+            elif mode == '-FLAGS':
+                message.flags -= flags
+            elif mode == 'FLAGS':
+                message.flags = set(flags)
+            else:
+                raise IMAPCommandError(f"Unsupported STORE item {mode}")
+            if not silent:
+                uid = f" UID {message.uid}" if by_uid else ''
+                self.send(f"* {number} FETCH (FLAGS ({' '.join(sorted(message.flags))}){uid})")
+    
+    def do_UID_STORE(self, args):
+        return self.do_STORE(args, by_uid=True)
+    
+    def do_COPY(self, args, by_uid=False):
+        target = self._get_folder(args[1])
+        for _, message in self._matching(args[0], by_uid):
+            target.add(message.raw, message.flags - {'\\Deleted'})
+    
+    def do_UID_COPY(self, args):
+        return self.do_COPY(args, by_uid=True)
+    
+    def do_EXPUNGE(self, args):
+        self._expunge()
+    
+    def _expunge(self, quiet: bool = False) -> None:
+        folder = self._selected()
+        kept = []
+        removed = 0
+        for index, message in enumerate(folder.messages):
+            if '\\Deleted' in message.flags:
+                # Each EXPUNGE renumbers the messages after it
+                if not quiet:
+                    self.send(f"* {index + 1 - removed} EXPUNGE")
+                removed += 1
+            else:
+                kept.append(message)
+        folder.messages = kept
+        self.known_exists = len(kept)
+    
+    async def do_IDLE(self, tag, args):
+        if not self.server.idle:
+            raise IMAPCommandError("IDLE is not supported")
+        self.send("+ idling")
+        self.notify_exists()
+        await self.writer.drain()
+        self.idling = True
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    raise ConnectionError("Client went away during IDLE")
+                if line.strip().upper() == b'DONE':
+                    return "IDLE terminated"
+        finally:
+            self.idling = False
+
+class StandInIMAPServer(StandInServer):
+    """In-memory IMAP4rev1 server with an optional IDLE extension."""
+    
+    protocol = 'IMAP'
+    
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, messages: int = 0, body_size: int = 2000,
+                 folder: str = 'INBOX', latency: float = 0.0, idle: bool = True,
+                 username: Optional[str] = None, password: Optional[str] = None):
+        """Initialize the server.
+        
+        Args:
+            host: Address to listen on
+            port: Port to listen on, 0 for any free port
+            messages: Generated messages to start the folder with (see make_message)
+            body_size: Body size of the generated messages
+            folder: Folder the generated messages go in
+            latency: Seconds to wait before each tagged reply
+            idle: Advertise and support IDLE
+            username: Only accept this username, or any login if None
+            password: Password for username
+        """
+        super().__init__(host, port, latency)
+        self.idle = idle
+        self.username = username
+        self.password = password
+        self.folders: Dict[str, _Folder] = {'INBOX': _Folder('INBOX')}
+        self._sessions: Set[_IMAPSession] = set()
+        tag = f"{uuid.uuid4().hex[:8]}-"
+        for index in range(messages):
+            self.add_message(folder, make_message(index, body_size, tag))
+    
+    @property
+    def capabilities(self) -> str:
+        return 'IMAP4rev1 LITERAL+ IDLE' if self.idle else 'IMAP4rev1 LITERAL+'
+    
+    async def handle(self, reader, writer):
+        session = _IMAPSession(self, reader, writer)
+        self._sessions.add(session)
+        try:
+            await session.run()
+        finally:
+            self._sessions.discard(session)
+    
+    def add_message(self, folder: str, raw: bytes, flags: Iterable[str] = ()) -> int:
+        """Add a message to a folder, creating it if needed, and tell clients idling on it.
+        
+        Call through call() once the server is running.
+        
+        Returns:
+            int: UID of the new message
+        """
+        target = self.folders.get(folder)
+        if target is None:
+            target = self.folders[folder] = _Folder(folder)
+        uid = target.add(raw, flags)
+        for session in self._sessions:
+            if session.idling and session.folder is target:
+                session.notify_exists()
+        return uid
+    
+    def add_messages(self, folder: str, messages: Iterable[bytes]) -> List[int]:
+        """Add messages to a folder from any thread.
+        
+        Returns:
+            list: UIDs of the new messages
+        """
+        def add():
+            return [self.add_message(folder, raw) for raw in messages]
+        return self.call(add) if self._loop and self._loop.is_running() else add()
+    
+    def message_count(self, folder: str = 'INBOX') -> int:
+        """Get the number of messages in a folder, including ones flagged \\Deleted."""
+        def count():
+            return len(self.folders[folder].messages) if folder in self.folders else 0
+        return self.call(count) if self._loop and self._loop.is_running() else count()
+
+class StandInSMTPServer(StandInServer):
+    """SMTP sink recording deliveries, with optional failures and slow replies."""
+    
+    protocol = 'SMTP'
+    
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, data_latency: float = 0.0,
+                 temp_fail_rate: float = 0.0, reject_rate: float = 0.0,
+                 fail_recipients: Optional[Dict[str, int]] = None, max_size: int = 35 * 1024 * 1024,
+                 keep_messages: bool = True, seed: int = 0):
+        """Initialize the server.
+        
+        Args:
+            host: Address to listen on
+            port: Port to listen on, 0 for any free port
+            latency: Seconds to wait before each reply
+            data_latency: Extra seconds to wait before accepting a message body
+            temp_fail_rate: Share of recipients answered with 451 (retry later)
+            reject_rate: Share of recipients answered with 550 (permanent failure)
+            fail_recipients: Reply codes for given addresses or "@domain"s, e.g.
+                {"bounce@example.com": 550, "@slow.example": 421}
+            max_size: Largest message accepted (advertised as SIZE)
+            keep_messages: Keep each delivered message, not just its envelope
+            seed: Seed for the random failures, so runs are repeatable
+        """
+        super().__init__(host, port, latency)
+        self.data_latency = data_latency
+        self.temp_fail_rate = temp_fail_rate
+        self.reject_rate = reject_rate
+        self.fail_recipients = {address.lower(): code for address, code in (fail_recipients or {}).items()}
+        self.max_size = max_size
+        self.keep_messages = keep_messages
+        self.random = random.Random(seed)
+        self.deliveries: List[Dict] = []
+        self.stats = {'connections': 0, 'transactions': 0, 'accepted': 0, 'temp_failures': 0, 'rejections': 0}
+    
+    def recipient_reply(self, address: str) -> str:
+        """Decide how to answer RCPT TO for an address."""
+        address = address.lower()
+        code = self.fail_recipients.get(address) or self.fail_recipients.get('@' + address.rpartition('@')[2])
+        if code is None:
+            draw = self.random.random()
+            if draw < self.reject_rate:
+                code = 550
+            elif draw < self.reject_rate + self.temp_fail_rate:
+                code = 451
+        if code is None or code < 400:
+            return '250 2.1.5 Ok'
+        if code < 500:
+            self.stats['temp_failures'] += 1
+            return f"{code} 4.3.0 Temporary failure, try again later"
+        self.stats['rejections'] += 1
+        return f"{code} 5.1.1 Mailbox unavailable"
+    
+    def delivered(self) -> int:
+        """Get the number of recipients messages were delivered to, from any thread."""
+        return self.stats['accepted']
+    
+    async def handle(self, reader, writer):
+        self.stats['connections'] += 1
+        
+        async def reply(line: str) -> None:
+            await self._delay()
+            writer.write(line.encode() + b'\r\n')
+            await writer.drain()
+        
+        await reply(f"220 {DOMAIN} Stand-in SMTP server ready")
+        mail_from = None
+        recipients = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', errors='replace').rstrip('\r\n')
+            verb, _, argument = command.partition(' ')
+            verb = verb.upper()
+            if verb in ('EHLO', 'HELO'):
+                mail_from, recipients = None, []
+                if verb == 'HELO':
+                    await reply(f"250 {DOMAIN}")
+                    continue
+                extensions = ['PIPELINING', f"SIZE {self.max_size}", '8BITMIME', 'AUTH PLAIN LOGIN', 'ENHANCEDSTATUSCODES']
+                await reply('\r\n'.join([f"250-{DOMAIN}"] + [f"250-{ext}" for ext in extensions[:-1]] + [f"250 {extensions[-1]}"]))
+            elif verb == 'AUTH':
+                mechanism, _, initial = argument.partition(' ')
+                if mechanism.upper() == 'LOGIN':
+                    for prompt in ('VXNlcm5hbWU6', 'UGFzc3dvcmQ6'):
+                        await reply(f"334 {prompt}")
+                        await reader.readline()
+                elif not initial:
+                    await reply('334 ')
+                    await reader.readline()
+                await reply('235 2.7.0 Authentication successful')
+            elif verb == 'MAIL':
+                size = argument.upper().partition('SIZE=')[2].split(' ')[0]
+                if size.isdigit() and int(size) > self.max_size:
+                    await reply('552 5.3.4 Message too big')
+                    continue
+                mail_from = argument[argument.find('<') + 1:argument.rfind('>')]
+                recipients = []
+                await reply('250 2.1.0 Ok')
+            elif verb == 'RCPT':
+                if mail_from is None:
+                    await reply('503 5.5.1 Need MAIL first')
+                    continue
+                address = argument[argument.find('<') + 1:argument.rfind('>')]
+                response = self.recipient_reply(address)
+                if response.startswith('250'):
+                    recipients.append(address)
+                await reply(response)
+            elif verb == 'DATA':
+                if not recipients:
+                    await reply('554 5.5.1 No valid recipients')
+                    continue
+                await reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data_line = await reader.readline()
+                    if not data_line:
+                        return
+                    if data_line == b'.\r\n':
+                        break
+                    lines.append(data_line[1:] if data_line.startswith(b'..') else data_line)
+                if self.data_latency:
+                    await asyncio.sleep(self.data_latency)
+                self.stats['transactions'] += 1
+                self.stats['accepted'] += len(recipients)
+                self.deliveries.append({
+                    'mail_from': mail_from,
+                    'recipients': recipients,
+                    'size': sum(len(data_line) for data_line in lines),
+                    'data': b''.join(lines) if self.keep_messages else None,
+                    'received_at': formatdate(localtime=False)
+                })
+                mail_from, recipients = None, []
+                await reply('250 2.0.0 Ok: queued')
+            elif verb == 'RSET':
+                mail_from, recipients = None, []
+                await reply('250 2.0.0 Ok')
+            elif verb == 'NOOP':
+                await reply('250 2.0.0 Ok')
+            elif verb == 'QUIT':
+                await reply('221 2.0.0 Bye')
+                return
+            else:
+                await reply('502 5.5.2 Command not recognized')
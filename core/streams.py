@@ -0,0 +1,227 @@
+"""
+Redis Streams transport between pipeline stages.
+
+With PIPELINE_TRANSPORT = 'streams' (and PIPELINE_EVENT_DRIVEN on), a step
+hands its output to the next stage by adding the message ids to that stage's
+stream instead of sending a Celery task. Each stage is drained by
+`manage.py run_pipeline_stage <stage>` processes that share a consumer group,
+so a stage scales by starting more of them.
+
+Delivery is at least once. An entry is acknowledged (XACK) only after the
+stage has handled it. Entries left pending by a consumer that died are taken
+over by the others with XAUTOCLAIM once they have been idle for
+claim_idle_ms. An entry that keeps failing is acknowledged after
+max_deliveries attempts and left to the beat sweep. The database stays the
+system of record: the stream only says which rows to look at, and every stage
+still claims its rows (core.claims) before touching them, so a redelivered
+entry is harmless.
+"""
+
+import logging
+import os
+import socket
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# Stage name -> the task that handles it; the task takes (service_id, message_ids=...)
+# or just message_ids=... when it isn't per service
+STAGES = {
+    'standardize': 'core.tasks.process_incoming_messages',  # Step 2
+    'distribute': 'core.tasks.distribute_outgoing_messages',  # Step 3
+    'queue': 'core.tasks.process_outgoing_messages',  # Step 4
+    'send': 'core.tasks.send_queued_messages',  # Step 5
+}
+
+CONSUMER_GROUP = 'raingull'
+
+class StageFailed(Exception):
+    """A stage's task reported that it could not handle a stream entry."""
+
+def stream_settings() -> Dict[str, int]:
+    """Get the PIPELINE_STREAMS settings with defaults filled in."""
+    return {
+        'block_ms': 5000,
+        'count': 10,
+        'claim_idle_ms': 60000,
+        'max_deliveries': 5,
+        'maxlen': 100000,
+        **getattr(settings, 'PIPELINE_STREAMS', {})
+    }
+
+def stream_key(stage: str) -> str:
+    """Get the Redis key of a stage's stream."""
+    return f"pipeline:stream:{stage}"
+
+def stage_for_task(task_name: str) -> Optional[str]:
+    """Get the stage a task handles, or None if it isn't a pipeline stage."""
+    for stage, name in STAGES.items():
+        if name == task_name:
+            return stage
+    return None
+
+def publish(client, stage: str, message_ids: List[int], service_id: Optional[int] = None) -> str:
+    """Add a batch of message ids to a stage's stream.
+    
+    Args:
+        client: Redis client
+        stage: Stage that should handle the messages
+        message_ids: IDs of the messages to handle
+        service_id: Service the stage should handle them for, if it is per service
+    
+    Returns:
+        str: ID of the stream entry
+    """
+    fields = {
+        'message_ids': ','.join(str(message_id) for message_id in message_ids),
+        'service_id': '' if service_id is None else str(service_id)
+    }
+    return client.xadd(stream_key(stage), fields, maxlen=stream_settings()['maxlen'], approximate=True)
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+def parse_entry(fields: Dict) -> Tuple[Optional[int], List[int]]:
+    """Get the service id and message ids from a stream entry's fields."""
+    fields = {_decode(key): _decode(value) for key, value in fields.items()}
+    service_id = int(fields['service_id']) if fields.get('service_id') else None
+    message_ids = [int(message_id) for message_id in fields.get('message_ids', '').split(',') if message_id]
+    return service_id, message_ids
+
+def run_stage_task(stage: str, service_id: Optional[int], message_ids: List[int]):
+    """Run a stage's task in this process for one stream entry.
+    
+    The stage tasks catch their own errors and return None (or a result with
+    an "error") instead of raising, so that is turned back into an exception
+    here and the entry stays pending.
+    
+    Raises:
+        StageFailed: If the task did not handle the entry
+    """
+    from celery.utils.imports import symbol_by_name
+    
+    # Imports core.tasks if this process hasn't yet
+    task = symbol_by_name(STAGES[stage])
+    if service_id is None:
+        result = task.run(message_ids=message_ids)
+    else:
+        result = task.run(service_id, message_ids=message_ids)
+    if result is None or (isinstance(result, dict) and result.get('error')):
+        error = result.get('error') if result else 'no result'
+        raise StageFailed(f"{STAGES[stage]} failed for service {service_id}: {error}")
+    return result
+
+class StageConsumer:
+    """Reads one stage's stream as a member of the stage's consumer group."""
+    
+    def __init__(self, client, stage: str, consumer: Optional[str] = None,
+                 handler: Optional[Callable[[str, Optional[int], List[int]], object]] = None):
+        """Initialize the consumer.
+        
+        Args:
+            client: Redis client
+            stage: Stage to consume (a key of STAGES)
+            consumer: Consumer name within the group, defaults to "host:pid"
+            handler: Called with (stage, service_id, message_ids) for each entry,
+                defaults to running the stage's task in this process
+        """
+        if stage not in STAGES:
+            raise ValueError(f"Unknown pipeline stage {stage}, expected one of {', '.join(STAGES)}")
+        self.client = client
+        self.stage = stage
+        self.key = stream_key(stage)
+        self.consumer = consumer or f"{socket.gethostname()}:{os.getpid()}"
+        self.handler = handler or run_stage_task
+        self.options = stream_settings()
+        self.stats = {'handled': 0, 'failed': 0, 'reclaimed': 0, 'dropped': 0}
+    
+    def ensure_group(self) -> None:
+        """Create the stage's stream and consumer group if they don't exist yet."""
+        try:
+            self.client.xgroup_create(self.key, CONSUMER_GROUP, id='0', mkstream=True)
+        except Exception as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+    
+    def run_once(self) -> int:
+        """Handle abandoned entries, then wait for new ones and handle those.
+        
+        Returns:
+            int: Number of entries handled
+        """
+        entries = self._reclaim()
+        if not entries:
+            response = self.client.xreadgroup(
+                CONSUMER_GROUP,
+                self.consumer,
+                {self.key: '>'},
+                count=self.options['count'],
+                block=self.options['block_ms']
+            )
+            for _, stream_entries in response or []:
+                entries.extend(stream_entries)
+        
+        for entry_id, fields in entries:
+            self._handle(entry_id, fields)
+        return len(entries)
+    
+    def run_forever(self, stop_event: Optional[threading.Event] = None) -> None:
+        """Consume until stop_event is set.
+        
+        Args:
+            stop_event: Event that ends the loop after the current batch
+        """
+        stop_event = stop_event or threading.Event()
+        self.ensure_group()
+        logger.info(f"Consuming pipeline stage {self.stage} as {self.consumer}")
+        while not stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error consuming pipeline stage {self.stage}: {e}")
+                stop_event.wait(5)
+            finally:
+                close_old_connections()
+    
+    def _reclaim(self) -> List[Tuple]:
+        """Take over entries that another consumer left pending for too long."""
+        response = self.client.xautoclaim(
+            self.key,
+            CONSUMER_GROUP,
+            self.consumer,
+            min_idle_time=self.options['claim_idle_ms'],
+            start_id='0-0',
+            count=self.options['count']
+        )
+        # Redis 7 also returns the ids of entries deleted while pending
+        entries = [entry for entry in response[1] if entry and entry[1] is not None]
+        if entries:
+            logger.info(f"Reclaimed {len(entries)} abandoned entries from pipeline stage {self.stage}")
+            self.stats['reclaimed'] += len(entries)
+        return entries
+    
+    def _handle(self, entry_id, fields: Dict) -> None:
+        """Run the stage for one entry and acknowledge it once it has been handled."""
+        try:
+            service_id, message_ids = parse_entry(fields)
+            self.handler(self.stage, service_id, message_ids)
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.error(f"Error handling entry {_decode(entry_id)} of pipeline stage {self.stage}: {e}")
+            if self._deliveries(entry_id) < self.options['max_deliveries']:
+                # Leave it pending; it is redelivered through XAUTOCLAIM
+                return
+            logger.error(f"Giving up on entry {_decode(entry_id)} of pipeline stage {self.stage}, leaving its messages to the sweep")
+            self.stats['dropped'] += 1
+        else:
+            self.stats['handled'] += 1
+        self.client.xack(self.key, CONSUMER_GROUP, entry_id)
+    
+    def _deliveries(self, entry_id) -> int:
+        """Get how many times an entry has been delivered to the group."""
+        pending = self.client.xpending_range(self.key, CONSUMER_GROUP, min=entry_id, max=entry_id, count=1)
+        return pending[0]['times_delivered'] if pending else 0
@@ -1,10 +1,11 @@
-from celery import shared_task
+from celery import shared_task, chord, group
 from django.utils import timezone
-from .models import Service, Message, AuditLog, MessageQueue, UserService
-from django.contrib.auth.models import User
+from .models import Service, Message, MessageQueue, UserService
 from django.core.mail import send_mail
 from django.conf import settings
+from pathlib import Path
 from core.utils import get_imap_connection, get_smtp_connection
+from core import utils
 import logging
 import imaplib
 import smtplib
@@ -16,39 +17,406 @@ from datetime import datetime, timedelta
 import pytz
 import json
 from email.utils import parsedate_to_datetime
-from redis import Redis
 from redis.lock import Lock
 import uuid
 from django.db.models import Q
-from django.db import models
+from django.db import models, transaction
+from core.claims import claim_rows, release_claims
+from core.delivery import DeliveryEngine
+from core.ratelimit import RateLimiter
+from core.retry import RetryPolicy, due
+from core import streams
+from core.audit import record_audit, flush_audit
+from core import audit_storage
+from core import metrics
+from core import tracing
+from core import instrumentation
+from core.instrumentation import CountingRedis
 
 logger = logging.getLogger(__name__)
-redis_client = Redis(host='localhost', port=6379, db=0)
+redis_client = CountingRedis(host='localhost', port=6379, db=0)
 
 def get_plugin_model(model_name):
     """Get a plugin model by name"""
     # Since we're using a unified Message model, we can just return Message
     return Message
 
-def log_audit(event_type, details, service_instance=None):
-    """Helper function to create audit log entries"""
+def log_audit(event_type, details, service_instance=None, level=None):
+    """Helper function to create audit log entries
+    
+    Entries are buffered and written in batches (see core.audit), and skipped
+    if they are below the minimum level configured for their event_type.
+    
+    Args:
+        event_type: AuditLog event type
+        details: Event description
+        service_instance: Service the event relates to
+        level: Severity (e.g. logging.DEBUG for routine "nothing to do" events),
+            defaults to the level implied by event_type
+    """
     try:
-        AuditLog.objects.create(
-            event_type=event_type,
-            details=details,
-            status='success'  # Default status
-        )
+        record_audit(event_type, details, status='success', level=level)  # Default status
     except Exception as e:
         logger.error(f"Error creating audit log entry: {str(e)}")
 
+def idle_listener_key(service):
+    """Redis key that an IDLE listener refreshes while it is watching a service."""
+    return f"imap_idle:{service.id}"
+
+def is_idle_listener_active(service):
+    """Check whether an IDLE listener currently owns ingestion for a service."""
+    try:
+        return bool(redis_client.exists(idle_listener_key(service)))
+    except Exception as e:
+        logger.error(f"Step 1: Error checking IDLE listener for {service.name}: {e}")
+        return False
+
+# KEYS: the listener key; ARGV: the id of the listener giving it up
+RELEASE_IDLE_LISTENER_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+def release_idle_listener(service, listener_id):
+    """Drop an IDLE listener's claim on a service, unless another listener now holds it.
+    
+    Args:
+        service: Service the listener was watching
+        listener_id: Value the listener set on the claim
+    
+    Returns:
+        bool: True if the claim was this listener's and has been dropped
+    """
+    return bool(redis_client.eval(RELEASE_IDLE_LISTENER_SCRIPT, 1, idle_listener_key(service), listener_id))
+
+def chain_next_step(task, *args, message_ids=None):
+    """Enqueue the next pipeline step for the rows a step has just produced.
+    
+    Only active with PIPELINE_EVENT_DRIVEN; otherwise the beat jobs pick the
+    rows up on their next run. The handoff is sent once the current transaction
+    commits, so the next step never looks for rows it can't see yet, in
+    batches of MESSAGE_BATCH_SIZE ids. With PIPELINE_TRANSPORT = 'streams' it
+    goes to the step's Redis stream (see core.streams) instead of Celery.
+    Anything that fails to enqueue is left to the beat sweep.
+    
+    Args:
+        task: Celery task of the next step
+        *args: Positional arguments for the task (e.g. the service id)
+        message_ids: IDs of the messages the next step should handle
+    """
+    message_ids = [message_id for message_id in message_ids or [] if message_id is not None]
+    if not settings.PIPELINE_EVENT_DRIVEN or not message_ids:
+        return
+        
+    batch_size = settings.MESSAGE_BATCH_SIZE
+    batches = [message_ids[i:i + batch_size] for i in range(0, len(message_ids), batch_size)]
+    
+    stage = streams.stage_for_task(task.name) if settings.PIPELINE_TRANSPORT == 'streams' else None
+    
+    def enqueue():
+        for batch in batches:
+            try:
+                if stage:
+                    streams.publish(redis_client, stage, batch, *args)
+                else:
+                    task.delay(*args, message_ids=batch)
+            except Exception as e:
+                logger.error(f"Error enqueueing {task.name} for {len(batch)} messages, leaving them to the sweep: {e}")
+                
+    transaction.on_commit(enqueue)
+
+def ingest_messages(service, messages):
+    """Step 1: Store a batch of fetched messages in core_messages.
+    
+    Existing messages are found with a single service_message_id__in query and
+    the rest are inserted with one bulk_create. The unique constraint on
+    (service, service_message_id, direction) makes the insert safe against a
+    concurrent poll of the same service: conflicting rows are ignored and
+    counted as duplicates.
+    
+    Attachments the plugin spooled are moved under
+    ATTACHMENT_SPOOL_DIR/<service>/<raingull_id>/ once their message is stored,
+    and deleted for messages that aren't.
+    
+    Args:
+        service: The incoming Service the messages were fetched from
+        messages: Message dicts returned by the plugin's fetch_messages
+        
+    Returns:
+        dict: Stored, duplicate and error counts, the service_message_ids that
+            are now safely stored (new or duplicate) and the ids of the new rows
+    """
+    result = {'stored': 0, 'duplicates': 0, 'errors': 0, 'processed_ids': [], 'message_ids': []}
+    start_ns = time.time_ns()
+    
+    # Drop messages without an id and repeats within the batch
+    batch = {}
+    for msg_data in messages:
+        service_message_id = msg_data.get('service_message_id')
+        if not service_message_id:
+            logger.error(f"Step 1: Message from {service.name} has no service_message_id, skipping")
+            result['errors'] += 1
+            utils.discard_spooled_attachments(msg_data.get('payload'))
+        elif service_message_id in batch:
+            result['duplicates'] += 1
+            utils.discard_spooled_attachments(msg_data.get('payload'))
+        else:
+            batch[service_message_id] = msg_data
+    if not batch:
+        return result
+        
+    # Find messages that were already ingested (or standardized) in one query
+    existing_ids = set(Message.objects.filter(
+        Q(service=service, direction='incoming', source_service__isnull=True) |
+        Q(source_service=service),
+        service_message_id__in=list(batch)
+    ).values_list('service_message_id', flat=True))
+    
+    now = timezone.now()
+    spool_dir = Path(settings.ATTACHMENT_SPOOL_DIR) / str(service.pk)
+    new_messages = []
+    spooled = {}
+    for service_message_id, msg_data in batch.items():
+        if service_message_id in existing_ids:
+            logger.info(f"Step 1: Skipping duplicate message {service_message_id} from {service.name}")
+            result['duplicates'] += 1
+            result['processed_ids'].append(service_message_id)
+            utils.discard_spooled_attachments(msg_data.get('payload'))
+            continue
+        try:
+            raingull_id = uuid.uuid4()
+            payload, moves = utils.place_spooled_attachments(msg_data['payload'], spool_dir / str(raingull_id))
+            new_messages.append(Message(
+                raingull_id=raingull_id,
+                service=service,
+                direction='incoming',
+                status='new',
+                processing_step='ingested',
+                step_processing_time={'ingested': metrics.start_stage(now)},
+                service_message_id=service_message_id,
+                subject=msg_data['subject'],
+                sender=msg_data['sender'],
+                recipient=msg_data['recipient'],
+                timestamp=msg_data['timestamp'],
+                payload=payload,
+                created_at=now
+            ))
+            spooled[raingull_id] = (msg_data['payload'], moves)
+        except Exception as e:
+            error_msg = f"Step 1: Error storing message {service_message_id} from {service.name}: {str(e)}"
+            logger.error(error_msg)
+            log_audit('error', error_msg, service)
+            result['errors'] += 1
+            utils.discard_spooled_attachments(msg_data.get('payload'))
+            
+    if new_messages:
+        try:
+            Message.objects.bulk_create(new_messages, batch_size=settings.MESSAGE_BATCH_SIZE, ignore_conflicts=True)
+        except Exception as e:
+            error_msg = f"Step 1: Error storing {len(new_messages)} messages from {service.name}: {str(e)}"
+            logger.error(error_msg)
+            log_audit('error', error_msg, service)
+            result['errors'] += len(new_messages)
+            for payload, _ in spooled.values():
+                utils.discard_spooled_attachments(payload)
+            return result
+            
+        # ignore_conflicts doesn't report which rows were inserted, but raingull_ids are generated here
+        stored_rows = list(Message.objects.filter(
+            raingull_id__in=[message.raingull_id for message in new_messages]
+        ).values_list('id', 'raingull_id'))
+        stored_ids = {raingull_id for _, raingull_id in stored_rows}
+        for raingull_id, (payload, moves) in spooled.items():
+            if raingull_id in stored_ids:
+                utils.move_spooled_attachments(moves)
+            else:
+                utils.discard_spooled_attachments(payload)
+        result['message_ids'] = [message_id for message_id, _ in stored_rows]
+        tracing.message_spans('ingest', [raingull_id for _, raingull_id in stored_rows], start_ns, service=service.name)
+        stored = len(result['message_ids'])
+        result['stored'] = stored
+        result['duplicates'] += len(new_messages) - stored
+        result['processed_ids'].extend(message.service_message_id for message in new_messages)
+        
+    return result
+
+@tracing.traced('step1.poll')
+@instrumentation.instrumented('ingest', 'stored')
+def poll_service(service, plugin=None):
+    """Step 1: Poll a single incoming service and store its new messages.
+    
+    Args:
+        service: The incoming Service to poll
+        plugin: Optional plugin instance to reuse, e.g. one whose connection
+            has just left IMAP IDLE
+            
+    Returns:
+        dict: Stored, duplicate and error counts, or None if the service could not be polled
+    """
+    lock = None
+    owns_plugin = plugin is None
+    try:
+        # Create a unique lock key for this service
+        lock_key = f"poll_incoming:{service.id}"
+        
+        # Only one worker talks to a mailbox at a time; the lock expires on its own if a worker dies
+        # Use service-specific timeout if configured, otherwise default to 300 seconds
+        lock_timeout = service.config.get('poll_timeout', 300)
+        tracing.annotate(service=service.name)
+        lock = Lock(redis_client, lock_key, timeout=lock_timeout, blocking_timeout=5)
+        with tracing.span('lock.acquire', lock=lock_key):
+            acquired = lock.acquire()
+        if not acquired:
+            logger.info(f"Step 1: {service.name} is already being polled by another worker")
+            return None
+        
+        # Log start of polling
+        log_audit(
+            'incoming_poll',
+            f"Step 1: Checking {service.name} for new messages",
+            service
+        )
+        
+        # Get the plugin instance unless the caller already holds one
+        if plugin is None:
+            plugin = service.get_plugin_instance()
+        if not plugin:
+            error_msg = f"Step 1: Could not get plugin instance for {service.name}"
+            logger.error(error_msg)
+            log_audit('error', error_msg, service)
+            return None
+        
+        # Poll for new messages
+        try:
+            started = time.monotonic()
+            with tracing.span('plugin.fetch_messages', service=service.name):
+                messages = plugin.fetch_messages()
+            if not messages:
+                log_audit(
+                    'incoming_poll',
+                    f"Step 1: No new messages found in {service.name}",
+                    service,
+                    level=logging.DEBUG
+                )
+                return {'stored': 0, 'duplicates': 0, 'errors': 0}
+            
+            # Store messages in core_messages
+            with tracing.span('db.ingest', message_count=len(messages)):
+                result = ingest_messages(service, messages)
+            elapsed = time.monotonic() - started
+            metrics.record(redis_client, 'ingest', service, [elapsed] * result['stored'], errors=result['errors'])
+            processed_ids = result['processed_ids']
+            stored_count = result['stored']
+            chain_next_step(process_incoming_messages, service.id, message_ids=result['message_ids'])
+            duplicate_count = result['duplicates']
+            error_count = result['errors']
+            
+            # Only mark as read/deleted in IMAP after successful storage
+            if processed_ids:
+                with tracing.span('plugin.mark_processed', message_count=len(processed_ids)):
+                    if hasattr(plugin, 'mark_messages_processed'):
+                        plugin.mark_messages_processed(processed_ids)
+                    elif hasattr(plugin, 'mark_message_processed'):
+                        for service_message_id in processed_ids:
+                            plugin.mark_message_processed(service_message_id)
+            
+            # Log polling results
+            result_msg = (
+                f"Step 1: Polling {service.name} complete - "
+                f"Stored: {stored_count}, "
+                f"Duplicates: {duplicate_count}, "
+                f"Errors: {error_count}"
+            )
+            log_audit('incoming_poll', result_msg, service)
+            logger.info(result_msg)
+            
+            return {
+                'stored': stored_count,
+                'duplicates': duplicate_count,
+                'errors': error_count
+            }
+        
+        except Exception as e:
+            error_msg = f"Step 1: Error retrieving messages from {service.name}: {str(e)}"
+            logger.error(error_msg)
+            log_audit('error', error_msg, service)
+            return None
+    
+    except Exception as e:
+        error_msg = f"Step 1: Error polling service {service.name}: {str(e)}"
+        logger.error(error_msg)
+        log_audit('error', error_msg, service)
+    finally:
+        # Hand the connection back to the pool for the next poll
+        if owns_plugin and plugin and hasattr(plugin, 'disconnect'):
+            plugin.disconnect()
+        if lock:
+            # Checking the lock talks to Redis too, so an outage doesn't hide the error above
+            try:
+                if lock.owned():
+                    lock.release()
+            except Exception as e:
+                logger.error(f"Step 1: Error releasing lock for {service.name}: {e}")
+                log_audit('error', f"Step 1: Error releasing lock for {service.name}: {e}", service)
+
+def get_poll_interval(service):
+    """Get how often a service should be polled, in seconds.
+    
+    Uses the service's fetch_interval config, falling back to the default in
+    the plugin's manifest and then to DEFAULT_POLL_INTERVAL.
+    
+    Args:
+        service: The incoming Service
+        
+    Returns:
+        int: Seconds between polls
+    """
+    interval = service.config.get('fetch_interval')
+    if not interval:
+        manifest = service.plugin.manifest or {}
+        interval = manifest.get('config_schema', {}).get('fetch_interval', {}).get('default')
+    try:
+        return max(1, int(interval or settings.DEFAULT_POLL_INTERVAL))
+    except (TypeError, ValueError):
+        return settings.DEFAULT_POLL_INTERVAL
+
+def poll_due_key(service):
+    """Get the Redis key that marks a service as recently polled."""
+    return f"poll_incoming:due:{service.id}"
+
+def claim_poll_slot(service):
+    """Claim this service's next poll if its fetch_interval has elapsed.
+    
+    The key expires after the service's interval, so at most one poll per
+    interval is dispatched no matter how often the dispatcher runs.
+    
+    Args:
+        service: The incoming Service
+        
+    Returns:
+        bool: True if the service is due and should be polled now
+    """
+    try:
+        return bool(redis_client.set(poll_due_key(service), timezone.now().isoformat(), nx=True, ex=get_poll_interval(service)))
+    except Exception as e:
+        logger.error(f"Step 1: Error checking poll schedule for {service.name}: {e}")
+        return True
+
 @shared_task
+@tracing.traced('step1.dispatch')
 def poll_incoming_services():
-    """Step 1: Poll all active incoming services for new messages."""
+    """Step 1: Dispatch a poll for every incoming service that is due.
+    
+    Each due service is polled by its own poll_incoming_service task so a slow
+    server only delays itself. The results are gathered by collect_poll_results.
+    """
     try:
         # Get all active service instances with incoming enabled
         incoming_services = Service.objects.filter(
             incoming_enabled=True
-        )
+        ).select_related('plugin')
         
         total_services = incoming_services.count()
         if total_services == 0:
@@ -59,199 +427,149 @@ def poll_incoming_services():
             )
             return None
             
+        due_service_ids = []
+        for service in incoming_services:
+            # Services with a live IDLE listener are ingested as soon as mail arrives
+            if is_idle_listener_active(service):
+                logger.debug(f"Step 1: Skipping {service.name}, an IDLE listener is handling it")
+                continue
+            # Services that were polled within their fetch_interval wait for a later run
+            if not claim_poll_slot(service):
+                continue
+            due_service_ids.append(service.id)
+            
+        if not due_service_ids:
+            logger.debug("Step 1: No incoming services due for polling")
+            return {'dispatched': 0}
+            
         # Log start of polling cycle
         log_audit(
             'incoming_poll',
-            f"Step 1: Starting polling cycle for {total_services} incoming service{'s' if total_services > 1 else ''}",
+            f"Step 1: Starting polling cycle for {len(due_service_ids)} of {total_services} incoming service{'s' if total_services > 1 else ''}",
             None
         )
         
-        for service in incoming_services:
-            lock = None
-            try:
-                # Create a unique lock key for this service
-                lock_key = f"poll_incoming:{service.id}"
-                
-                # Check for stale lock
-                lock_exists = redis_client.exists(lock_key)
-                if lock_exists:
-                    lock_owner = redis_client.get(f"{lock_key}:owner")
-                    if not lock_owner:
-                        logger.warning(f"Step 1: Found stale lock for {service.name}, cleaning up")
-                        try:
-                            redis_client.delete(lock_key)
-                            redis_client.delete(f"{lock_key}:owner")
-                        except Exception as e:
-                            logger.error(f"Step 1: Error cleaning up stale lock for {service.name}: {e}")
-                            log_audit('error', f"Step 1: Error cleaning up stale lock for {service.name}: {e}", service)
-                
-                # Try to acquire a lock for this service
-                # Use service-specific timeout if configured, otherwise default to 300 seconds
-                lock_timeout = service.config.get('poll_timeout', 300)
-                lock = Lock(redis_client, lock_key, timeout=lock_timeout, blocking_timeout=5)
-                if not lock.acquire():
-                    # Check if the lock is actually held by another process
-                    lock_owner = redis_client.get(f"{lock_key}:owner")
-                    if lock_owner:
-                        logger.warning(f"Step 1: Lock for service {service.name} is held by process {lock_owner.decode()}")
-                        log_audit('warning', f"Step 1: Lock for service {service.name} is held by process {lock_owner.decode()}", service)
-                    else:
-                        logger.warning(f"Step 1: Could not acquire lock for service {service.name}, but no owner found")
-                        log_audit('warning', f"Step 1: Could not acquire lock for service {service.name}, but no owner found", service)
-                    continue
-                
-                # Log start of polling
-                log_audit(
-                    'incoming_poll',
-                    f"Step 1: Checking {service.name} for new messages",
-                    service
-                )
-                
-                # Get the plugin instance
-                plugin = service.get_plugin_instance()
-                if not plugin:
-                    error_msg = f"Step 1: Could not get plugin instance for {service.name}"
-                    logger.error(error_msg)
-                    log_audit('error', error_msg, service)
-                    continue
-                
-                # Poll for new messages
-                try:
-                    messages = plugin.fetch_messages()
-                    if not messages:
-                        log_audit(
-                            'incoming_poll',
-                            f"Step 1: No new messages found in {service.name}",
-                            service
-                        )
-                        continue
-                        
-                    # Store messages in core_messages
-                    stored_count = 0
-                    duplicate_count = 0
-                    error_count = 0
-                    
-                    for msg_data in messages:
-                        try:
-                            # Check for duplicate message - either already ingested or being standardized
-                            if Message.objects.filter(
-                                Q(service=service, service_message_id=msg_data['service_message_id']) |
-                                Q(source_service=service, service_message_id=msg_data['service_message_id'])
-                            ).exists():
-                                logger.info(f"Step 1: Skipping duplicate message {msg_data['service_message_id']} from {service.name}")
-                                duplicate_count += 1
-                                continue
-                            
-                            # Create message in core_messages
-                            message = Message.objects.create(
-                                service=service,
-                                direction='incoming',
-                                status='new',
-                                processing_step='ingested',
-                                step_processing_time={
-                                    'ingested': {
-                                        'start': timezone.now().isoformat(),
-                                        'end': None
-                                    }
-                                },
-                                service_message_id=msg_data['service_message_id'],
-                                subject=msg_data['subject'],
-                                sender=msg_data['sender'],
-                                recipient=msg_data['recipient'],
-                                timestamp=msg_data['timestamp'],
-                                payload=msg_data['payload'],
-                                created_at=timezone.now()
-                            )
-                            stored_count += 1
-                            
-                            # Only mark as read/deleted in IMAP after successful storage
-                            if hasattr(plugin, 'mark_message_processed'):
-                                plugin.mark_message_processed(msg_data['service_message_id'])
-                            
-                        except Exception as e:
-                            error_msg = f"Step 1: Error storing message {msg_data.get('service_message_id', 'unknown')} from {service.name}: {str(e)}"
-                            logger.error(error_msg)
-                            log_audit('error', error_msg, service)
-                            error_count += 1
-                            continue
-                    
-                    # Log polling results
-                    result_msg = (
-                        f"Step 1: Polling {service.name} complete - "
-                        f"Stored: {stored_count}, "
-                        f"Duplicates: {duplicate_count}, "
-                        f"Errors: {error_count}"
-                    )
-                    log_audit('incoming_poll', result_msg, service)
-                    logger.info(result_msg)
-                        
-                except Exception as e:
-                    error_msg = f"Step 1: Error retrieving messages from {service.name}: {str(e)}"
-                    logger.error(error_msg)
-                    log_audit('error', error_msg, service)
-                    continue
-                
-            except Exception as e:
-                error_msg = f"Step 1: Error polling service {service.name}: {str(e)}"
-                logger.error(error_msg)
-                log_audit('error', error_msg, service)
-            finally:
-                if lock and lock.locked():
-                    try:
-                        lock.release()
-                    except Exception as e:
-                        logger.error(f"Step 1: Error releasing lock for {service.name}: {e}")
-                        log_audit('error', f"Step 1: Error releasing lock for {service.name}: {e}", service)
+        chord(
+            group(poll_incoming_service.s(service_id) for service_id in due_service_ids)
+        )(collect_poll_results.s())
         
-        return None
+        return {'dispatched': len(due_service_ids)}
         
     except Exception as e:
         error_msg = f"Step 1: Error in poll_incoming_services task: {str(e)}"
         logger.error(error_msg)
         log_audit('error', error_msg)
-        return None
 
 @shared_task
-def process_outgoing_messages(service_id):
+def poll_incoming_service(service_id):
+    """Step 1: Poll a single incoming service.
+    
+    Args:
+        service_id: ID of the incoming Service to poll
+        
+    Returns:
+        dict: The service and its stored, duplicate and error counts
+    """
+    result = {'service_id': service_id, 'stored': 0, 'duplicates': 0, 'errors': 0, 'polled': False}
+    try:
+        service = Service.objects.select_related('plugin').get(id=service_id, incoming_enabled=True)
+    except Service.DoesNotExist:
+        logger.warning(f"Step 1: Incoming service {service_id} no longer exists or is disabled")
+        return result
+        
+    stats = poll_service(service)
+    if stats is not None:
+        result.update(stats)
+        result['polled'] = True
+    return result
+
+@shared_task
+def collect_poll_results(results):
+    """Step 1: Summarize a polling cycle once every service has been polled.
+    
+    Args:
+        results: The poll_incoming_service results of the cycle
+        
+    Returns:
+        dict: Totals across all services in the cycle
+    """
+    totals = {
+        'services': len(results),
+        'failed_services': sum(1 for result in results if not result.get('polled')),
+        'stored': sum(result.get('stored', 0) for result in results),
+        'duplicates': sum(result.get('duplicates', 0) for result in results),
+        'errors': sum(result.get('errors', 0) for result in results)
+    }
+    
+    summary_msg = (
+        f"Step 1: Polling cycle complete - "
+        f"Services: {totals['services']}, "
+        f"Failed: {totals['failed_services']}, "
+        f"Stored: {totals['stored']}, "
+        f"Duplicates: {totals['duplicates']}, "
+        f"Errors: {totals['errors']}"
+    )
+    logger.info(summary_msg)
+    log_audit('incoming_poll', summary_msg, None)
+    
+    return totals
+
+@shared_task
+@tracing.traced('step4.queue')
+@instrumentation.instrumented('queue', 'total')
+def process_outgoing_messages(service_id, message_ids=None):
     """
     Step 4: Queue outgoing messages for delivery.
     This task:
-    1. Gets all formatted messages from Step 3
-    2. For each message:
-       - Gets all active users for that service
-       - Creates queue entries in core_message_queue
-       - Updates message status to 'queued'
-    3. Handles special cases (urgent messages)
-    4. Respects delivery windows
-    5. Implements retry logic for failed queue entries
+    1. Claims a batch of formatted messages from Step 3
+    2. Loads the service's active users and the batch's existing queue entries once
+    3. Creates the queue entries in core_message_queue with one bulk_create and
+       flips the messages to 'queued' with one bulk_update
+    4. Handles special cases (urgent messages)
+    5. Respects delivery windows
+    6. Leaves failed queue entries to be retried by Step 5 when they are due
+    
+    Args:
+        service_id: ID of the outgoing Service
+        message_ids: Optional IDs of the formatted messages to queue, as handed over by Step 3
     """
     # Check if message delivery is enabled
     if not getattr(settings, 'ENABLE_MESSAGE_DELIVERY', False):
         logger.info("Step 4: Message delivery is disabled, skipping queue processing")
-        return None
+        return {'processed': 0, 'errors': 0, 'duplicates': 0, 'retries': 0, 'total': 0}
 
     try:
         service = Service.objects.get(id=service_id)
+        tracing.annotate(service=service.name)
         
         # Get batch size from service config or use default
         batch_size = service.config.get('process_batch_size', 100)
         
-        # Get formatted messages from Step 3
-        formatted_messages = Message.objects.filter(
+        # Claim formatted messages from Step 3
+        candidates = Message.objects.filter(
             service=service,
             direction='outgoing',
             status='formatted',
             processing_step='formatted'
-        )[:batch_size]  # Limit batch size
+        )
+        if message_ids is not None:
+            candidates = candidates.filter(id__in=message_ids)
+        start_ns = time.time_ns()
+        claim_token, formatted_messages = claim_rows(
+            candidates.order_by('id'),
+            batch_size,  # Limit batch size
+            settings.LOCK_TIMEOUTS['queue']
+        )
         
-        total_messages = formatted_messages.count()
+        total_messages = len(formatted_messages)
         if total_messages == 0:
             log_audit(
                 'outgoing_queue',
                 f"Step 4: No formatted messages to queue for service {service.name}",
-                service
+                service,
+                level=logging.DEBUG
             )
-            return None
+            return {'processed': 0, 'errors': 0, 'duplicates': 0, 'retries': 0, 'total': 0}
             
         # Log start of processing
         log_audit(
@@ -260,162 +578,90 @@ def process_outgoing_messages(service_id):
             service
         )
         
-        processed_count = 0
         error_count = 0
         duplicate_count = 0
         retry_count = 0
+        queue_durations = []
         
-        for message in formatted_messages:
-            lock = None
-            try:
-                # Check for duplicate queue entries
-                if MessageQueue.objects.filter(
-                    message=message,
-                    status='queued'
-                ).exists():
-                    logger.info(f"Step 4: Message {message.id} already has queue entries")
-                    duplicate_count += 1
-                    continue
-                
-                # Create a unique lock key for this message
-                lock_key = f"queue_message:{message.id}"
-                
-                # Use standardized lock timeout from settings
-                lock_timeout = settings.LOCK_TIMEOUTS['queue']
-                
-                # Check for stale lock
-                lock_exists = redis_client.exists(lock_key)
-                if lock_exists:
-                    lock_owner = redis_client.get(f"{lock_key}:owner")
-                    if not lock_owner:
-                        logger.warning(f"Step 4: Found stale lock for message {message.id}, cleaning up")
-                        try:
-                            redis_client.delete(lock_key)
-                            redis_client.delete(f"{lock_key}:owner")
-                        except Exception as e:
-                            logger.error(f"Step 4: Error cleaning up stale lock for message {message.id}: {e}")
-                            log_audit('error', f"Step 4: Error cleaning up stale lock for message {message.id}: {e}", service)
+        # Load the subscribers and the batch's existing queue entries once for the whole batch
+        recipients = [
+            user_service.user
+            for user_service in UserService.objects.filter(service=service, is_active=True).select_related('user')
+            if is_delivery_allowed(user_service.user, service)
+        ]
+        if not recipients:
+            logger.warning(f"Step 4: No active users found for service {service.name}")
+        existing_entries = {}
+        for message_id, user_id, status in MessageQueue.objects.filter(
+            message__in=formatted_messages
+        ).values_list('message_id', 'user_id', 'status'):
+            existing_entries.setdefault(message_id, {})[user_id] = status
+            
+        now = timezone.now()
+        new_entries = []
+        queued_messages = []
+        for message in formatted_messages if recipients else []:
+            entries = existing_entries.get(message.id, {})
+            if 'queued' in entries.values():
+                logger.info(f"Step 4: Message {message.id} already has queue entries")
+                duplicate_count += 1
+                continue
                 
-                # Try to acquire a lock for this message
-                lock = Lock(redis_client, lock_key, timeout=lock_timeout, blocking_timeout=5)
-                if not lock.acquire():
-                    # Check if the lock is actually held by another process
-                    lock_owner = redis_client.get(f"{lock_key}:owner")
-                    if lock_owner:
-                        logger.warning(f"Step 4: Lock for message {message.id} is held by process {lock_owner.decode()}")
-                        log_audit('warning', f"Step 4: Lock for message {message.id} is held by process {lock_owner.decode()}", service)
-                    else:
-                        logger.warning(f"Step 4: Could not acquire lock for message {message.id}, but no owner found")
-                        log_audit('warning', f"Step 4: Could not acquire lock for message {message.id}, but no owner found", service)
+            for user in recipients:
+                # Skip the original sender
+                if message.sender == user.email:
                     continue
+                # Failed entries are retried by Step 5 once their next_attempt_at is due
+                if entries.get(user.id) == 'failed':
+                    retry_count += 1
+                    continue
+                if user.id in entries:
+                    continue
+                new_entries.append(MessageQueue(
+                    message=message,
+                    user=user,
+                    service=service,
+                    status='queued',
+                    priority=1 if message.is_urgent else 0
+                ))
                 
-                try:
-                    # Update processing time for Step 3
-                    processing_time = message.step_processing_time or {}
-                    if 'formatted' in processing_time and not processing_time['formatted'].get('end'):
-                        processing_time['formatted']['end'] = timezone.now().isoformat()
-                    
-                    # Get all active users for this service
-                    active_users = UserService.objects.filter(
-                        service=service,
-                        is_active=True
-                    ).select_related('user')
-                    
-                    # Skip if no active users
-                    if not active_users.exists():
-                        logger.warning(f"Step 4: No active users found for service {service.name}")
-                        continue
-                    
-                    # Create queue entries for each user
-                    for user_service in active_users:
-                        try:
-                            # Skip the original sender
-                            if message.sender == user_service.user.email:
-                                continue
-                            
-                            # Check delivery window
-                            if not is_delivery_allowed(user_service.user, service):
-                                continue
-                            
-                            # Check for existing failed queue entries that can be retried
-                            existing_queue = MessageQueue.objects.filter(
-                                message=message,
-                                user=user_service.user,
-                                status='failed',
-                                retry_count__lt=settings.MAX_MESSAGE_RETRIES
-                            ).first()
-                            
-                            if existing_queue:
-                                # Check if enough time has passed since last retry
-                                retry_delay = min(
-                                    settings.MAX_RETRY_DELAY,
-                                    settings.MIN_RETRY_DELAY * (2 ** existing_queue.retry_count)
-                                )
-                                next_retry = existing_queue.last_retry_at + timedelta(minutes=retry_delay)
-                                
-                                if timezone.now() < next_retry:
-                                    retry_info = (
-                                        f"Step 4: Queue entry for message {message.id} not ready for retry yet "
-                                        f"(attempt {existing_queue.retry_count + 1}/{settings.MAX_MESSAGE_RETRIES}, "
-                                        f"next attempt at {next_retry}, "
-                                        f"user: {user_service.user.username})"
-                                    )
-                                    logger.info(retry_info)
-                                    log_audit('outgoing_queue', retry_info, service)
-                                    retry_count += 1
-                                    continue
-                                
-                                # Reset the queue entry for retry
-                                existing_queue.status = 'queued'
-                                existing_queue.increment_retry()
-                                existing_queue.save()
-                                logger.info(f"Step 4: Reset queue entry {existing_queue.id} for retry")
-                            else:
-                                # Create new queue entry
-                                MessageQueue.objects.create(
-                                    message=message,
-                                    user=user_service.user,
-                                    service=service,
-                                    status='queued',
-                                    priority=1 if message.is_urgent else 0,
-                                    created_at=timezone.now()
-                                )
-                            
-                        except Exception as e:
-                            error_msg = f"Step 4: Error creating queue entry for user {user_service.user.username}: {str(e)}"
-                            logger.error(error_msg)
-                            log_audit('error', error_msg, service)
-                            error_count += 1
-                            continue
-                    
-                    # Update message status
-                    message.status = 'queued'
-                    message.processing_step = 'queued'
-                    message.save()
-                    
-                    processed_count += 1
-                    logger.info(f"Step 4: Successfully queued message {message.id} for service {service.name}")
-                    
-                except Exception as e:
-                    error_msg = f"Step 4: Error processing message {message.id}: {str(e)}"
-                    logger.error(error_msg)
-                    log_audit('error', error_msg, service)
-                    error_count += 1
-                    
-                finally:
-                    if lock and lock.locked():
-                        try:
-                            lock.release()
-                        except Exception as e:
-                            logger.error(f"Step 4: Error releasing lock for message {message.id}: {e}")
-                            log_audit('error', f"Step 4: Error releasing lock for message {message.id}: {e}", service)
-                
-            except Exception as e:
-                error_msg = f"Step 4: Error processing message {message.id}: {str(e)}"
-                logger.error(error_msg)
-                log_audit('error', error_msg, service)
-                error_count += 1
-                continue
+            # Move the message from the formatted stage to the queued one and release its claim
+            queue_durations.append(metrics.finish_stage(message, 'formatted', now))
+            message.step_processing_time = {**(message.step_processing_time or {}), 'queued': metrics.start_stage(now)}
+            message.status = 'queued'
+            message.processing_step = 'queued'
+            message.updated_at = now
+            message.claimed_by = None
+            message.claimed_until = None
+            queued_messages.append(message)
+            
+        try:
+            with transaction.atomic(), tracing.span('db.write', message_count=len(queued_messages)):
+                # The unique (message, user) constraint makes a concurrent or repeated insert a no-op
+                MessageQueue.objects.bulk_create(new_entries, batch_size=settings.MESSAGE_BATCH_SIZE, ignore_conflicts=True)
+                Message.objects.bulk_update(
+                    queued_messages,
+                    ['status', 'processing_step', 'step_processing_time', 'updated_at', 'claimed_by', 'claimed_until'],
+                    batch_size=settings.MESSAGE_BATCH_SIZE
+                )
+        except Exception:
+            # Let another run pick the batch up straight away
+            release_claims(Message, claim_token)
+            raise
+        processed_count = len(queued_messages)
+        queued_ids = [message.id for message in queued_messages]
+        logger.info(f"Step 4: Queued {processed_count} messages ({len(new_entries)} entries) for service {service.name} in one batch")
+        
+        # Hand back anything that wasn't queued
+        release_claims(Message, claim_token)
+        metrics.record(redis_client, 'queue', service, queue_durations, count=processed_count, errors=error_count)
+        tracing.message_spans(
+            'queue',
+            [message.raingull_id for message in formatted_messages if message.id in queued_ids],
+            start_ns,
+            service=service.name
+        )
+        chain_next_step(send_queued_messages, service.id, message_ids=queued_ids)
         
         # Log processing results
         result_msg = (
@@ -458,7 +704,9 @@ def is_delivery_allowed(user, service):
     return True
 
 @shared_task
-def send_queued_messages(service_id):
+@tracing.traced('step5.send')
+@instrumentation.instrumented('send', 'total')
+def send_queued_messages(service_id, message_ids=None):
     """
     Step 5: Send queued messages to their destinations.
     This task:
@@ -467,36 +715,53 @@ def send_queued_messages(service_id):
     3. Updates message status and tracking
     4. Tracks delivery status for each user
     5. Marks original messages as fully processed when all copies are sent
+    
+    Args:
+        service_id: ID of the outgoing Service
+        message_ids: Optional IDs of the messages whose queue entries to send, as handed over by Step 4
     """
     # Check if message delivery is enabled
     if not getattr(settings, 'ENABLE_MESSAGE_DELIVERY', False):
         logger.info("Step 5: Message delivery is disabled, skipping message sending")
-        return None
+        return {'sent': 0, 'failed': 0, 'deferred': 0, 'total': 0}
 
     try:
         service = Service.objects.get(id=service_id)
+        tracing.annotate(service=service.name)
         
         # Get batch size from settings
         batch_size = settings.MESSAGE_BATCH_SIZE
         
-        # Get all queued and failed messages that haven't exceeded retry limit
-        queued_messages = MessageQueue.objects.filter(
+        # Claim queued messages and failed ones whose retry is due; rows out of retries have no next attempt
+        retry_policy = RetryPolicy.for_service(service)
+        candidates = MessageQueue.objects.filter(
             Q(status='queued') | 
-            Q(status='failed', retry_count__lt=settings.MAX_MESSAGE_RETRIES)
-        ).select_related(
-            'message',
-            'user',
-            'service'
-        ).order_by('created_at')[:batch_size]  # Limit batch size
-        
-        message_count = queued_messages.count()
+            Q(status='failed', retry_count__lt=retry_policy.max_retries),
+            due(),
+            service=service
+        )
+        if message_ids is not None:
+            candidates = candidates.filter(message_id__in=message_ids)
+        start_ns = time.time_ns()
+        claim_token, queued_messages = claim_rows(
+            candidates.select_related(
+                'message',
+                'user',
+                'service'
+            ).order_by('created_at'),
+            batch_size,  # Limit batch size
+            settings.LOCK_TIMEOUTS['message_delivery']
+        )
+        
+        message_count = len(queued_messages)
         if message_count == 0:
             log_audit(
                 'outgoing_send',
                 "Step 5: No messages to send in queue",
-                None
+                None,
+                level=logging.DEBUG
             )
-            return None
+            return {'sent': 0, 'failed': 0, 'deferred': 0, 'total': 0}
             
         # Log start of sending cycle
         log_audit(
@@ -507,195 +772,83 @@ def send_queued_messages(service_id):
         
         total_sent = 0
         total_failed = 0
-        total_retrying = 0
+        total_deferred = 0
+        retry_after = 0
         
-        # Group messages by service to optimize plugin initialization
-        messages_by_service = {}
-        for message in queued_messages:
-            service_id = message.service.id
-            if service_id not in messages_by_service:
-                messages_by_service[service_id] = []
-            messages_by_service[service_id].append(message)
-        
-        for service_id, service_messages in messages_by_service.items():
+        plugin = None
+        try:
+            # Get plugin instance once for the batch
+            plugin = service.get_plugin_instance()
+            if not plugin:
+                error_msg = f"Step 5: Could not get plugin instance for {service.name}"
+                logger.error(error_msg)
+                log_audit('error', error_msg, service)
+            else:
+                # Send each message once to all of its recipients, within the shared rate limits
+                rate_limiter = RateLimiter(redis_client, service)
+                engine = DeliveryEngine(service, plugin, rate_limiter=rate_limiter)
+                result = engine.deliver(queued_messages)
+                total_sent = result['sent']
+                total_failed = result['failed']
+                total_deferred = result['deferred']
+                retry_after = rate_limiter.retry_after
+                metrics.record(
+                    redis_client,
+                    'send',
+                    service,
+                    engine.send_durations,
+                    errors=total_failed,
+                    retries=result['retries'],
+                    deferred=total_deferred
+                )
+                tracing.message_spans(
+                    'send',
+                    {entry.message.raingull_id for entry in queued_messages if entry.status == 'sent'},
+                    start_ns,
+                    service=service.name
+                )
+                if result['completed']:
+                    log_audit(
+                        'outgoing_send',
+                        f"Step 5: All copies of {result['completed']} message{'s' if result['completed'] > 1 else ''} have been sent",
+                        service
+                    )
+        except Exception as e:
+            error_msg = f"Step 5: Error processing messages for service {service.name}: {str(e)}"
+            logger.error(error_msg)
+            log_audit('error', error_msg, service)
+        finally:
+            # Hand the connection back to the pool for the next batch
+            if plugin and hasattr(plugin, 'disconnect'):
+                plugin.disconnect()
+            # Hand back anything that wasn't sent or rescheduled
+            release_claims(MessageQueue, claim_token)
+            
+        # Pick up rate-limited messages as soon as the buckets have refilled. Only one follow-up
+        # per service is pending at a time, and it sends everything due rather than this run's
+        # messages, so throttled sweeps and event-driven runs don't each start another chain
+        if total_deferred:
+            countdown = max(1, int(retry_after + 0.999))
             try:
-                # Get plugin instance once per service
-                plugin = service_messages[0].service.get_plugin_instance()
-                if not plugin:
-                    error_msg = f"Step 5: Could not get plugin instance for {service_messages[0].service.name}"
-                    logger.error(error_msg)
-                    log_audit('error', error_msg, service_messages[0].service)
-                    continue
-                
-                for message in service_messages:
-                    try:
-                        # Check if this is a retry and if we need to wait
-                        if message.status == 'failed':
-                            # Calculate next retry time with exponential backoff
-                            retry_delay = min(
-                                settings.MAX_RETRY_DELAY,
-                                settings.MIN_RETRY_DELAY * (2 ** message.retry_count)
-                            )
-                            next_retry = message.last_retry_at + timedelta(minutes=retry_delay)
-                            if timezone.now() < next_retry:
-                                retry_info = (
-                                    f"Step 5: Message {message.message.id} not ready for retry yet "
-                                    f"(attempt {message.retry_count + 1}/{settings.MAX_MESSAGE_RETRIES}, "
-                                    f"next attempt at {next_retry}, "
-                                    f"user: {message.user.username}, "
-                                    f"service: {message.service.name})"
-                                )
-                                logger.info(retry_info)
-                                log_audit(
-                                    'outgoing_send',
-                                    retry_info,
-                                    message.service
-                                )
-                                total_retrying += 1
-                                continue
-                        
-                        # Create a unique lock key for this message
-                        lock_key = f"send_message:{message.message.id}"
-                        
-                        # Check for stale lock
-                        lock_exists = redis_client.exists(lock_key)
-                        if lock_exists:
-                            lock_owner = redis_client.get(f"{lock_key}:owner")
-                            if not lock_owner:
-                                logger.warning(f"Step 5: Found stale lock for message {message.message.id}, cleaning up")
-                                try:
-                                    redis_client.delete(lock_key)
-                                    redis_client.delete(f"{lock_key}:owner")
-                                except Exception as e:
-                                    logger.error(f"Step 5: Error cleaning up stale lock for message {message.message.id}: {e}")
-                                    log_audit('error', f"Step 5: Error cleaning up stale lock for message {message.message.id}: {e}")
-                        
-                        # Try to acquire a lock for this message
-                        lock = Lock(redis_client, lock_key, timeout=settings.LOCK_TIMEOUTS['send'], blocking_timeout=5)
-                        if not lock.acquire():
-                            # Check if the lock is actually held by another process
-                            lock_owner = redis_client.get(f"{lock_key}:owner")
-                            if lock_owner:
-                                logger.warning(f"Step 5: Lock for message {message.message.id} is held by process {lock_owner.decode()}")
-                                log_audit('warning', f"Step 5: Lock for message {message.message.id} is held by process {lock_owner.decode()}")
-                            else:
-                                logger.warning(f"Step 5: Could not acquire lock for message {message.message.id}, but no owner found")
-                                log_audit('warning', f"Step 5: Could not acquire lock for message {message.message.id}, but no owner found")
-                            continue
-                        
-                        try:
-                            # Get the user's service activation
-                            try:
-                                user_activation = UserService.objects.get(
-                                    user=message.user,
-                                    service=message.service,
-                                    is_active=True
-                                )
-                            except UserService.DoesNotExist:
-                                error_msg = f"Step 5: User {message.user.username} is not activated for service {message.service.name}"
-                                logger.error(error_msg)
-                                message.status = 'failed'
-                                message.error_message = error_msg
-                                message.retry_count += 1
-                                message.last_retry_at = timezone.now()
-                                message.save()
-                                total_failed += 1
-                                log_audit('error', error_msg, message.service)
-                                continue
-                            
-                            # Get the recipient email from the user's service activation
-                            recipient_email = user_activation.config.get('email_address')
-                            if not recipient_email:
-                                error_msg = f"Step 5: No email address configured for user {message.user.username} in service {message.service.name}"
-                                logger.error(error_msg)
-                                message.status = 'failed'
-                                message.error_message = error_msg
-                                message.retry_count += 1
-                                message.last_retry_at = timezone.now()
-                                message.save()
-                                total_failed += 1
-                                log_audit('error', error_msg, message.service)
-                                continue
-                            
-                            # Prepare message data for sending
-                            message_data = {
-                                'to': recipient_email,
-                                'subject': message.message.subject,
-                                'body': message.message.payload.get('content', ''),
-                                'attachments': message.message.attachments
-                            }
-                            
-                            # Send the message
-                            success = plugin.send_message(message_data)
-                            
-                            # Update message status based on success
-                            if success:
-                                message.status = 'sent'
-                                message.processed_at = timezone.now()
-                                message.save()
-                                
-                                # Check if all copies of this message have been sent
-                                unsent_copies = MessageQueue.objects.filter(
-                                    message=message.message,
-                                    status__in=['queued', 'failed']
-                                ).count()
-                                
-                                if unsent_copies == 0:
-                                    # All copies sent, mark the original message as fully processed
-                                    message.message.status = 'sent'
-                                    message.message.processing_step = 'sent'
-                                    message.message.save()
-                                    log_audit(
-                                        'outgoing_send',
-                                        f"Step 5: All copies of message {message.message.id} have been sent",
-                                        None
-                                    )
-                                
-                                total_sent += 1
-                                logger.info(f"Step 5: Successfully sent message {message.message.id} to {recipient_email}")
-                            else:
-                                error_msg = "Step 5: Failed to send message"
-                                logger.error(error_msg)
-                                message.status = 'failed'
-                                message.error_message = error_msg
-                                message.retry_count += 1
-                                message.last_retry_at = timezone.now()
-                                message.save()
-                                total_failed += 1
-                                log_audit('error', error_msg, message.service)
-                            
-                        finally:
-                            if lock and lock.locked():
-                                try:
-                                    lock.release()
-                                except Exception as e:
-                                    logger.error(f"Step 5: Error releasing lock for message {message.message.id}: {e}")
-                                    log_audit('error', f"Step 5: Error releasing lock for message {message.message.id}: {e}")
-                        
-                    except Exception as e:
-                        error_msg = f"Step 5: Error processing message {message.message.id}: {str(e)}"
-                        logger.error(error_msg)
-                        message.status = 'failed'
-                        message.error_message = str(e)
-                        message.retry_count += 1
-                        message.last_retry_at = timezone.now()
-                        message.save()
-                        total_failed += 1
-                        log_audit('error', error_msg, message.service)
-                        continue
-                        
+                scheduled = redis_client.set(f"send_deferred:{service.id}", 1, nx=True, ex=countdown)
             except Exception as e:
-                error_msg = f"Step 5: Error processing messages for service {service_id}: {str(e)}"
-                logger.error(error_msg)
-                log_audit('error', error_msg)
-                continue
-                
+                logger.error(f"Step 5: Error scheduling a follow-up for {service.name}, leaving it to the sweep: {e}")
+                scheduled = False
+            if scheduled:
+                send_queued_messages.apply_async((service.id,), countdown=countdown)
+            log_audit(
+                'outgoing_send',
+                f"Step 5: Rate limit reached for {service.name}, deferred {total_deferred} message{'s' if total_deferred > 1 else ''} "
+                + (f"to a follow-up in {countdown}s" if scheduled else "to the follow-up already scheduled"),
+                service
+            )
+            
         # Log final sending summary
         summary_msg = (
             f"Step 5: Sending complete - "
             f"Sent: {total_sent}, "
             f"Failed: {total_failed}, "
-            f"Retrying: {total_retrying}, "
+            f"Rate limited: {total_deferred}, "
             f"Total: {message_count}"
         )
         logger.info(summary_msg)
@@ -708,7 +861,7 @@ def send_queued_messages(service_id):
         return {
             'sent': total_sent,
             'failed': total_failed,
-            'retrying': total_retrying,
+            'deferred': total_deferred,
             'total': message_count
         }
         
@@ -718,12 +871,119 @@ def send_queued_messages(service_id):
         log_audit('error', error_msg)
         return None
 
+def standardize_batch(service, batch_size, message_ids=None):
+    """Step 2: Standardize one batch of ingested messages for a service.
+    
+    Claims up to batch_size ingested rows, builds the standardized copies in
+    memory and writes them with one bulk_create, then flips (and releases) the
+    originals with one bulk_update, all inside a single transaction. Rows
+    claimed by another worker are skipped, so several workers can drain the
+    same service at once.
+    
+    Args:
+        service: The incoming Service whose messages should be standardized
+        batch_size: Maximum number of messages to claim
+        message_ids: Only standardize these ingested messages
+        
+    Returns:
+        dict: Processed, duplicate and total counts for the batch
+    """
+    candidates = Message.objects.filter(
+        service=service,
+        direction='incoming',
+        status='new',
+        processing_step='ingested',
+        source_service__isnull=True
+    )
+    if message_ids is not None:
+        candidates = candidates.filter(id__in=message_ids)
+    start_ns = time.time_ns()
+    token, messages = claim_rows(
+        candidates.order_by('id'),
+        batch_size,
+        settings.LOCK_TIMEOUTS['process']
+    )
+    if not messages:
+        return {'processed': 0, 'duplicates': 0, 'total': 0}
+        
+    try:
+        with transaction.atomic():
+            # Find messages that already have a standardized version in one query
+            already_standardized = set(Message.objects.filter(
+                source_service=service,
+                direction='incoming',
+                service_message_id__in=[message.service_message_id for message in messages]
+            ).values_list('service_message_id', flat=True))
+            
+            now = timezone.now()
+            standardized_messages = []
+            durations = []
+            duplicate_count = 0
+            for message in messages:
+                # Close the ingested stage
+                durations.append(metrics.finish_stage(message, 'ingested', now))
+                
+                # Mark original message as processed and release the claim
+                message.status = 'processed'
+                message.processing_step = 'standardized'
+                message.processed_at = now
+                message.updated_at = now
+                message.claimed_by = None
+                message.claimed_until = None
+                
+                if message.service_message_id in already_standardized:
+                    logger.info(f"Step 2: Message {message.service_message_id} already has a standardized version")
+                    duplicate_count += 1
+                    continue
+                    
+                standardized_messages.append(Message(
+                    service=service,
+                    direction='incoming',
+                    status='standardized',
+                    processing_step='standardized',
+                    step_processing_time={'standardized': metrics.start_stage(now)},
+                    source_service=message.service,
+                    service_message_id=message.service_message_id,  # Preserve the IMAP UID
+                    raingull_id=message.raingull_id,  # Copy the raingull_id from the original message
+                    subject=message.subject,
+                    sender=message.sender,
+                    recipient=message.recipient,
+                    timestamp=message.timestamp,
+                    payload=message.payload,
+                    created_at=now
+                ))
+                
+            with tracing.span('db.write', message_count=len(standardized_messages)):
+                Message.objects.bulk_create(standardized_messages, batch_size=settings.MESSAGE_BATCH_SIZE)
+                Message.objects.bulk_update(
+                    messages,
+                    ['status', 'processing_step', 'processed_at', 'step_processing_time', 'updated_at', 'claimed_by', 'claimed_until'],
+                    batch_size=settings.MESSAGE_BATCH_SIZE
+                )
+            chain_next_step(distribute_outgoing_messages, message_ids=[message.pk for message in standardized_messages])
+    except Exception:
+        # Let another run pick the batch up straight away
+        release_claims(Message, token)
+        raise
+        
+    metrics.record(redis_client, 'standardize', service, durations, count=len(standardized_messages))
+    tracing.message_spans('standardize', [message.raingull_id for message in standardized_messages], start_ns, service=service.name)
+    logger.info(f"Step 2: Standardized {len(standardized_messages)} messages from {service.name} in one batch")
+    return {
+        'processed': len(standardized_messages),
+        'duplicates': duplicate_count,
+        'total': len(messages)
+    }
+
 @shared_task
-def process_incoming_messages(service_id=None):
+@tracing.traced('step2.standardize')
+@instrumentation.instrumented('standardize', 'processed')
+def process_incoming_messages(service_id=None, message_ids=None):
     """Step 2: Process incoming messages.
     
     Args:
         service_id: Optional service ID to process messages for. If None, processes for all services.
+        message_ids: Optional IDs of the ingested messages to process, as handed over by Step 1
     """
     try:
         # Get services to process
@@ -739,7 +999,7 @@ def process_incoming_messages(service_id=None):
                 "Step 2: No active incoming services configured",
                 None
             )
-            return None
+            return {'processed': 0, 'errors': 0, 'duplicates': 0, 'total_services': 0}
             
         # Log start of processing cycle
         log_audit(
@@ -752,175 +1012,39 @@ def process_incoming_messages(service_id=None):
         total_processed = 0
         total_errors = 0
         total_duplicates = 0
-        total_retries = 0
         
         for service in services:
             # Get batch size from service config or use default
-            batch_size = service.config.get('process_batch_size', 100)
-            
-            # Get all new messages that need standardization
-            messages = Message.objects.filter(
-                service=service,
-                direction='incoming',
-                status='new',
-                processing_step='ingested'
-            ).select_related('service')[:batch_size]  # Limit batch size
+            batch_size = service.config.get('process_batch_size', settings.MESSAGE_BATCH_SIZE)
             
-            message_count = messages.count()
-            if message_count == 0:
+            try:
+                result = standardize_batch(service, batch_size, message_ids)
+            except Exception as e:
+                error_msg = f"Step 2: Error processing standardized messages for {service.name}: {str(e)}"
+                logger.error(error_msg)
+                log_audit('error', error_msg, service)
+                total_errors += 1
+                continue
+                
+            if result['total'] == 0:
                 log_audit(
                     'incoming_process',
                     f"Step 2: No new messages to process for service {service.name}",
-                    service
+                    service,
+                    level=logging.DEBUG
                 )
                 continue
                 
-            # Log start of processing
-            log_audit(
-                'incoming_process',
-                f"Step 2: Processing {message_count} new message{'s' if message_count > 1 else ''} for service {service.name}",
-                service
-            )
-            
-            # Initialize service-specific counters
-            processed_count = 0
-            error_count = 0
-            duplicate_count = 0
-            retry_count = 0
-            
-            for message in messages:
-                lock = None
-                try:
-                    # Check for duplicate standardized message using source_service and service_message_id
-                    if Message.objects.filter(
-                        source_service=message.service,
-                        service_message_id=message.service_message_id,
-                        status='standardized'
-                    ).exists():
-                        logger.info(f"Step 2: Message {message.service_message_id} already has a standardized version")
-                        duplicate_count += 1
-                        continue
-                    
-                    # Handle retry logic for failed messages
-                    if message.status == 'failed':
-                        retry_count = message.retry_count or 0
-                        if retry_count >= settings.MAX_RETRIES:
-                            logger.warning(f"Step 2: Message {message.service_message_id} has exceeded max retries ({settings.MAX_RETRIES})")
-                            continue
-                        message.retry_count = retry_count + 1
-                        message.status = 'new'
-                        message.save()
-                    
-                    # Create a unique lock key for this message
-                    lock_key = f"process_message:{message.id}"
-                    
-                    # Get lock timeout from service config or use default
-                    lock_timeout = service.config.get('process_timeout', 60)
-                    
-                    # Check for stale lock
-                    lock_exists = redis_client.exists(lock_key)
-                    if lock_exists:
-                        lock_owner = redis_client.get(f"{lock_key}:owner")
-                        if not lock_owner:
-                            logger.warning(f"Step 2: Found stale lock for message {message.service_message_id}, cleaning up")
-                            try:
-                                redis_client.delete(lock_key)
-                                redis_client.delete(f"{lock_key}:owner")
-                            except Exception as e:
-                                logger.error(f"Step 2: Error cleaning up stale lock for message {message.service_message_id}: {e}")
-                                log_audit('error', f"Step 2: Error cleaning up stale lock for message {message.service_message_id}: {e}", service)
-                    
-                    # Try to acquire a lock for this message
-                    lock = Lock(redis_client, lock_key, timeout=lock_timeout, blocking_timeout=5)
-                    if not lock.acquire():
-                        # Check if the lock is actually held by another process
-                        lock_owner = redis_client.get(f"{lock_key}:owner")
-                        if lock_owner:
-                            logger.warning(f"Step 2: Lock for message {message.service_message_id} is held by process {lock_owner.decode()}")
-                            log_audit('warning', f"Step 2: Lock for message {message.service_message_id} is held by process {lock_owner.decode()}", service)
-                        else:
-                            logger.warning(f"Step 2: Could not acquire lock for message {message.service_message_id}, but no owner found")
-                            log_audit('warning', f"Step 2: Could not acquire lock for message {message.service_message_id}, but no owner found", service)
-                        continue
-                    
-                    try:
-                        # Update processing time for Step 1
-                        processing_time = message.step_processing_time or {}
-                        if 'ingested' in processing_time and not processing_time['ingested'].get('end'):
-                            processing_time['ingested']['end'] = timezone.now().isoformat()
-                        
-                        # Create standardized message
-                        standardized_message = Message.objects.create(
-                            service=service,
-                            direction='incoming',
-                            status='standardized',
-                            processing_step='standardized',
-                            step_processing_time={
-                                'standardized': {
-                                    'start': timezone.now().isoformat(),
-                                    'end': None
-                                }
-                            },
-                            source_service=message.service,
-                            service_message_id=message.service_message_id,  # Preserve the IMAP UID
-                            raingull_id=message.raingull_id,  # Copy the raingull_id from the original message
-                            subject=message.subject,
-                            sender=message.sender,
-                            recipient=message.recipient,
-                            timestamp=message.timestamp,
-                            payload=message.payload,
-                            created_at=timezone.now()
-                        )
-                        
-                        # Mark original message as processed
-                        message.status = 'processed'
-                        message.processing_step = 'standardized'
-                        message.processed_at = timezone.now()
-                        message.save()
-                        
-                        processed_count += 1
-                        logger.info(f"Step 2: Successfully processed standardized message {message.service_message_id} from {service.name}")
-                        
-                    except Exception as e:
-                        error_msg = f"Step 2: Error processing standardized message {message.service_message_id} from {service.name}: {str(e)}"
-                        logger.error(error_msg)
-                        log_audit('error', error_msg, service)
-                        error_count += 1
-                        
-                        # Mark original message as failed
-                        message.status = 'failed'
-                        message.error_message = str(e)
-                        message.save()
-                        
-                    finally:
-                        if lock and lock.locked():
-                            try:
-                                lock.release()
-                            except Exception as e:
-                                logger.error(f"Step 2: Error releasing lock for message {message.service_message_id}: {e}")
-                                log_audit('error', f"Step 2: Error releasing lock for message {message.service_message_id}: {e}", service)
-                    
-                except Exception as e:
-                    error_msg = f"Step 2: Error processing standardized message {message.service_message_id}: {str(e)}"
-                    logger.error(error_msg)
-                    log_audit('error', error_msg, service)
-                    error_count += 1
-                    continue
-            
             # Update total counters
-            total_processed += processed_count
-            total_errors += error_count
-            total_duplicates += duplicate_count
-            total_retries += retry_count
+            total_processed += result['processed']
+            total_duplicates += result['duplicates']
             
             # Log processing results for this service
             result_msg = (
                 f"Step 2: Processing complete for {service.name} - "
-                f"Processed: {processed_count}, "
-                f"Errors: {error_count}, "
-                f"Duplicates: {duplicate_count}, "
-                f"Retries: {retry_count}, "
-                f"Total: {message_count}"
+                f"Processed: {result['processed']}, "
+                f"Duplicates: {result['duplicates']}, "
+                f"Total: {result['total']}"
             )
             logger.info(result_msg)
             log_audit('incoming_process', result_msg, service)
@@ -931,7 +1055,6 @@ def process_incoming_messages(service_id=None):
             f"Processed: {total_processed}, "
             f"Errors: {total_errors}, "
             f"Duplicates: {total_duplicates}, "
-            f"Retries: {total_retries}, "
             f"Total Services: {total_services}"
         )
         logger.info(final_result_msg)
@@ -941,7 +1064,6 @@ def process_incoming_messages(service_id=None):
             'processed': total_processed,
             'errors': total_errors,
             'duplicates': total_duplicates,
-            'retries': total_retries,
             'total_services': total_services
         }
         
@@ -952,22 +1074,29 @@ def process_incoming_messages(service_id=None):
         return None
 
 @shared_task
-def distribute_outgoing_messages():
-    """Step 3: Distribute messages to outgoing services."""
+@tracing.traced('step3.distribute')
+@instrumentation.instrumented('format', 'total')
+def distribute_outgoing_messages(message_ids=None):
+    """Step 3: Distribute messages to outgoing services.
+    
+    Args:
+        message_ids: Optional IDs of the standardized messages to distribute,
+            as handed over by Step 2. If None, takes the oldest pending batch.
+    """
     try:
         # Get all service instances with outgoing enabled
-        service_instances = Service.objects.filter(
+        service_instances = list(Service.objects.filter(
             outgoing_enabled=True
-        )
+        ).select_related('plugin'))
         
-        total_services = service_instances.count()
+        total_services = len(service_instances)
         if total_services == 0:
             log_audit(
                 'outgoing_process',
                 "Step 3: No active outgoing services configured",
                 None
             )
-            return None
+            return {'distributed': 0, 'errors': 0, 'duplicates': 0, 'total': 0}
             
         # Log start of processing cycle
         log_audit(
@@ -976,21 +1105,30 @@ def distribute_outgoing_messages():
             None
         )
         
-        # Get new standardized messages that need distribution
-        messages = Message.objects.filter(
+        # Claim new standardized messages that need distribution
+        candidates = Message.objects.filter(
             status='standardized',  # Changed from 'new' to 'standardized'
             direction='incoming',
             processing_step='standardized'
-        ).select_related('service')
+        )
+        if message_ids is not None:
+            candidates = candidates.filter(id__in=message_ids)
+        start_ns = time.time_ns()
+        claim_token, messages = claim_rows(
+            candidates.select_related('service').order_by('id'),
+            settings.MESSAGE_BATCH_SIZE,
+            settings.LOCK_TIMEOUTS['distribute']
+        )
         
-        message_count = messages.count()
+        message_count = len(messages)
         if message_count == 0:
             log_audit(
                 'outgoing_process',
                 "Step 3: No new standardized messages to distribute",
-                None
+                None,
+                level=logging.DEBUG
             )
-            return None
+            return {'distributed': 0, 'errors': 0, 'duplicates': 0, 'total': 0}
             
         log_audit(
             'outgoing_process',
@@ -1002,115 +1140,90 @@ def distribute_outgoing_messages():
         error_count = 0
         duplicate_count = 0
         
+        # Resolve each outgoing plugin once for the whole run
+        plugins = {}
+        for service_instance in service_instances:
+            try:
+                plugin = service_instance.get_plugin_instance()
+            except Exception as e:
+                plugin = None
+                logger.error(f"Step 3: Error loading plugin for {service_instance.name}: {str(e)}")
+            if not plugin:
+                error_msg = f"Step 3: Could not get plugin instance for {service_instance.name}"
+                logger.error(error_msg)
+                log_audit('error', error_msg, service_instance)
+                continue
+            plugins[service_instance.id] = (service_instance, plugin)
+            
+        # Find the (message, service) pairs that already have a formatted copy in one query
+        existing_pairs = set(Message.objects.filter(
+            direction='outgoing',
+            raingull_id__in=[message.raingull_id for message in messages],
+            service_id__in=list(plugins)
+        ).values_list('raingull_id', 'service_id'))
+        
+        formatted_messages = []
+        distributed_messages = []
+        format_durations = {}
+        now = timezone.now()
         for message in messages:
-            lock = None
             try:
-                # Create a unique lock key for this message
-                lock_key = f"distribute_message:{message.id}"
-                
-                # Check for stale lock
-                lock_exists = redis_client.exists(lock_key)
-                if lock_exists:
-                    lock_owner = redis_client.get(f"{lock_key}:owner")
-                    if not lock_owner:
-                        logger.warning(f"Step 3: Found stale lock for message {message.id}, cleaning up")
-                        try:
-                            redis_client.delete(lock_key)
-                            redis_client.delete(f"{lock_key}:owner")
-                        except Exception as e:
-                            logger.error(f"Step 3: Error cleaning up stale lock for message {message.id}: {e}")
-                            log_audit('error', f"Step 3: Error cleaning up stale lock for message {message.id}: {e}")
+                message_complete = len(plugins) == len(service_instances)
+                message_copies = []
                 
-                # Try to acquire a lock for this message
-                lock = Lock(redis_client, lock_key, timeout=60, blocking_timeout=5)
-                if not lock.acquire():
-                    # Check if the lock is actually held by another process
-                    lock_owner = redis_client.get(f"{lock_key}:owner")
-                    if lock_owner:
-                        logger.warning(f"Step 3: Lock for message {message.id} is held by process {lock_owner.decode()}")
-                        log_audit('warning', f"Step 3: Lock for message {message.id} is held by process {lock_owner.decode()}")
-                    else:
-                        logger.warning(f"Step 3: Could not acquire lock for message {message.id}, but no owner found")
-                        log_audit('warning', f"Step 3: Could not acquire lock for message {message.id}, but no owner found")
-                    continue
-                
-                try:
-                    # Update processing time for Step 2
-                    processing_time = message.step_processing_time or {}
-                    if 'standardized' in processing_time and not processing_time['standardized'].get('end'):
-                        processing_time['standardized']['end'] = timezone.now().isoformat()
+                # Process for each service
+                for service_instance, plugin in plugins.values():
+                    # Skip if this service already has a formatted copy
+                    if (message.raingull_id, service_instance.id) in existing_pairs:
+                        duplicate_count += 1
+                        continue
+                        
+                    # Translate the message to the service format
+                    try:
+                        with tracing.span('plugin.translate', service=service_instance.name, raingull_id=str(message.raingull_id)):
+                            translated_message = plugin.translate_from_raingull(message)
+                    except Exception as e:
+                        error_msg = f"Step 3: Error translating message for {service_instance.name}: {str(e)}"
+                        logger.error(error_msg)
+                        log_audit('error', error_msg, service_instance)
+                        message_complete = False
+                        continue
+                        
+                    # Plugins either return a ready payload or the content fields directly
+                    payload = translated_message.get('payload') or {
+                        'content': translated_message.get('content', ''),
+                        'metadata': translated_message.get('metadata', {})
+                    }
                     
-                    # Process for each service
-                    for service_instance in service_instances:
-                        try:
-                            # Skip if this service already has a formatted copy
-                            if Message.objects.filter(
-                                source_service=message.service,
-                                service=service_instance,
-                                direction='outgoing',
-                                status='formatted'
-                            ).exists():
-                                duplicate_count += 1
-                                continue
-                            
-                            # Get the plugin instance
-                            plugin = service_instance.get_plugin_instance()
-                            if not plugin:
-                                error_msg = f"Step 3: Could not get plugin instance for {service_instance.name}"
-                                logger.error(error_msg)
-                                log_audit('error', error_msg, service_instance)
-                                continue
-                            
-                            # Translate the message to the service format
-                            try:
-                                translated_message = plugin.translate_from_raingull(message)
-                            except Exception as e:
-                                error_msg = f"Step 3: Error translating message for {service_instance.name}: {str(e)}"
-                                logger.error(error_msg)
-                                log_audit('error', error_msg, service_instance)
-                                continue
-                            
-                            # Create the formatted message
-                            formatted_message = Message.objects.create(
-                                service=service_instance,
-                                direction='outgoing',
-                                status='formatted',
-                                processing_step='formatted',
-                                step_processing_time={
-                                    'formatted': {
-                                        'start': timezone.now().isoformat(),
-                                        'end': timezone.now().isoformat()  # Set end time immediately since formatting is complete
-                                    }
-                                },
-                                source_service=message.service,
-                                raingull_id=message.raingull_id,  # Copy the raingull_id from the original message
-                                subject=translated_message.get('subject', ''),
-                                sender=translated_message.get('from', ''),
-                                recipient=translated_message.get('to', ''),
-                                payload=translated_message.get('payload', {}),
-                                created_at=timezone.now()
-                            )
-                            
-                            # Update original message processing step
-                            message.processing_step = 'formatted'
-                            message.save()
-                            
-                            total_distributed += 1
-                            logger.info(f"Step 3: Successfully formatted message {message.id} for {service_instance.name}")
-                            
-                        except Exception as e:
-                            error_msg = f"Step 3: Error processing message for {service_instance.name}: {str(e)}"
-                            logger.error(error_msg)
-                            log_audit('error', error_msg, service_instance)
-                            continue
-                            
-                finally:
-                    if lock.locked():
-                        try:
-                            lock.release()
-                        except Exception as e:
-                            logger.error(f"Step 3: Error releasing lock for message {message.id}: {e}")
-                            log_audit('error', f"Step 3: Error releasing lock for message {message.id}: {e}")
+                    # Build the formatted message
+                    message_copies.append(Message(
+                        service=service_instance,
+                        direction='outgoing',
+                        status='formatted',
+                        processing_step='formatted',
+                        step_processing_time={'formatted': metrics.start_stage(now)},
+                        source_service=message.service,
+                        raingull_id=message.raingull_id,  # Copy the raingull_id from the original message
+                        subject=translated_message.get('subject', ''),
+                        sender=translated_message.get('from', message.sender),
+                        recipient=translated_message.get('to', ''),
+                        timestamp=message.timestamp,
+                        payload=payload,
+                        attachments=translated_message.get('attachments') or [],
+                        created_at=now
+                    ))
+                    
+                formatted_messages.extend(message_copies)
+                total_distributed += len(message_copies)
+                
+                # Move the original on once every outgoing service has its copy
+                if message_complete:
+                    format_durations.setdefault(message.service, []).append(metrics.finish_stage(message, 'standardized', now))
+                    message.processing_step = 'formatted'
+                    message.updated_at = now
+                    message.claimed_by = None
+                    message.claimed_until = None
+                    distributed_messages.append(message)
                     
             except Exception as e:
                 error_msg = f"Step 3: Error processing message: {str(e)}"
@@ -1119,6 +1232,31 @@ def distribute_outgoing_messages():
                 error_count += 1
                 continue
                 
+        # Write the formatted copies and move the originals on together
+        with tracing.span('db.write', message_count=len(formatted_messages)), transaction.atomic():
+            Message.objects.bulk_create(formatted_messages, batch_size=settings.MESSAGE_BATCH_SIZE)
+            Message.objects.bulk_update(
+                distributed_messages,
+                ['processing_step', 'step_processing_time', 'updated_at', 'claimed_by', 'claimed_until'],
+                batch_size=settings.MESSAGE_BATCH_SIZE
+            )
+        logger.info(f"Step 3: Formatted {len(formatted_messages)} copies of {len(distributed_messages)} messages")
+        
+        # Hand each outgoing service the copies made for it
+        copies_by_service = {}
+        for formatted_message in formatted_messages:
+            copies_by_service.setdefault(formatted_message.service_id, []).append(formatted_message.pk)
+        for outgoing_service_id, copy_ids in copies_by_service.items():
+            chain_next_step(process_outgoing_messages, outgoing_service_id, message_ids=copy_ids)
+        
+        # Hand back anything that wasn't moved on to Step 4
+        release_claims(Message, claim_token)
+        for incoming_service, durations in format_durations.items():
+            metrics.record(redis_client, 'format', incoming_service, durations)
+        if error_count:
+            metrics.record(redis_client, 'format', errors=error_count)
+        tracing.message_spans('format', [message.raingull_id for message in distributed_messages], start_ns)
+        
         # Log distribution results
         result_msg = (
             f"Step 3: Distribution complete - "
@@ -1232,7 +1370,7 @@ def distribute_messages():
         return None
 
 class UserDeliveryWindow(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     start_time = models.TimeField()
     end_time = models.TimeField()
     days_of_week = models.CharField(max_length=7)  # e.g., "MTWTFSS"
@@ -1247,6 +1385,35 @@ class ServiceDeliveryWindow(models.Model):
     timezone = models.CharField(max_length=50)
     override_global = models.BooleanField(default=False)
 
+@shared_task
+def maintain_audit_log():
+    """Hourly audit log upkeep: rollups, day partitions and retention."""
+    try:
+        # Make sure this worker's buffered events are counted
+        flush_audit()
+        result = audit_storage.maintain()
+        logger.info(f"Audit log maintenance complete: {result}")
+        return result
+    except Exception as e:
+        error_msg = f"Error in maintain_audit_log task: {str(e)}"
+        logger.error(error_msg)
+        log_audit('error', error_msg)
+        return None
+
+@shared_task
+def purge_attachment_spool():
+    """Hourly sweep of spooled attachment files past ATTACHMENT_RETENTION_DAYS."""
+    try:
+        deleted = utils.purge_attachment_spool()
+        if deleted:
+            logger.info(f"Purged {deleted} spooled attachment files")
+        return deleted
+    except Exception as e:
+        error_msg = f"Error in purge_attachment_spool task: {str(e)}"
+        logger.error(error_msg)
+        log_audit('error', error_msg)
+        return None
+
 @shared_task
 def monitor_message_processing():
     """
@@ -0,0 +1,45 @@
+from django.test import TestCase, override_settings
+from redis import Redis
+from redis.exceptions import RedisError
+
+from core import streams
+
+class StageConsumerTests(TestCase):
+    """Acknowledgement of Redis Streams entries by StageConsumer.
+
+    These need a Redis server on localhost and use db 15, so they don't touch
+    the pipeline's own streams.
+    """
+
+    def setUp(self):
+        self.client = Redis(host='localhost', port=6379, db=15)
+        try:
+            self.client.ping()
+        except RedisError:
+            self.skipTest("Redis is not available on localhost:6379")
+        self.key = streams.stream_key('queue')
+        self.client.delete(self.key)
+        self.addCleanup(self.client.delete, self.key)
+        self.consumer = streams.StageConsumer(self.client, 'queue', consumer='test')
+        self.consumer.ensure_group()
+
+    def pending(self):
+        return self.client.xpending(self.key, streams.CONSUMER_GROUP)['pending']
+
+    @override_settings(ENABLE_MESSAGE_DELIVERY=True)
+    def test_failed_entry_stays_pending(self):
+        # Step 4 logs a missing service and returns None instead of raising
+        streams.publish(self.client, 'queue', [1], service_id=999999)
+        self.consumer.run_once()
+
+        self.assertEqual(self.consumer.stats['failed'], 1)
+        self.assertEqual(self.consumer.stats['handled'], 0)
+        self.assertEqual(self.pending(), 1)
+
+    @override_settings(ENABLE_MESSAGE_DELIVERY=False)
+    def test_handled_entry_is_acknowledged(self):
+        streams.publish(self.client, 'queue', [1], service_id=999999)
+        self.consumer.run_once()
+
+        self.assertEqual(self.consumer.stats['handled'], 1)
+        self.assertEqual(self.pending(), 0)
@@ -0,0 +1,224 @@
+"""
+Optional OpenTelemetry tracing for the message pipeline.
+
+With TRACING['enabled'] on and the opentelemetry-sdk package installed, each
+step run is traced as a span (step1.poll, step2.standardize, ...) with child
+spans around plugin I/O (plugin.*), database work (db.*) and lock or rate
+limit waits (lock.*), so a slow run shows where its time went.
+
+Steps work on batches, so a message's journey is traced separately: each
+step also emits one message.<stage> span per message in a trace whose id is
+the message's raingull_id (a UUID is exactly the 128 bits of a trace id).
+Every copy of a message carries the same raingull_id, so searching the
+tracing backend for that trace id shows the message's whole trip across
+workers, each span linked to the step run that handled it.
+
+Spans go to an OTLP collector (TRACING['exporter'] = 'otlp', needs
+opentelemetry-exporter-otlp), to a file of JSON lines ('file') or to stdout
+('console'). Without the packages, or with tracing off, every hook is a no-op.
+
+Like the connection pools, the tracer is per process: exporters run a
+background thread, so a forked worker sets up its own on first use.
+"""
+
+import functools
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import TraceIdRatioBased
+    from opentelemetry.trace import Link, NonRecordingSpan, SpanContext, TraceFlags
+except ImportError:  # Tracing is optional
+    trace = None
+
+_lock = threading.Lock()
+_provider = None
+_tracer = None
+_pid = None
+
+def tracing_settings() -> Dict:
+    """Get the TRACING settings with defaults filled in."""
+    return {
+        'enabled': False,
+        'exporter': 'otlp',
+        'endpoint': None,
+        'file': 'raingull-traces.jsonl',
+        'service_name': 'raingull',
+        'sample_rate': 1.0,
+        **getattr(settings, 'TRACING', {})
+    }
+
+def _make_exporter(options: Dict):
+    """Create the span exporter named in the settings."""
+    exporter = options['exporter']
+    if exporter == 'otlp':
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=options['endpoint']) if options['endpoint'] else OTLPSpanExporter()
+    if exporter == 'file':
+        out = open(options['file'], 'a', buffering=1)
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + os.linesep)
+    if exporter == 'console':
+        return ConsoleSpanExporter()
+    raise ValueError(f"Unknown tracing exporter {exporter}, expected otlp, file or console")
+
+def get_tracer():
+    """Get this process's tracer, setting it up on first use.
+    
+    Returns:
+        Tracer, or None if tracing is off or OpenTelemetry isn't installed
+    """
+    global _provider, _tracer, _pid
+    if _pid == os.getpid():
+        return _tracer
+    with _lock:
+        if _pid == os.getpid():
+            return _tracer
+        _provider = _tracer = None
+        options = tracing_settings()
+        if options['enabled'] and trace is None:
+            logger.warning("Tracing is enabled but opentelemetry-sdk is not installed")
+        elif options['enabled']:
+            try:
+                # Sampling by trace id keeps or drops a message's whole trip on every worker alike
+                provider = TracerProvider(
+                    resource=Resource.create({'service.name': options['service_name']}),
+                    sampler=TraceIdRatioBased(options['sample_rate'])
+                )
+                provider.add_span_processor(BatchSpanProcessor(_make_exporter(options)))
+                _provider = provider
+                _tracer = provider.get_tracer('raingull')
+            except Exception as e:
+                logger.error(f"Error setting up tracing, continuing without it: {str(e)}")
+        _pid = os.getpid()
+        return _tracer
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator:
+    """Trace a block of work as a child of the current span.
+    
+    Exceptions are recorded on the span and re-raised.
+    
+    Args:
+        name: Span name, e.g. "plugin.send_bulk"
+        **attributes: Span attributes; None values are left out
+    
+    Yields:
+        Span, or None when tracing is off
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes=_attributes(attributes)) as current:
+        yield current
+
+def traced(name: str):
+    """Decorator that traces each call of a pipeline step as a span.
+    
+    Args:
+        name: Span name, e.g. "step2.standardize"
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if get_tracer() is None:
+                return func(*args, **kwargs)
+            message_ids = kwargs.get('message_ids')
+            with span(name, message_count=len(message_ids) if message_ids is not None else None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def annotate(**attributes) -> None:
+    """Add attributes to the current span, e.g. the service once it has been loaded."""
+    if get_tracer() is None:
+        return
+    trace.get_current_span().set_attributes(_attributes(attributes))
+
+@contextmanager
+def use_span(parent) -> Iterator:
+    """Make a span current in this thread, e.g. a step's span in a delivery worker thread.
+    
+    Args:
+        parent: Span from span(), or None
+    """
+    if parent is None or trace is None:
+        yield
+        return
+    with trace.use_span(parent, end_on_exit=False):
+        yield
+
+def current_span():
+    """Get the span current in this thread, or None when tracing is off."""
+    if get_tracer() is None:
+        return None
+    return trace.get_current_span()
+
+def message_spans(stage: str, raingull_ids: Iterable, start_ns: int, end_ns: Optional[int] = None, **attributes) -> None:
+    """Record one span per message in the trace keyed by its raingull_id.
+    
+    Each span covers the message's part of a step run and links to the
+    current span (the step run), so the batch it was processed in can be
+    found from the message's trace.
+    
+    Args:
+        stage: Pipeline stage, e.g. "standardize"; the span is named message.<stage>
+        raingull_ids: raingull_ids (UUIDs or strings) of the messages
+        start_ns: When the step started working on the messages (time.time_ns())
+        end_ns: When it finished, defaults to now
+        **attributes: Span attributes shared by all the messages, e.g. service
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return
+    end_ns = end_ns or time.time_ns()
+    current = trace.get_current_span().get_span_context()
+    links = [Link(current)] if current.is_valid else []
+    shared = _attributes(attributes)
+    for raingull_id in raingull_ids:
+        try:
+            trace_id = (raingull_id if isinstance(raingull_id, uuid.UUID) else uuid.UUID(str(raingull_id))).int
+        except ValueError:
+            continue
+        # A remote parent in the message's trace; its span id is random as there's no real root span
+        parent = SpanContext(
+            trace_id=trace_id,
+            span_id=random.getrandbits(64) or 1,
+            is_remote=True,
+            trace_flags=TraceFlags(TraceFlags.SAMPLED)
+        )
+        message_span = tracer.start_span(
+            f"message.{stage}",
+            context=trace.set_span_in_context(NonRecordingSpan(parent)),
+            links=links,
+            attributes={**shared, 'raingull.id': str(raingull_id)},
+            start_time=start_ns
+        )
+        message_span.end(end_time=end_ns)
+
+def flush() -> None:
+    """Export the spans waiting in this process (e.g. before a worker exits)."""
+    if _provider is not None and _pid == os.getpid():
+        _provider.force_flush()
+
+def _attributes(attributes: Dict) -> Dict:
+    """Drop None values and use the raingull. prefix for bare names (raingull_id -> raingull.id)."""
+    return {
+        (name if '.' in name else f"raingull.{name.removeprefix('raingull_')}"): value
+        for name, value in attributes.items()
+        if value is not None
+    }
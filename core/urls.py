@@ -23,6 +23,8 @@ urlpatterns = [
     path('test/activate-service/', views.activate_service, name='activate_service'),
     path('test/send-queued/', views.send_queued_messages, name='send_queued_messages'),
     path('audit/', views.audit_log, name='audit_log'),
+    path('messages/', views.message_browser, name='message_browser'),
+    path('metrics', views.metrics, name='metrics'),
     path('profile/', views.user_profile, name='my_profile'),
     path('profile/<int:user_id>/', views.user_profile, name='user_profile'),
     path('plugins/', views.plugin_manager, name='plugin_manager'),
@@ -3,65 +3,276 @@ import smtplib
 import logging
 import os
 import json
+import time
 from pathlib import Path
 from django.conf import settings
 from core.models import Plugin
+from core.connection_pool import imap_pool, smtp_pool
 
 logger = logging.getLogger(__name__)
 
-def get_imap_connection(host, port, username, password, use_ssl=True):
+def get_security_mode(value, default='TLS'):
+    """
+    Normalize a service's security setting to 'TLS', 'STARTTLS' or 'None'.
+    
+    Service configs store the manifest select values ("TLS", "STARTTLS",
+    "None"/"none"), while older callers pass a bool meaning "use SSL/TLS".
+    
+    Args:
+        value: The configured value (str, bool or None)
+        default (str): Mode to use when nothing is configured
+        
+    Returns:
+        str: 'TLS', 'STARTTLS' or 'None'
+    """
+    if value is None or value == '':
+        return default
+    if value is True:
+        return 'TLS'
+    if value is False:
+        return 'None'
+    mode = str(value).strip().upper()
+    if mode in ('TLS', 'SSL', 'SSL/TLS'):
+        return 'TLS'
+    if mode == 'STARTTLS':
+        return 'STARTTLS'
+    return 'None'
+
+def _open_imap_connection(host, port, username, password, security):
+    """Open and authenticate a new IMAP connection."""
+    if security == 'TLS':
+        connection = imaplib.IMAP4_SSL(host, port)
+    else:
+        connection = imaplib.IMAP4(host, port)
+        if security == 'STARTTLS':
+            connection.starttls()
+            
+    if username:
+        connection.login(username, password)
+    return connection
+
+def _open_smtp_connection(host, port, username, password, security):
+    """Open and authenticate a new SMTP connection."""
+    if security == 'TLS':
+        connection = smtplib.SMTP_SSL(host, port)
+    else:
+        connection = smtplib.SMTP(host, port)
+        if security == 'STARTTLS':
+            connection.starttls()
+            
+    if username:
+        connection.login(username, password)
+    return connection
+
+def get_imap_connection(host, port, username, password, use_ssl=True, pool_key=None, setup=None):
     """
     Create and return an IMAP connection.
     
+    When pool_key is given the connection is checked out of the worker's IMAP
+    pool, reusing an authenticated session for that key if one is idle. Pooled
+    connections must be handed back with release_imap_connection().
+    
     Args:
         host (str): IMAP server hostname
         port (int): IMAP server port
         username (str): IMAP username
         password (str): IMAP password
-        use_ssl (bool): Whether to use SSL/TLS
+        use_ssl (bool or str): Whether to use SSL/TLS, or a security mode ('TLS', 'STARTTLS', 'None')
+        pool_key: Key to pool the connection under (normally the Service id), or None for a private connection
+        setup (callable): Called with each newly opened connection, e.g. to enable extensions
         
     Returns:
         imaplib.IMAP4 or imaplib.IMAP4_SSL: IMAP connection object
     """
-    try:
-        if use_ssl:
-            connection = imaplib.IMAP4_SSL(host, port)
-        else:
-            connection = imaplib.IMAP4(host, port)
-            
-        connection.login(username, password)
+    security = get_security_mode(use_ssl)
+    
+    def factory():
+        connection = _open_imap_connection(host, port, username, password, security)
+        if setup:
+            setup(connection)
         return connection
+        
+    try:
+        if pool_key is None:
+            return factory()
+        return imap_pool.acquire((pool_key, host, port, username, security), (host, port), factory)
     except Exception as e:
         logger.error(f"Failed to establish IMAP connection: {str(e)}")
         raise
 
-def get_smtp_connection(host, port, username, password, use_ssl=True):
+def get_smtp_connection(host, port, username, password, use_ssl=True, pool_key=None):
     """
     Create and return an SMTP connection.
     
+    When pool_key is given the connection is checked out of the worker's SMTP
+    pool, reusing an authenticated session for that key if one is idle. Pooled
+    connections must be handed back with release_smtp_connection().
+    
     Args:
         host (str): SMTP server hostname
         port (int): SMTP server port
         username (str): SMTP username
         password (str): SMTP password
-        use_ssl (bool): Whether to use SSL/TLS
+        use_ssl (bool or str): Whether to use SSL/TLS (False means STARTTLS), or a security mode ('TLS', 'STARTTLS', 'None')
+        pool_key: Key to pool the connection under (normally the Service id), or None for a private connection
         
     Returns:
         smtplib.SMTP or smtplib.SMTP_SSL: SMTP connection object
     """
+    # Historically use_ssl=False meant "plain SMTP upgraded with STARTTLS"
+    security = 'STARTTLS' if use_ssl is False else get_security_mode(use_ssl, default='STARTTLS')
+    
+    def factory():
+        return _open_smtp_connection(host, port, username, password, security)
+        
     try:
-        if use_ssl:
-            connection = smtplib.SMTP_SSL(host, port)
-        else:
-            connection = smtplib.SMTP(host, port)
-            connection.starttls()
-            
-        connection.login(username, password)
-        return connection
+        if pool_key is None:
+            return factory()
+        return smtp_pool.acquire((pool_key, host, port, username, security), (host, port), factory)
     except Exception as e:
         logger.error(f"Failed to establish SMTP connection: {str(e)}")
         raise
 
+def release_imap_connection(connection, discard=False):
+    """
+    Hand an IMAP connection back to the pool, or log out if it is not pooled.
+    
+    Args:
+        connection: Connection returned by get_imap_connection()
+        discard (bool): Close the connection instead of keeping it for reuse
+    """
+    if imap_pool.release(connection, discard=discard):
+        return
+    try:
+        connection.logout()
+    except Exception as e:
+        logger.debug(f"Error closing IMAP connection: {str(e)}")
+
+def release_smtp_connection(connection, discard=False):
+    """
+    Hand an SMTP connection back to the pool, or quit if it is not pooled.
+    
+    Args:
+        connection: Connection returned by get_smtp_connection()
+        discard (bool): Close the connection instead of keeping it for reuse
+    """
+    if smtp_pool.release(connection, discard=discard):
+        return
+    try:
+        connection.quit()
+    except Exception as e:
+        logger.debug(f"Error closing SMTP connection: {str(e)}")
+
+def purge_attachment_spool(retention_days=None):
+    """
+    Delete spooled attachment files older than the retention period.
+    
+    Stored messages keep their attachments under ATTACHMENT_SPOOL_DIR/<service>/<message>/,
+    and nothing else removes them; this also catches files left behind by a worker
+    that stopped mid-fetch. Directories left empty are removed too.
+    
+    Args:
+        retention_days (int): Age in days after which files are deleted; defaults to
+            ATTACHMENT_RETENTION_DAYS
+        
+    Returns:
+        int: Number of files deleted
+    """
+    if retention_days is None:
+        retention_days = settings.ATTACHMENT_RETENTION_DAYS
+    root = Path(settings.ATTACHMENT_SPOOL_DIR)
+    if not root.is_dir():
+        return 0
+    
+    cutoff = time.time() - retention_days * 86400
+    deleted = 0
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        for filename in filenames:
+            path = Path(dirpath) / filename
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    deleted += 1
+            except OSError as e:
+                logger.warning(f"Could not remove spooled attachment {path}: {str(e)}")
+        if Path(dirpath) != root:
+            try:
+                # Only succeeds once the directory is empty
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+    return deleted
+
+def place_spooled_attachments(payload, directory):
+    """
+    Point a fetched message's spooled attachments at their place under the stored message.
+    
+    Incoming plugins spool attachments while a message is parsed, before Step 1
+    knows whether it will be stored, so each message's files start out in a
+    directory of their own. Step 1 stores the message with the payload returned
+    here, then moves the files with move_spooled_attachments(), or deletes them
+    with discard_spooled_attachments() if the message wasn't stored.
+    
+    Args:
+        payload (dict): The fetched message's payload
+        directory (Path): Directory for the stored message's attachments
+        
+    Returns:
+        tuple: The payload with the final paths, and (spooled path, final path) pairs
+    """
+    moves = []
+    attachments = []
+    for attachment in payload.get('attachments') or []:
+        if isinstance(attachment, dict) and attachment.get('path'):
+            target = Path(directory) / Path(attachment['path']).name
+            moves.append((attachment['path'], str(target)))
+            attachment = {**attachment, 'path': str(target)}
+        attachments.append(attachment)
+    if not moves:
+        return payload, moves
+    return {**payload, 'attachments': attachments}, moves
+
+def move_spooled_attachments(moves):
+    """
+    Move a stored message's spooled attachments to their final paths.
+    
+    Args:
+        moves (list): (spooled path, final path) pairs from place_spooled_attachments()
+    """
+    for source, target in moves:
+        try:
+            Path(target).parent.mkdir(parents=True, exist_ok=True)
+            os.replace(source, target)
+        except OSError as e:
+            logger.error(f"Could not move spooled attachment {source} to {target}: {str(e)}")
+    _remove_spool_directories(source for source, _ in moves)
+
+def discard_spooled_attachments(payload):
+    """
+    Delete the spooled attachments of a fetched message that won't be stored.
+    
+    Args:
+        payload (dict): The fetched message's payload
+    """
+    paths = [
+        attachment['path'] for attachment in (payload or {}).get('attachments') or []
+        if isinstance(attachment, dict) and attachment.get('path')
+    ]
+    for path in paths:
+        try:
+            Path(path).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Could not remove spooled attachment {path}: {str(e)}")
+    _remove_spool_directories(paths)
+
+def _remove_spool_directories(paths):
+    """Remove the directories holding the given files once they are empty."""
+    for directory in {Path(path).parent for path in paths}:
+        try:
+            directory.rmdir()
+        except OSError:
+            pass
+
 def discover_plugins():
     """Discovers and registers plugins from the plugins directory."""
     try:
@@ -3,7 +3,7 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from core.models import Service, Plugin, Message, UserService, MessageQueue, AuditLog, ServiceMessageTemplate, User
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.module_loading import import_string
 import json
@@ -13,7 +13,6 @@ from datetime import datetime, timezone, timedelta
 from email.utils import parsedate_to_datetime
 from django.utils import timezone
 import logging
-from django.db.models import Count
 import pytz
 from django.conf import settings
 from django.template.loader import get_template, render_to_string
@@ -28,6 +27,10 @@ from django.urls import reverse
 from django.db import models
 from celery import shared_task
 from core.generate_models import generate_models_file
+from core.audit_storage import event_counts
+from core.pagination import KeysetPaginator
+from core.metrics import render as render_metrics
+from urllib.parse import urlencode
 
 logger = logging.getLogger(__name__)
 
@@ -886,26 +889,78 @@ def audit_log(request):
     # Get 24-hour activity summary
     twenty_four_hours_ago = timezone.now() - timedelta(hours=24)
     
-    # Get recent activity by type
-    recent_activity = AuditLog.objects.filter(
-        created_at__gte=twenty_four_hours_ago
-    ).values('event_type').annotate(count=Count('id')).order_by('-count')
+    # Get recent activity by type, from the hourly rollups
+    recent_activity = event_counts(twenty_four_hours_ago)
     
     # Get error count
-    error_count = AuditLog.objects.filter(
-        created_at__gte=twenty_four_hours_ago,
-        status='error'
-    ).count()
+    error_count = sum(row['count'] for row in event_counts(twenty_four_hours_ago, status='error'))
     
-    # Get all audit logs
-    audit_logs = AuditLog.objects.all().order_by('-created_at')
+    # Get one page of audit logs, optionally filtered by type and status
+    audit_logs = AuditLog.objects.all()
+    filters = {}
+    for name in ('event_type', 'status'):
+        value = request.GET.get(name)
+        if value:
+            audit_logs = audit_logs.filter(**{name: value})
+            filters[name] = value
+    page = KeysetPaginator(audit_logs).page(after=request.GET.get('after'), before=request.GET.get('before'))
     
     return render(request, 'core/audit_log.html', {
         'recent_activity': recent_activity,
         'error_count': error_count,
-        'audit_logs': audit_logs,
+        'audit_logs': page,
+        'page': page,
+        'filters': filters,
+        'filter_query': urlencode(filters),
     })
 
+@login_required
+@user_passes_test(lambda u: u.is_superuser)
+def message_browser(request):
+    """
+    View for browsing messages, newest first, without loading their payloads
+    """
+    messages_qs = Message.objects.select_related('service').defer('payload', 'attachments', 'step_processing_time')
+    filters = {}
+    for name in ('service', 'direction', 'status', 'processing_step'):
+        value = request.GET.get(name)
+        if value and name == 'service':
+            # Ignore a malformed service id rather than failing the page
+            try:
+                value = str(int(value))
+            except ValueError:
+                value = None
+        if value:
+            messages_qs = messages_qs.filter(**{name: value})
+            filters[name] = value
+    page = KeysetPaginator(messages_qs).page(after=request.GET.get('after'), before=request.GET.get('before'))
+    
+    return render(request, 'core/message_browser.html', {
+        'page': page,
+        'services': Service.objects.order_by('name').only('id', 'name'),
+        'directions': Message._meta.get_field('direction').choices,
+        'statuses': Message._meta.get_field('status').choices,
+        'filters': filters,
+        'filter_query': urlencode(filters),
+    })
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint for the pipeline metrics (see core.metrics)
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not (token and secrets.compare_digest(authorization, f"Bearer {token}")) and not request.user.is_superuser:
+        return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    
+    from core.tasks import redis_client
+    try:
+        body = render_metrics(redis_client)
+    except Exception as e:
+        logger.error(f"Error rendering metrics: {str(e)}")
+        return HttpResponse(f"Metrics unavailable: {str(e)}\n", status=503, content_type='text/plain')
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @login_required
 def user_profile(request, user_id=None):
     # If user_id is provided, get that user's profile
@@ -1,19 +1,318 @@
 import imaplib
+import binascii
 import email
-from email.header import decode_header
-import json
-from typing import Dict, List, Optional, Any
+import mimetypes
+import re
+import select
+import threading
+import time
+import uuid
+from email.header import decode_header, make_header
+from email.parser import BytesFeedParser
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Tuple
 from datetime import datetime
 import logging
 from pathlib import Path
 from django.http import JsonResponse
 from dateutil.parser import parse as parse_date
+from django.conf import settings
 from django.utils import timezone
 
-from core.models import PluginInterface, Message, Service
+from core.plugin_registry import plugin_registry
+from core.models import PluginInterface, Service, ServiceSyncState
+from core.utils import get_imap_connection, release_imap_connection
 
 logger = logging.getLogger(__name__)
 
+UID_PATTERN = re.compile(rb'UID (\d+)')
+SIZE_PATTERN = re.compile(rb'RFC822\.SIZE (\d+)')
+
+# Bytes requested per partial FETCH of a message above stream_threshold
+FETCH_PIECE_SIZE = 512 * 1024
+
+# Headers kept in the payload metadata; Received chains, DKIM signatures and the like are dropped
+KEPT_HEADERS = {
+    'from', 'to', 'cc', 'reply-to', 'date', 'subject', 'message-id', 'in-reply-to',
+    'references', 'list-id', 'mime-version', 'content-type'
+}
+
+BODY_TYPES = ('text/plain', 'text/html')
+
+# Longest line the streaming parser buffers; longer ones are passed on in pieces
+MAX_LINE_LENGTH = 64 * 1024
+
+# Bytes kept of each header block; further header lines are dropped
+MAX_HEADER_SIZE = 256 * 1024
+
+class IdleLineReader:
+    """Reads CRLF-terminated lines straight from a socket, with a timeout.
+    
+    Used while a connection is in IDLE, where imaplib's blocking reader cannot
+    be interrupted to re-issue the command before the server drops us.
+    """
+    
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b''
+        
+    def readline(self, timeout: float) -> Optional[bytes]:
+        """Read one line without its CRLF.
+        
+        Args:
+            timeout: Seconds to wait for a complete line
+            
+        Returns:
+            The line, or None if the timeout expired first
+        """
+        deadline = time.monotonic() + timeout
+        while b'\r\n' not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            # TLS sockets may already hold decrypted bytes that select() can't see
+            if not getattr(self.sock, 'pending', lambda: 0)():
+                readable, _, _ = select.select([self.sock], [], [], remaining)
+                if not readable:
+                    return None
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise imaplib.IMAP4.abort("Connection closed during IDLE")
+            self.buffer += chunk
+        line, self.buffer = self.buffer.split(b'\r\n', 1)
+        return line
+
+class BodyDecoder:
+    """Decodes a part's body line by line for its Content-Transfer-Encoding.
+    
+    The line break before a boundary belongs to the boundary, so each line's
+    break is only written once the next line arrives.
+    """
+    
+    def __init__(self, encoding: str, write):
+        self.encoding = encoding
+        self.write = write
+        self._pending = b''
+        self._base64 = b''
+        
+    def line(self, line: bytes) -> None:
+        content = line.rstrip(b'\r\n')
+        if self.encoding == 'base64':
+            # Lines needn't hold whole 4-character groups, so carry the rest over
+            data = self._base64 + b''.join(content.split())
+            whole = len(data) - len(data) % 4
+            self._base64 = data[whole:]
+            if whole:
+                try:
+                    self.write(binascii.a2b_base64(data[:whole]))
+                except binascii.Error:
+                    pass
+        elif self.encoding == 'quoted-printable':
+            self.write(self._pending)
+            soft = content.rstrip(b' \t').endswith(b'=')
+            self.write(binascii.a2b_qp(content))
+            self._pending = b'' if soft else line[len(content):]
+        else:
+            self.write(self._pending)
+            self.write(content)
+            self._pending = line[len(content):]
+            
+    def flush(self) -> None:
+        """Write the last line break, for a body that isn't followed by a boundary."""
+        self.write(self._pending)
+        self._pending = b''
+
+class StreamingEmailParser:
+    """Parses an email fed to it in pieces, without holding its attachments in memory.
+    
+    Header blocks are parsed with BytesFeedParser, but part bodies are
+    decoded a line at a time as they arrive: the first text/plain and
+    text/html parts are kept up to max_body_size characters each, and every
+    other part (attachments, inline images, forwarded messages, ...) is
+    written straight to a file under spool_dir. Each parser writes to a
+    directory of its own, so a message fetched again, or another with the
+    same Message-ID, never touches the files of one already stored; Step 1
+    moves the files under the message once it is stored.
+    
+    Lines are buffered up to MAX_LINE_LENGTH and header blocks kept up to
+    MAX_HEADER_SIZE, so a message without line breaks can't fill memory.
+    """
+    
+    def __init__(self, spool_dir: Path, max_body_size: int):
+        """Initialize the parser.
+        
+        Args:
+            spool_dir: Directory to write attachments to, created when needed
+            max_body_size: Characters of each body to keep
+        """
+        self.spool_dir = Path(spool_dir) / uuid.uuid4().hex
+        self.max_body_size = max_body_size
+        self.message = None
+        self.bodies = {}
+        self.truncated = False
+        self.attachments = []
+        self._buffer = b''
+        self._continued = False
+        self._boundaries = []
+        self._headers = []
+        self._header_size = 0
+        self._part = None
+        
+    def feed(self, data: bytes) -> None:
+        """Parse the next piece of the message."""
+        lines = (self._buffer + data).split(b'\n')
+        self._buffer = lines.pop()
+        for line in lines:
+            self._line(line + b'\n')
+        while len(self._buffer) > MAX_LINE_LENGTH:
+            cut = MAX_LINE_LENGTH
+            # Don't split a quoted-printable escape such as =3D
+            escape = self._buffer.rfind(b'=', cut - 2, cut)
+            if escape != -1:
+                cut = escape
+            self._line(self._buffer[:cut])
+            self._buffer = self._buffer[cut:]
+            
+    def close(self) -> email.message.Message:
+        """Finish parsing.
+        
+        Returns:
+            The message's headers, as a Message without a payload
+        """
+        if self._buffer:
+            self._line(self._buffer)
+            self._buffer = b''
+        if self._headers is not None:
+            self._start_body()
+        if self._part and not self._boundaries:
+            self._part['decoder'].flush()
+        self._end_part()
+        return self.message
+        
+    def discard(self) -> None:
+        """Delete the files spooled so far, e.g. for a message that won't be stored."""
+        if self._part and 'file' in self._part:
+            self._part['file'].close()
+        self._part = None
+        for attachment in self.attachments:
+            Path(attachment['path']).unlink(missing_ok=True)
+        self.attachments = []
+        try:
+            self.spool_dir.rmdir()
+        except OSError:
+            pass
+        
+    def _line(self, line: bytes) -> None:
+        """Handle one line of the message, or a piece of an overlong one."""
+        # Only a whole line, or the start of one, can end headers or be a boundary
+        starts_line, self._continued = not self._continued, not line.endswith(b'\n')
+        
+        if self._headers is not None:
+            if starts_line and not line.strip(b'\r\n'):
+                self._headers.append(line)
+                self._start_body()
+            elif self._header_size + len(line) <= MAX_HEADER_SIZE:
+                self._headers.append(line)
+                self._header_size += len(line)
+            return
+            
+        if starts_line and self._boundaries and line.startswith(b'--'):
+            marker = line.rstrip()
+            for depth in range(len(self._boundaries) - 1, -1, -1):
+                boundary = self._boundaries[depth]
+                if marker == boundary:
+                    # The next part of this multipart; any open inner multiparts are cut short
+                    self._end_part()
+                    del self._boundaries[depth + 1:]
+                    self._headers = []
+                    self._header_size = 0
+                    return
+                if marker == boundary + b'--':
+                    # The end of this multipart; what follows is its epilogue
+                    self._end_part()
+                    del self._boundaries[depth:]
+                    return
+                    
+        if self._part:
+            self._part['decoder'].line(line)
+            
+    def _start_body(self) -> None:
+        """Parse the header block just read and set up where its body goes."""
+        parser = BytesFeedParser()
+        parser.feed(b''.join(self._headers).rstrip(b'\r\n') + b'\r\n\r\n')
+        headers = parser.close()
+        self._headers = None
+        if self.message is None:
+            self.message = headers
+            
+        content_type = headers.get_content_type()
+        boundary = headers.get_boundary()
+        if headers.get_content_maintype() == 'multipart' and boundary:
+            # Its preamble, up to the first boundary, is skipped
+            self._boundaries.append(b'--' + boundary.encode('ascii', errors='replace'))
+            return
+            
+        encoding = str(headers.get('Content-Transfer-Encoding', '')).strip().lower()
+        inline = headers.get_content_disposition() != 'attachment'
+        if content_type in BODY_TYPES and inline and content_type not in self.bodies:
+            self._part = {'headers': headers, 'type': content_type, 'data': bytearray(), 'dropped': False}
+            self.bodies[content_type] = ''
+            self._part['decoder'] = BodyDecoder(encoding, self._keep_text)
+        elif content_type in BODY_TYPES and inline:
+            # Later inline text parts (e.g. list footers) aren't kept, as before
+            self._part = None
+        else:
+            self._part = self._open_spool(headers, content_type)
+            self._part['decoder'] = BodyDecoder(encoding, self._part['file'].write)
+            
+    def _keep_text(self, data: bytes) -> None:
+        """Add decoded bytes to the body being read, up to the size cap."""
+        part = self._part
+        # Up to four bytes per character, cut to max_body_size characters once decoded
+        room = self.max_body_size * 4 - len(part['data'])
+        if len(data) > room:
+            part['dropped'] = True
+            data = data[:max(0, room)]
+        part['data'] += data
+        
+    def _open_spool(self, headers: email.message.Message, content_type: str) -> Dict:
+        """Open the file a part's body is decoded into."""
+        filename = headers.get_filename()
+        if filename:
+            filename = str(make_header(decode_header(filename)))
+        suffix = Path(filename).suffix if filename else ''
+        if not re.fullmatch(r'\.[A-Za-z0-9]{1,10}', suffix):
+            suffix = mimetypes.guess_extension(content_type) or ''
+            
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spool_dir / f"{len(self.attachments) + 1}{suffix}"
+        self.attachments.append({
+            'filename': filename,
+            'content_type': content_type,
+            'size': 0,
+            'path': str(path)
+        })
+        return {'attachment': self.attachments[-1], 'file': open(path, 'wb')}
+        
+    def _end_part(self) -> None:
+        """Finish the body being read, if any."""
+        part, self._part = self._part, None
+        if not part:
+            return
+        if 'file' in part:
+            part['attachment']['size'] = part['file'].tell()
+            part['file'].close()
+            return
+            
+        data = bytes(part['data'])
+        try:
+            text = data.decode(part['headers'].get_content_charset() or 'utf-8', errors='replace')
+        except LookupError:
+            text = data.decode('utf-8', errors='replace')
+        if part['dropped'] or len(text) > self.max_body_size:
+            text = text[:self.max_body_size]
+            self.truncated = True
+        self.bodies[part['type']] = text
+
 class IMAPPlugin(PluginInterface):
     """IMAP email plugin for fetching messages from email servers."""
     
@@ -25,13 +324,17 @@ class IMAPPlugin(PluginInterface):
         """
         super().__init__(service)
         self.connection = None
+        self.capabilities = set()
+        self._uid_map = {}
+        self._fetched_uids = []
+        self._failed_uids = set()
+        self._sync_state = None
+        self._sync_modseq = None
         self._load_manifest()
         
     def _load_manifest(self) -> None:
-        """Load the plugin manifest from manifest.json."""
-        manifest_path = Path(__file__).parent / "manifest.json"
-        with open(manifest_path) as f:
-            self.manifest = json.load(f)
+        """Load the plugin manifest from the process-wide plugin registry."""
+        self.manifest = plugin_registry.get_manifest(Path(__file__).parent.name)
             
     def _get_manifest(self) -> Dict:
         """Get the plugin manifest.
@@ -41,35 +344,65 @@ class IMAPPlugin(PluginInterface):
         """
         return self.manifest
         
-    def connect(self) -> None:
-        """Establish connection to the IMAP server."""
+    def connect(self, pooled: bool = True) -> None:
+        """Establish connection to the IMAP server.
+        
+        Args:
+            pooled: Check the connection out of the worker's IMAP pool so the
+                authenticated session can be reused by the next task. Long-lived
+                connections (e.g. IDLE) should pass False.
+        """
         try:
-            if self.config.get("use_ssl", True):
-                self.connection = imaplib.IMAP4_SSL(
-                    self.config["host"],
-                    self.config["port"]
-                )
-            else:
-                self.connection = imaplib.IMAP4(
-                    self.config["host"],
-                    self.config["port"]
-                )
-                
-            self.connection.login(
-                self.config["username"],
-                self.config["password"]
+            self.connection = get_imap_connection(
+                self.config["host"],
+                self.config["port"],
+                self.config.get("username"),
+                self.config.get("password"),
+                use_ssl=self.config.get("use_ssl", "TLS"),
+                pool_key=self.service.pk if pooled else None,
+                setup=self._setup_connection
             )
+            self.capabilities = set(self.connection.capabilities)
             logger.info(f"Connected to IMAP server {self.config['host']}")
             
         except Exception as e:
             logger.error(f"Failed to connect to IMAP server: {str(e)}")
             raise
             
-    def disconnect(self) -> None:
-        """Close the connection to the IMAP server."""
+    @staticmethod
+    def _setup_connection(connection: imaplib.IMAP4) -> None:
+        """Prepare a freshly authenticated connection.
+        
+        Runs once per connection rather than once per task, so pooled
+        connections don't repeat the CAPABILITY and ENABLE round trips.
+        
+        Args:
+            connection: The newly opened IMAP connection
+        """
+        # Servers often advertise more capabilities after login
+        status, data = connection.capability()
+        if status == 'OK' and data and data[-1]:
+            connection.capabilities = tuple(data[-1].decode().upper().split())
+            
+        # Ask for HIGHESTMODSEQ in SELECT responses so unchanged folders can be skipped
+        if 'CONDSTORE' in connection.capabilities and 'ENABLE' in connection.capabilities:
+            try:
+                connection.enable('CONDSTORE')
+            except Exception as e:
+                logger.debug(f"Could not enable CONDSTORE: {str(e)}")
+                
+    def disconnect(self, discard: bool = False) -> None:
+        """Release the connection to the IMAP server.
+        
+        Pooled connections are handed back to the pool for reuse; private
+        connections are logged out.
+        
+        Args:
+            discard: Close the connection even if it is pooled
+        """
         if self.connection:
             try:
-                self.connection.logout()
+                release_imap_connection(self.connection, discard=discard)
                 logger.info("Disconnected from IMAP server")
             except Exception as e:
                 logger.error(f"Error disconnecting from IMAP server: {str(e)}")
@@ -93,11 +426,12 @@ class IMAPPlugin(PluginInterface):
                 decoded.append(str(part))
         return ''.join(decoded)
         
-    def _parse_email(self, msg: email.message.Message) -> Dict:
+    def _parse_email(self, msg: email.message.Message, parser: StreamingEmailParser) -> Dict:
         """Parse email message into a dictionary.
         
         Args:
-            msg: Email message object
+            msg: The message's headers, from the streaming parser
+            parser: The parser, holding the message's bodies and spooled attachments
             
         Returns:
             Dictionary containing parsed email data
@@ -115,34 +449,23 @@ class IMAPPlugin(PluginInterface):
             logger.warning(f"Could not parse date '{date_str}', using current time")
             timestamp = timezone.now()
         
-        # Get message body
-        body = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain":
-                    payload = part.get_payload(decode=True)
-                    if isinstance(payload, bytes):
-                        body = payload.decode(part.get_content_charset() or 'utf-8', errors='replace')
-                    else:
-                        body = str(payload)
-                    break
-        else:
-            payload = msg.get_payload(decode=True)
-            if isinstance(payload, bytes):
-                body = payload.decode(msg.get_content_charset() or 'utf-8', errors='replace')
-            else:
-                body = str(payload)
-            
+        # The plain text body, or the HTML one for HTML-only messages
+        body = parser.bodies.get('text/plain', parser.bodies.get('text/html', ''))
+        
         # Structure the payload
         payload = {
             'content': body,
-            'attachments': [],  # TODO: Handle attachments
+            'attachments': parser.attachments,
             'metadata': {
                 'subject': subject,
                 'date': date_str,
-                'headers': dict(msg.items())
+                'headers': {name: value for name, value in msg.items() if name.lower() in KEPT_HEADERS}
             }
         }
+        if 'text/html' in parser.bodies:
+            payload['html'] = parser.bodies['text/html']
+        if parser.truncated:
+            payload['metadata']['truncated'] = True
             
         return {
             'subject': subject,
@@ -152,71 +475,352 @@ class IMAPPlugin(PluginInterface):
             'payload': payload
         }
         
+    def _get_int_config(self, key: str, default: int) -> int:
+        """Get an integer setting from the service config.
+        
+        Args:
+            key: Config key
+            default: Used when the key is missing, falling back to the manifest default
+            
+        Returns:
+            The setting's value
+        """
+        default = self.manifest.get('config_schema', {}).get(key, {}).get('default', default)
+        value = self.config.get(key)
+        if value is None or value == '':
+            return default
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            logger.warning(f"Invalid {key} {self.config.get(key)!r}, using {default}")
+            return default
+            
+    def _get_chunk_size(self) -> int:
+        """Get the number of UIDs to request per UID FETCH round trip.
+        
+        Returns:
+            Chunk size from the service config, falling back to the manifest default
+        """
+        return max(1, self._get_int_config('fetch_chunk_size', 250))
+        
+    @staticmethod
+    def _uid_set(uids: List[int]) -> str:
+        """Compress a list of UIDs into an IMAP sequence set.
+        
+        Args:
+            uids: UIDs to include in the set
+            
+        Returns:
+            Sequence set string, e.g. "1200:1450,1452"
+        """
+        ranges = []
+        start = previous = None
+        for uid in sorted(set(uids)):
+            if start is None:
+                start = previous = uid
+            elif uid == previous + 1:
+                previous = uid
+            else:
+                ranges.append((start, previous))
+                start = previous = uid
+        if start is not None:
+            ranges.append((start, previous))
+        return ','.join(str(first) if first == last else f"{first}:{last}" for first, last in ranges)
+        
+    @staticmethod
+    def _iter_fetch_response(data: List[Any]) -> Iterator[Tuple[int, bytes]]:
+        """Walk a UID FETCH response one message at a time.
+        
+        imaplib returns a tuple (envelope, literal) per message followed by a
+        closing bytes item. Most servers put the UID before the literal, but
+        some send it after, so both positions are checked.
+        
+        Args:
+            data: Response data returned by IMAP4.uid('FETCH', ...)
+            
+        Yields:
+            Tuples of (uid, raw message bytes)
+        """
+        pending = None
+        for item in data:
+            if isinstance(item, tuple):
+                match = UID_PATTERN.search(item[0])
+                if match:
+                    yield int(match.group(1)), item[1]
+                    pending = None
+                else:
+                    pending = item[1]
+            elif pending is not None and isinstance(item, bytes):
+                match = UID_PATTERN.search(item)
+                if match:
+                    yield int(match.group(1)), pending
+                else:
+                    logger.warning(f"Could not find UID in FETCH response item {item[:100]!r}, skipping")
+                pending = None
+                
+    def _fetch_sizes(self, uids: List[int]) -> Dict[int, int]:
+        """Get the sizes of messages with one UID FETCH of RFC822.SIZE.
+        
+        Args:
+            uids: UIDs to look up
+            
+        Returns:
+            Dict of UID to size in bytes; empty if the server wouldn't say
+        """
+        uid_set = self._uid_set(uids)
+        status, data = self.connection.uid('FETCH', uid_set, '(UID RFC822.SIZE)')
+        if status != 'OK':
+            logger.warning(f"UID FETCH {uid_set} RFC822.SIZE failed, fetching the messages whole: {data}")
+            return {}
+            
+        sizes = {}
+        for item in data:
+            line = item[0] if isinstance(item, tuple) else item
+            if not isinstance(line, bytes):
+                continue
+            uid, size = UID_PATTERN.search(line), SIZE_PATTERN.search(line)
+            if uid and size:
+                sizes[int(uid.group(1))] = int(size.group(1))
+        return sizes
+        
+    def _iter_pieces(self, uid: int) -> Iterator[bytes]:
+        """Fetch a message in pieces of FETCH_PIECE_SIZE bytes with partial FETCHes.
+        
+        Pieces are requested until one comes back short, rather than up to
+        RFC822.SIZE, as some servers report sizes that don't match the body.
+        
+        Args:
+            uid: UID of the message
+            
+        Yields:
+            The message's bytes, one piece at a time
+        """
+        offset = 0
+        while True:
+            status, data = self.connection.uid('FETCH', str(uid), f'(UID BODY.PEEK[]<{offset}.{FETCH_PIECE_SIZE}>)')
+            if status != 'OK':
+                raise imaplib.IMAP4.error(f"UID FETCH {uid} at offset {offset} failed: {data}")
+            piece = next((item[1] for item in data if isinstance(item, tuple)), b'')
+            if piece:
+                yield piece
+            if len(piece) < FETCH_PIECE_SIZE:
+                return
+            offset += len(piece)
+            
+    def _parse_message(self, uid: int, pieces: Iterable[bytes]) -> Optional[Dict[str, Any]]:
+        """Stream a message through the parser and parse it into our format.
+        
+        Args:
+            uid: UID of the message
+            pieces: The message's bytes, whole or in pieces
+            
+        Returns:
+            Dictionary containing message data, or None if the message is skipped
+        """
+        parser = StreamingEmailParser(
+            Path(settings.ATTACHMENT_SPOOL_DIR) / str(self.service.pk or 'unsaved') / 'fetching',
+            self._get_int_config('max_body_size', 1048576)
+        )
+        try:
+            for piece in pieces:
+                parser.feed(piece)
+            email_message = parser.close()
+            
+            # Get the Message-ID header
+            message_id = email_message.get('Message-ID', '')
+            if not message_id:
+                logger.warning(f"Message UID {uid} has no Message-ID, skipping")
+                parser.discard()
+                return None
+                
+            self._uid_map[message_id] = uid
+            
+            # Parse the email into our format
+            message_data = self._parse_email(email_message, parser)
+            message_data['service_message_id'] = message_id
+            return message_data
+        except Exception:
+            parser.discard()
+            raise
+            
+    def _fetch_chunk(self, uids: List[int]) -> List[Dict[str, Any]]:
+        """Fetch and parse one chunk of messages.
+        
+        Messages up to stream_threshold bytes are fetched with a single UID
+        FETCH for the chunk. Larger ones, found with an RFC822.SIZE FETCH
+        first, are fetched one at a time in pieces and parsed as the pieces
+        arrive, so neither the raw message nor its attachments are held in
+        memory whole. BODY.PEEK[] is used so that fetching does not set the
+        \\Seen flag; messages are only moved or flagged once they have been
+        stored.
+        
+        Args:
+            uids: UIDs to fetch
+            
+        Returns:
+            List of dictionaries containing message data, in UID order
+        """
+        threshold = self._get_int_config('stream_threshold', 1048576)
+        sizes = self._fetch_sizes(uids) if threshold > 0 else {}
+        large = [uid for uid in uids if sizes.get(uid, 0) > threshold]
+        small = [uid for uid in uids if sizes.get(uid, 0) <= threshold]
+        
+        parsed = {}
+        if small:
+            uid_set = self._uid_set(small)
+            status, data = self.connection.uid('FETCH', uid_set, '(UID BODY.PEEK[])')
+            if status != 'OK':
+                logger.error(f"UID FETCH {uid_set} failed: {data}")
+            else:
+                for uid, raw_email in self._iter_fetch_response(data):
+                    try:
+                        parsed[uid] = self._parse_message(uid, [raw_email])
+                    except Exception as e:
+                        logger.error(f"Error processing message UID {uid}: {str(e)}")
+                        
+        for uid in large:
+            try:
+                logger.debug(f"Streaming message UID {uid} ({sizes[uid]} bytes)")
+                parsed[uid] = self._parse_message(uid, self._iter_pieces(uid))
+            except Exception as e:
+                logger.error(f"Error processing message UID {uid}: {str(e)}")
+                
+        # Messages that failed to fetch or parse hold the checkpoint back; ones skipped
+        # for having no Message-ID are in parsed as None and don't
+        self._failed_uids.update(uid for uid in uids if uid not in parsed)
+        
+        return [parsed[uid] for uid in sorted(parsed) if parsed[uid] is not None]
+        
+    def _select_folder(self, folder: str) -> Dict[str, Optional[int]]:
+        """Select a folder and read its status from the SELECT response.
+        
+        Args:
+            folder: Name of the folder to select
+            
+        Returns:
+            Dict with the folder's UIDVALIDITY, UIDNEXT and HIGHESTMODSEQ
+            (None for any value the server did not report)
+        """
+        status, data = self.connection.select(folder)
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"SELECT {folder} failed: {data}")
+            
+        mailbox = {}
+        for code in ('UIDVALIDITY', 'UIDNEXT', 'HIGHESTMODSEQ'):
+            _, values = self.connection.response(code)
+            try:
+                mailbox[code] = int(values[-1]) if values and values[-1] is not None else None
+            except (TypeError, ValueError):
+                mailbox[code] = None
+        return mailbox
+        
+    def _get_sync_state(self, folder: str) -> ServiceSyncState:
+        """Get the sync checkpoint for a folder of this service.
+        
+        Args:
+            folder: Name of the folder
+            
+        Returns:
+            The stored ServiceSyncState, or a new unsaved one
+        """
+        if self.service.pk:
+            state = ServiceSyncState.objects.filter(service=self.service, folder=folder).first()
+            if state:
+                return state
+        return ServiceSyncState(service=self.service, folder=folder)
+        
+    def _commit_checkpoint(self, handled_ids: set) -> None:
+        """Advance the sync checkpoint after a fetch has been handled.
+        
+        The checkpoint only moves past messages that were stored or skipped. If
+        any fetched message was not handled, or could not be fetched or parsed,
+        last_uid stops just below it and HIGHESTMODSEQ is dropped, so the next
+        poll fetches it again.
+        
+        Args:
+            handled_ids: Message-IDs that were stored or skipped as duplicates
+        """
+        state = self._sync_state
+        if state is None:
+            return
+            
+        unhandled = [uid for message_id, uid in self._uid_map.items() if message_id not in handled_ids]
+        unhandled += self._failed_uids
+        if unhandled:
+            state.last_uid = max(state.last_uid, min(unhandled) - 1)
+            state.highest_modseq = None
+        else:
+            state.last_uid = max([state.last_uid] + self._fetched_uids)
+            state.highest_modseq = self._sync_modseq
+            
+        if self.service.pk:
+            state.save()
+        logger.debug(f"Sync checkpoint for {state.folder} is now UID {state.last_uid}")
+        self._sync_state = None
+        
     def _fetch_messages(self) -> List[Dict[str, Any]]:
         """Fetch messages from the IMAP server.
         
+        Only UIDs above the folder's sync checkpoint are fetched. The folder is
+        skipped entirely when UIDNEXT (or HIGHESTMODSEQ on CONDSTORE servers)
+        shows nothing has arrived, and a full resync only happens when
+        UIDVALIDITY changes. Messages are requested in chunks of
+        fetch_chunk_size, so a poll costs one round trip per chunk instead of
+        one per message. Fetched messages stay in the folder until
+        mark_messages_processed is called, which also advances the checkpoint.
+        
         Returns:
             List of dictionaries containing message data
         """
         if not self.connection:
             self.connect()
             
+        self._uid_map = {}
+        self._fetched_uids = []
+        self._failed_uids = set()
+        self._sync_state = None
+        folder = self.config.get('folder', 'INBOX')
+            
         try:
-            # Select the INBOX
-            self.connection.select('INBOX')
+            # Select the source folder and compare it with the checkpoint
+            mailbox = self._select_folder(folder)
+            state = self._get_sync_state(folder)
+            
+            if state.uidvalidity != mailbox['UIDVALIDITY']:
+                if state.uidvalidity is not None:
+                    logger.warning(
+                        f"UIDVALIDITY of {folder} changed from {state.uidvalidity} to "
+                        f"{mailbox['UIDVALIDITY']}, running a full resync"
+                    )
+                state.reset(mailbox['UIDVALIDITY'])
+            elif mailbox['HIGHESTMODSEQ'] is not None and mailbox['HIGHESTMODSEQ'] == state.highest_modseq:
+                logger.debug(f"No changes in {folder} since MODSEQ {state.highest_modseq}")
+                return []
+            elif mailbox['UIDNEXT'] is not None and mailbox['UIDNEXT'] <= state.last_uid + 1:
+                logger.debug(f"No new messages in {folder} since UID {state.last_uid}")
+                return []
+                
+            self._sync_state = state
+            self._sync_modseq = mailbox['HIGHESTMODSEQ']
             
-            # Search for all messages
-            _, message_numbers = self.connection.search(None, 'ALL')
+            # Search for messages above the checkpoint by UID
+            criteria = f'UID {state.last_uid + 1}:*' if state.last_uid else 'ALL'
+            status, data = self.connection.uid('SEARCH', None, criteria)
+            if status != 'OK':
+                logger.error(f"UID SEARCH failed: {data}")
+                return []
+            # "n:*" always matches the highest UID, even when it is below n
+            uids = [uid for uid in map(int, data[0].split()) if uid > state.last_uid]
+            self._fetched_uids = uids
             
             messages = []
-            for num in message_numbers[0].split():
-                try:
-                    # Fetch the message data - this returns raw email bytes
-                    _, msg_data = self.connection.fetch(num, '(RFC822)')
-                    if not msg_data or not msg_data[0]:
-                        logger.warning(f"No data received for message {num}, skipping")
-                        continue
-                        
-                    # Parse the raw email bytes into an email message
-                    email_message = email.message_from_bytes(msg_data[0][1])
-                    
-                    # Get the Message-ID header
-                    message_id = email_message.get('Message-ID', '')
-                    if not message_id:
-                        logger.warning(f"Message {num} has no Message-ID, skipping")
-                        continue
-                        
-                    # Check if we've already processed this message
-                    if Message.objects.filter(
-                        service=self.service,
-                        service_message_id=message_id,
-                        direction='incoming'
-                    ).exists():
-                        logger.info(f"Skipping duplicate message {message_id} from {self.service.name}")
-                        continue
-                        
-                    # Parse the email into our format
-                    message_data = self._parse_email(email_message)
-                    message_data['service_message_id'] = message_id
-                    
-                    messages.append(message_data)
-                    
-                    # Move to Processed folder
-                    try:
-                        # Create Processed folder if it doesn't exist
-                        self.connection.create('Processed')
-                    except:
-                        pass  # Folder may already exist
-                        
-                    # Copy message to Processed folder
-                    self.connection.copy(num, 'Processed')
-                    # Delete from INBOX
-                    self.connection.store(num, '+FLAGS', '\\Deleted')
-                    self.connection.expunge()
-                        
-                except Exception as e:
-                    logger.error(f"Error processing message {num}: {str(e)}")
-                    continue
+            chunk_size = self._get_chunk_size()
+            for start in range(0, len(uids), chunk_size):
+                messages.extend(self._fetch_chunk(uids[start:start + chunk_size]))
+                
+            # Step 1 only marks what it stores, so tidy up and advance the checkpoint here
+            if not messages:
+                self.mark_messages_processed([])
                     
             return messages
             
@@ -235,6 +839,72 @@ class IMAPPlugin(PluginInterface):
         """
         return False
         
+    def supports_idle(self) -> bool:
+        """Check whether the server supports IDLE (RFC 2177).
+        
+        Returns:
+            bool: True if IDLE is advertised after login
+        """
+        if not self.connection:
+            self.connect()
+        return 'IDLE' in self.capabilities
+        
+    def idle(self, timeout: float, stop_event: Optional[threading.Event] = None) -> bool:
+        """Wait in IDLE until new mail arrives or the timeout expires.
+        
+        The source folder must already be selected. imaplib has no IDLE support
+        before Python 3.14, so the exchange is done on the raw socket: IDLE is
+        sent, untagged responses are read until an EXISTS arrives or the timeout
+        expires, then DONE ends the command and its tagged reply is consumed.
+        
+        Args:
+            timeout: Seconds to stay in IDLE. Keep this below the 29 minute
+                limit after which servers may drop an idle client.
+            stop_event: Event that ends IDLE early, checked every second
+                
+        Returns:
+            bool: True if the server reported new messages, False on timeout or stop
+        """
+        tag = self.connection._new_tag()
+        reader = IdleLineReader(self.connection.sock)
+        self.connection.send(tag + b' IDLE\r\n')
+        
+        try:
+            line = reader.readline(30)
+            if line is None or not line.startswith(b'+'):
+                raise imaplib.IMAP4.error(f"Server rejected IDLE: {line!r}")
+                
+            new_mail = False
+            deadline = time.monotonic() + timeout
+            while not new_mail:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or (stop_event is not None and stop_event.is_set()):
+                    break
+                line = reader.readline(min(remaining, 1) if stop_event is not None else remaining)
+                if line is None:
+                    continue
+                if line.startswith(b'* BYE'):
+                    raise imaplib.IMAP4.abort(f"Server closed the connection: {line!r}")
+                if line.startswith(b'*') and line.upper().endswith(b' EXISTS'):
+                    new_mail = True
+                    
+            # End IDLE and wait for the tagged completion
+            self.connection.send(b'DONE\r\n')
+            while True:
+                line = reader.readline(30)
+                if line is None:
+                    raise imaplib.IMAP4.abort("Timed out waiting for IDLE to complete")
+                if line.startswith(tag):
+                    if not line[len(tag):].strip().upper().startswith(b'OK'):
+                        raise imaplib.IMAP4.error(f"IDLE failed: {line!r}")
+                    break
+                if line.startswith(b'*') and line.upper().endswith(b' EXISTS'):
+                    new_mail = True
+                    
+            return new_mail
+        finally:
+            self.connection.tagged_commands.pop(tag, None)
+            
     def _test_connection(self) -> bool:
         """Test the connection to the IMAP server.
         
@@ -242,7 +912,7 @@ class IMAPPlugin(PluginInterface):
             bool: True if connection was successful, False otherwise
         """
         try:
-            self.connect()
+            self.connect(pooled=False)
             self.disconnect()
             return True
         except Exception as e:
@@ -347,3 +1017,79 @@ class IMAPPlugin(PluginInterface):
             logger.error(f"Error marking message {message_id} as processed: {str(e)}")
             # Don't raise the exception - we don't want to fail the entire process
             # just because we couldn't move a message to the processed folder
+
+    def mark_messages_processed(self, message_ids: List[str]) -> None:
+        """Mark a batch of fetched messages as processed on the IMAP server.
+        
+        Uses the UIDs recorded by the last fetch to issue one UID COPY and one
+        UID STORE per chunk of fetch_chunk_size, followed by a single EXPUNGE
+        for the whole batch, and the folder's sync checkpoint is advanced.
+        Message-IDs that were not part of the last fetch fall back to
+        mark_message_processed.
+        
+        Args:
+            message_ids: Email Message-IDs of the messages that were stored or
+                were already stored by an earlier poll
+        """
+        if not self.connection:
+            self.connect()
+            
+        handled_ids = set(message_ids)
+        uids = []
+        unknown_ids = []
+        for message_id in handled_ids:
+            uid = self._uid_map.get(message_id)
+            if uid is None:
+                unknown_ids.append(message_id)
+            else:
+                uids.append(uid)
+                
+        if uids:
+            try:
+                # Select the folder
+                self.connection.select(self.config.get('folder', 'INBOX'))
+                
+                move = self.config.get('processed_action', 'move') == 'move'
+                processed_folder = self.config.get('processed_folder', 'INBOX.Processed')
+                
+                if move:
+                    # Create the processed folder if it doesn't exist
+                    try:
+                        self.connection.create(processed_folder)
+                    except Exception as e:
+                        # Folder might already exist, which is fine
+                        logger.debug(f"Error creating folder {processed_folder}: {str(e)}")
+                        
+                uids = sorted(uids)
+                chunk_size = self._get_chunk_size()
+                flagged = 0
+                for start in range(0, len(uids), chunk_size):
+                    uid_set = self._uid_set(uids[start:start + chunk_size])
+                    if move:
+                        status, data = self.connection.uid('COPY', uid_set, processed_folder)
+                        if status != 'OK':
+                            # Leave the messages in place rather than deleting uncopied mail
+                            logger.error(f"Error copying UIDs {uid_set} to {processed_folder}: {data}")
+                            continue
+                    self.connection.uid('STORE', uid_set, '+FLAGS', '(\\Deleted)')
+                    flagged += len(uids[start:start + chunk_size])
+                    
+                # Expunge once for the whole batch
+                if flagged:
+                    self.connection.expunge()
+                logger.info(f"Marked {flagged} of {len(uids)} messages as processed")
+                
+            except Exception as e:
+                logger.error(f"Error marking messages as processed: {str(e)}")
+                # Don't raise the exception - the messages are already stored
+                
+        for message_id in unknown_ids:
+            self.mark_message_processed(message_id)
+            
+        try:
+            self._commit_checkpoint(handled_ids)
+        except Exception as e:
+            logger.error(f"Error saving sync checkpoint: {str(e)}")
+            
+        for message_id in handled_ids:
+            self._uid_map.pop(message_id, None)
@@ -1,12 +1,15 @@
 import smtplib
+import email.policy
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import json
 from typing import Dict, List, Optional, Any
 import logging
 from pathlib import Path
 
+from core.plugin_registry import plugin_registry
 from core.models import PluginInterface, Message
+from core.delivery import RecipientResult
+from core.utils import get_smtp_connection, get_security_mode, release_smtp_connection
 
 logger = logging.getLogger(__name__)
 
@@ -24,10 +27,8 @@ class SMTPPlugin(PluginInterface):
         self._load_manifest()
         
     def _load_manifest(self) -> None:
-        """Load the plugin manifest from manifest.json."""
-        manifest_path = Path(__file__).parent / "manifest.json"
-        with open(manifest_path) as f:
-            self.manifest = json.load(f)
+        """Load the plugin manifest from the process-wide plugin registry."""
+        self.manifest = plugin_registry.get_manifest(Path(__file__).parent.name)
             
     def _get_manifest(self) -> Dict:
         """Get the plugin manifest.
@@ -37,24 +38,21 @@ class SMTPPlugin(PluginInterface):
         """
         return self.manifest
         
-    def connect(self) -> None:
-        """Establish connection to the SMTP server."""
+    def connect(self, pooled: bool = True) -> None:
+        """Establish connection to the SMTP server.
+        
+        Args:
+            pooled: Check the connection out of the worker's SMTP pool so the
+                authenticated session can be reused by the next task
+        """
         try:
-            if self.config.get("use_tls", True):
-                self.connection = smtplib.SMTP(
-                    self.config["host"],
-                    self.config["port"]
-                )
-                self.connection.starttls()
-            else:
-                self.connection = smtplib.SMTP_SSL(
-                    self.config["host"],
-                    self.config["port"]
-                )
-                
-            self.connection.login(
-                self.config["username"],
-                self.config["password"]
+            self.connection = get_smtp_connection(
+                self.config["host"],
+                self.config["port"],
+                self.config.get("username"),
+                self.config.get("password"),
+                use_ssl=get_security_mode(self.config.get("use_tls"), default="STARTTLS"),
+                pool_key=self.service.pk if pooled else None
             )
             logger.info(f"Connected to SMTP server {self.config['host']}")
             
@@ -62,11 +60,18 @@ class SMTPPlugin(PluginInterface):
             logger.error(f"Failed to connect to SMTP server: {str(e)}")
             raise
             
-    def disconnect(self) -> None:
-        """Close the connection to the SMTP server."""
+    def disconnect(self, discard: bool = False) -> None:
+        """Release the connection to the SMTP server.
+        
+        Pooled connections are handed back to the pool for reuse; private
+        connections are closed with QUIT.
+        
+        Args:
+            discard: Close the connection even if it is pooled
+        """
         if self.connection:
             try:
-                self.connection.quit()
+                release_smtp_connection(self.connection, discard=discard)
                 logger.info("Disconnected from SMTP server")
             except Exception as e:
                 logger.error(f"Error disconnecting from SMTP server: {str(e)}")
@@ -132,10 +137,117 @@ class SMTPPlugin(PluginInterface):
             logger.info(f"Message sent to {recipient}")
             return True
             
+        except smtplib.SMTPServerDisconnected as e:
+            logger.error(f"Error sending message: {str(e)}")
+            self.disconnect(discard=True)
+            return False
         except Exception as e:
             logger.error(f"Error sending message: {str(e)}")
             return False
             
+    def send_bulk(self, message: 'Message', recipients: List[str]) -> Dict[str, RecipientResult]:
+        """Send one message to several recipients over the current session.
+        
+        The MIME body is built once, with an undisclosed-recipients To header,
+        and delivered with one MAIL/RCPT.../DATA transaction per
+        max_recipients_per_message recipients. When the server advertises
+        PIPELINING the MAIL and RCPT commands are written in a single batch and
+        their replies read back afterwards, saving a round trip per recipient.
+        
+        Args:
+            message: The message to send
+            recipients: Recipient email addresses
+            
+        Returns:
+            Dict mapping each recipient to its RecipientResult
+        """
+        if not self.connection:
+            self.connect()
+            
+        email_msg = self._create_email({
+            'subject': message.subject,
+            'content': message.payload.get('content', '')
+        }, 'undisclosed-recipients:;')
+        body = email_msg.as_bytes(policy=email.policy.SMTP)
+        
+        batch_size = max(1, int(self.config.get('max_recipients_per_message', 100)))
+        results = {}
+        for start in range(0, len(recipients), batch_size):
+            try:
+                results.update(self._send_envelope(recipients[start:start + batch_size], body))
+            except (smtplib.SMTPServerDisconnected, OSError) as e:
+                # The session is gone; fail what is left and let the retry logic take over
+                logger.error(f"SMTP connection lost while sending: {str(e)}")
+                self.disconnect(discard=True)
+                for recipient in recipients[start:]:
+                    results[recipient] = RecipientResult(recipient, False, error=f"Connection lost: {str(e)}")
+                break
+                
+        return results
+        
+    def _send_envelope(self, recipients: List[str], body: bytes) -> Dict[str, RecipientResult]:
+        """Run one SMTP mail transaction for a batch of recipients.
+        
+        Args:
+            recipients: Recipient email addresses
+            body: The rendered message
+            
+        Returns:
+            Dict mapping each recipient to its RecipientResult
+        """
+        connection = self.connection
+        connection.ehlo_or_helo_if_needed()
+        
+        mail_command = f"MAIL FROM:{smtplib.quoteaddr(self.config['from_address'])}"
+        if connection.has_extn('size'):
+            mail_command += f" SIZE={len(body)}"
+        rcpt_commands = [f"RCPT TO:{smtplib.quoteaddr(recipient)}" for recipient in recipients]
+        
+        if connection.has_extn('pipelining'):
+            # Write the whole envelope at once, then collect the replies in order (RFC 2920)
+            connection.send(''.join(f"{command}\r\n" for command in [mail_command] + rcpt_commands))
+            mail_reply = connection.getreply()
+            rcpt_replies = [connection.getreply() for _ in rcpt_commands]
+        else:
+            connection.putcmd(mail_command)
+            mail_reply = connection.getreply()
+            rcpt_replies = []
+            if mail_reply[0] == 250:
+                for command in rcpt_commands:
+                    connection.putcmd(command)
+                    rcpt_replies.append(connection.getreply())
+                    
+        if mail_reply[0] != 250:
+            connection.rset()
+            error = f"MAIL FROM rejected: {mail_reply[0]} {mail_reply[1].decode(errors='replace')}"
+            return {recipient: RecipientResult(recipient, False, mail_reply[0], error) for recipient in recipients}
+            
+        results = {}
+        accepted = []
+        for recipient, (code, response) in zip(recipients, rcpt_replies):
+            if code in (250, 251):
+                accepted.append(recipient)
+            else:
+                results[recipient] = RecipientResult(recipient, False, code, f"RCPT TO rejected: {code} {response.decode(errors='replace')}")
+                
+        if not accepted:
+            connection.rset()
+            return results
+            
+        try:
+            code, response = connection.data(body)
+        except smtplib.SMTPResponseException as e:
+            code, response = e.smtp_code, e.smtp_error
+            connection.rset()
+            
+        for recipient in accepted:
+            if code == 250:
+                results[recipient] = RecipientResult(recipient, True, code)
+            else:
+                results[recipient] = RecipientResult(recipient, False, code, f"DATA rejected: {code} {response.decode(errors='replace')}")
+        logger.info(f"Sent message to {len(accepted)} of {len(recipients)} recipients")
+        return results
+        
     def _fetch_messages(self) -> List[Dict[str, Any]]:
         """SMTP plugin does not support fetching messages.
         
@@ -151,7 +263,7 @@ class SMTPPlugin(PluginInterface):
             True if connection is successful, False otherwise
         """
         try:
-            self.connect()
+            self.connect(pooled=False)
             self.disconnect()
             return True
         except Exception as e:
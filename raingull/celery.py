@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_shutdown
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'raingull.settings')
@@ -13,6 +14,24 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+@worker_process_shutdown.connect
+def close_connection_pools(**kwargs):
+    """Log out of pooled IMAP/SMTP sessions when a worker process exits."""
+    from core.connection_pool import close_all_pools
+    close_all_pools()
+
+@worker_process_shutdown.connect
+def flush_audit_log(**kwargs):
+    """Write buffered audit log entries before a worker process exits."""
+    from core.audit import flush_audit
+    flush_audit()
+
+@worker_process_shutdown.connect
+def flush_traces(**kwargs):
+    """Export buffered trace spans before a worker process exits."""
+    from core.tracing import flush
+    flush()
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}') 
\ No newline at end of file
@@ -157,27 +157,63 @@ CELERY_TIMEZONE = 'UTC'
 # Message Processing Pipeline Configuration
 ENABLE_MESSAGE_DELIVERY = True  # Set to True to enable steps 4 and 5 (message queuing and delivery)
 
+# Event-driven pipeline: each step enqueues the next one for the exact messages it
+# produced, and the beat jobs for Steps 2-5 only sweep up whatever was missed
+PIPELINE_EVENT_DRIVEN = False
+PIPELINE_SWEEP_INTERVAL = 300.0  # Seconds between sweeps in event-driven mode
+PIPELINE_STEP_INTERVAL = PIPELINE_SWEEP_INTERVAL if PIPELINE_EVENT_DRIVEN else 30.0
+
+# How event-driven handoffs travel: 'celery' sends the next step as a task, 'streams'
+# adds the ids to a Redis stream per step, drained by `manage.py run_pipeline_stage <stage>`
+PIPELINE_TRANSPORT = 'celery'
+PIPELINE_STREAMS = {
+    'block_ms': 5000,         # How long a consumer waits for new entries
+    'count': 10,              # Entries read per batch
+    'claim_idle_ms': 60000,   # Pending entries idle this long are taken over from dead consumers
+    'max_deliveries': 5,      # Attempts before an entry is left to the beat sweep
+    'maxlen': 100000          # Approximate cap on entries kept per stream
+}
+
+# Most ORM queries each step may make per message it handles, plus a fixed overhead per run (see core.instrumentation).
+# Going over logs a warning in the workers and fails `manage.py bench_pipeline`.
+PIPELINE_QUERY_BUDGETS = {
+    'overhead': 15,    # Per step run, whatever the batch size (services, claims, ...)
+    'ingest': 1,       # Per message stored
+    'standardize': 2,  # Per message standardized
+    'format': 1,       # Per standardized message distributed
+    'queue': 1,        # Per message queued
+    'send': 1          # Per queue entry sent
+}
+
 # Celery Beat Configuration
 CELERY_BEAT_SCHEDULE = {
     'poll-incoming-services': {
         'task': 'core.tasks.poll_incoming_services',
-        'schedule': 30.0,  # Run every 30 seconds
+        'schedule': 10.0,  # Dispatch services whose fetch_interval has elapsed
     },
     'process-incoming-messages': {
         'task': 'core.tasks.process_incoming_messages',
-        'schedule': 30.0,  # Run every 30 seconds
+        'schedule': PIPELINE_STEP_INTERVAL,  # Every 30 seconds, or a slow sweep when event-driven
     },
     'distribute-outgoing-messages': {
         'task': 'core.tasks.distribute_outgoing_messages',
-        'schedule': 30.0,  # Run every 30 seconds
+        'schedule': PIPELINE_STEP_INTERVAL,  # Every 30 seconds, or a slow sweep when event-driven
     },
     'process-all-outgoing-messages': {
         'task': 'core.tasks.process_all_outgoing_messages',
-        'schedule': 30.0,  # Run every 30 seconds
+        'schedule': PIPELINE_STEP_INTERVAL,  # Every 30 seconds, or a slow sweep when event-driven
     },
     'send-all-queued-messages': {
         'task': 'core.tasks.send_all_queued_messages',
-        'schedule': 30.0,  # Run every 30 seconds
+        'schedule': PIPELINE_STEP_INTERVAL,  # Every 30 seconds, or a slow sweep when event-driven
+    },
+    'maintain-audit-log': {
+        'task': 'core.tasks.maintain_audit_log',
+        'schedule': 3600.0,  # Hourly rollups, day partitions and retention
+    },
+    'purge-attachment-spool': {
+        'task': 'core.tasks.purge_attachment_spool',
+        'schedule': 3600.0,  # Hourly sweep of expired spooled attachments
     },
 }
 
@@ -202,10 +238,73 @@ REST_FRAMEWORK = {
 MAX_MESSAGE_RETRIES = 5  # Maximum number of retry attempts for failed messages
 MIN_RETRY_DELAY = 1  # Minimum delay between retries in minutes
 MAX_RETRY_DELAY = 15  # Maximum delay between retries in minutes
+RETRY_BACKOFF_MULTIPLIER = 2  # Growth of the retry delay per attempt
+RETRY_JITTER = 0.1  # Random spread of retry delays (fraction), so failed batches don't retry in lockstep
 MESSAGE_BATCH_SIZE = 100
+ATTACHMENT_SPOOL_DIR = os.getenv('ATTACHMENT_SPOOL_DIR', os.path.join(BASE_DIR, 'spool', 'attachments'))  # Where incoming plugins write attachments
+ATTACHMENT_RETENTION_DAYS = int(os.getenv('ATTACHMENT_RETENTION_DAYS', '7'))  # Spooled attachments older than this are swept
+
+# Pipeline metrics (core.metrics), scraped from /metrics
+METRICS_STAGE_BUCKETS = (0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)  # Stage duration histogram buckets in seconds
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # Bearer token for scrapers; without one only superusers can read /metrics
+
+# Optional OpenTelemetry tracing of the pipeline steps (core.tracing); needs opentelemetry-sdk,
+# plus opentelemetry-exporter-otlp for the otlp exporter
+TRACING = {
+    'enabled': os.getenv('TRACING_ENABLED', '') == '1',
+    'exporter': os.getenv('TRACING_EXPORTER', 'otlp'),  # otlp, file or console
+    'endpoint': os.getenv('OTEL_EXPORTER_OTLP_TRACES_ENDPOINT'),  # Defaults to http://localhost:4318/v1/traces
+    'file': os.path.join(BASE_DIR, 'raingull-traces.jsonl'),  # Where the file exporter writes spans
+    'sample_rate': 1.0  # Fraction of messages (and step runs) traced
+}
+
+# Seconds between polls for services without a fetch_interval
+DEFAULT_POLL_INTERVAL = 60
+
+# Seconds between checks for changed plugin files (core.plugin_registry)
+PLUGIN_REGISTRY_CHECK_INTERVAL = 5
+
+# IMAP IDLE listener (manage.py imap_idle)
+# Re-issue IDLE before the 29 minute inactivity timeout allowed by RFC 2177
+IMAP_IDLE_TIMEOUT = 28 * 60
+
+# IMAP/SMTP connection pooling (per worker process, keyed by service)
+CONNECTION_POOL = {
+    'max_idle_time': 300,            # Close connections idle for longer than this (seconds)
+    'max_connections_per_host': 4,   # Stay under typical per-account server limits
+    'acquire_timeout': 30            # Seconds to wait for a free connection slot
+}
+
+# Outbound delivery (core.delivery), overridable per service config
+DELIVERY_CONCURRENCY = 1          # Parallel sessions per service ('delivery_concurrency')
+DELIVERY_DOMAIN_CONCURRENCY = 2   # Parallel sends per recipient domain ('domain_concurrency')
+DELIVERY_DOMAIN_RATE_LIMIT = 0    # Messages per second per recipient domain, 0 for no limit ('domain_rate_limit')
+RATE_LIMIT_MAX_WAIT = 5           # Seconds a send may wait on a rate limit before it is rescheduled
+
+# Audit log writer (core.audit)
+AUDIT_LOG = {
+    'buffered': True,            # Write in batches from a background thread; False writes each event at once
+    'flush_events': 100,         # Flush once this many events are waiting...
+    'flush_interval_ms': 1000,   # ...or this often
+    'max_buffer': 10000,         # Events kept while the database is unavailable; more are dropped and counted
+    'min_levels': {
+        'default': 'INFO',       # Routine "nothing to do" events are logged at DEBUG and skipped
+        # 'outgoing_send': 'WARNING',
+    }
+}
+
+# Audit log storage (core.audit_storage)
+AUDIT_LOG_PARTITIONS = {
+    'retention_days': 30,          # Days of raw audit events to keep
+    'rollup_retention_days': 365,  # Days of hourly rollups to keep
+    'precreate_days': 3            # PostgreSQL: day partitions created ahead of time
+}
 
 # Lock timeout settings (in seconds)
+# Also used as the lease length when a pipeline step claims rows (core.claims)
 LOCK_TIMEOUTS = {
+    'process': 60,          # 1 minute for message standardization
+    'distribute': 60,       # 1 minute for message distribution
     'queue': 300,           # 5 minutes for message queuing
     'service_polling': 60,  # 1 minute for service polling
     'message_delivery': 300 # 5 minutes for message delivery